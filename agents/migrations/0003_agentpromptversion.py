@@ -5,7 +5,7 @@ import django.db.models.deletion
 class Migration(migrations.Migration):
 
     dependencies = [
-        ('agents', '0002_agentprofile_agents__routing_341b6f_idx'),
+        ('agents', '0002_agentprofile_agents_app__routing_341b6f_idx'),
     ]
 
     operations = [
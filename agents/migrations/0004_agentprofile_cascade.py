@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_agentpromptversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentprofile',
+            name='cascade_model_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='agentprofile',
+            name='cascade_model_backend',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='agentprofile',
+            name='cascade_min_confidence',
+            field=models.FloatField(default=0.7),
+        ),
+    ]
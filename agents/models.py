@@ -15,6 +15,11 @@ class AgentProfile(BaseModel):
     model_name = models.CharField(max_length=255, default="qwen2.5-14b-instruct")
     temperature = models.FloatField(default=0.2)
     max_tokens = models.IntegerField(default=512)
+    # Cascade: try this small model first and escalate to model_name only when it calls a tool,
+    # is less confident than cascade_min_confidence or returns invalid JSON. Empty disables it.
+    cascade_model_name = models.CharField(max_length=255, blank=True)
+    cascade_model_backend = models.CharField(max_length=32, blank=True)
+    cascade_min_confidence = models.FloatField(default=0.7)
     is_active = models.BooleanField(default=True)
     metadata = models.JSONField(default=dict, blank=True)
 
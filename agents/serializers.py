@@ -43,6 +43,9 @@ class AgentProfileSerializer(serializers.ModelSerializer):
             "model_name",
             "temperature",
             "max_tokens",
+            "cascade_model_name",
+            "cascade_model_backend",
+            "cascade_min_confidence",
             "is_active",
             "metadata",
             "created_at",
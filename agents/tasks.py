@@ -0,0 +1,30 @@
+import logging
+
+import requests
+from celery import shared_task
+from django.conf import settings
+
+from agents.models import AgentProfile
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def preload_agent_models() -> int:
+    """Tell the LLM router which models active agents use (cascade models included) so it keeps them loaded."""
+    models = set()
+    agents = AgentProfile.objects.filter(is_active=True).values_list(
+        "model_backend", "model_name", "cascade_model_backend", "cascade_model_name"
+    )
+    for backend, model, cascade_backend, cascade_model in agents:
+        models.add((backend, model))
+        if cascade_model:
+            models.add((cascade_backend or backend, cascade_model))
+    payload = {"models": [{"backend": backend, "model": model} for backend, model in sorted(models)]}
+    try:
+        resp = requests.post(f"{settings.LLM_ROUTER_URL}/llm/models/preload", json=payload, timeout=10)
+        resp.raise_for_status()
+    except requests.RequestException as exc:
+        logger.warning("Could not push agent models to the LLM router: %s", exc)
+        return 0
+    return len(payload["models"])
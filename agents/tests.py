@@ -1,3 +1,29 @@
+from unittest.mock import patch
+
 from django.test import TestCase
 
-# Create your tests here.
+from agents.models import AgentProfile
+from agents.tasks import preload_agent_models
+
+
+class PreloadAgentModelsTests(TestCase):
+    def test_pushes_distinct_models_of_active_agents(self):
+        AgentProfile.objects.create(name="A", slug="a", system_prompt="-", model_backend="ollama", model_name="m")
+        AgentProfile.objects.create(name="B", slug="b", system_prompt="-", model_backend="ollama", model_name="m")
+        AgentProfile.objects.create(name="C", slug="c", system_prompt="-", model_backend="vllm", model_name="q")
+        AgentProfile.objects.create(name="D", slug="d", system_prompt="-", model_name="off", is_active=False)
+        with patch("agents.tasks.requests.post") as post:
+            self.assertEqual(preload_agent_models(), 2)
+        self.assertTrue(post.call_args.args[0].endswith("/llm/models/preload"))
+        self.assertEqual(
+            post.call_args.kwargs["json"],
+            {"models": [{"backend": "ollama", "model": "m"}, {"backend": "vllm", "model": "q"}]},
+        )
+
+    def test_cascade_models_are_kept_loaded_too(self):
+        AgentProfile.objects.create(
+            name="A", slug="a", system_prompt="-", model_backend="vllm", model_name="q", cascade_model_name="q-small"
+        )
+        with patch("agents.tasks.requests.post") as post:
+            self.assertEqual(preload_agent_models(), 2)
+        self.assertIn({"backend": "vllm", "model": "q-small"}, post.call_args.kwargs["json"]["models"])
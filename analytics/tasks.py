@@ -1,6 +1,7 @@
 import datetime
 
 from celery import shared_task
+from django.db.models import Avg
 
 from analytics.models import DailyKPI
 from conversations.models import Conversation, Message
@@ -55,9 +56,10 @@ def compute_daily_kpis(target_date: str = "") -> None:
     conversion = payments.filter(status="succeeded").count()
     payment_conversion_rate = (conversion / payments.count()) if payments.count() else 0
 
-    llm_logs = LLMInferenceLog.objects.filter(created_at__range=(start, end))
     avg_llm_latency_ms = (
-        sum([log.latency_ms or 0 for log in llm_logs]) / llm_logs.count() if llm_logs.count() else 0
+        LLMInferenceLog.objects.filter(created_at__range=(start, end), latency_ms__isnull=False)
+        .aggregate(avg=Avg("latency_ms"))["avg"]
+        or 0
     )
 
     DailyKPI.objects.update_or_create(
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from channels.replay import replay_events
+from channels.tasks import replay_webhook_events
+
+
+class Command(BaseCommand):
+    help = "Re-run failed (and, with --include-stalled, unprocessed) WebhookEvents in primary-key order without re-sending delivered replies."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument("--channel", default=None)
+        parser.add_argument("--min-age", type=float, default=60.0, help="Skip events younger than this many seconds.")
+        parser.add_argument("--after-id", type=int, default=0, help="Resume after this event id.")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument(
+            "--include-stalled",
+            action="store_true",
+            help="Also replay unprocessed events that never failed; only safe once the workers are drained.",
+        )
+        parser.add_argument("--async", dest="run_async", action="store_true", help="Queue the replay as a Celery task.")
+
+    def handle(self, *args, **options):
+        kwargs = {
+            "batch_size": options["batch_size"],
+            "concurrency": options["concurrency"],
+            "limit": options["limit"],
+            "channel": options["channel"],
+            "min_age": options["min_age"],
+            "after_id": options["after_id"],
+            "pause": options["pause"],
+            "include_stalled": options["include_stalled"],
+        }
+        if options["run_async"]:
+            result = replay_webhook_events.delay(**kwargs)
+            self.stdout.write(f"Queued replay task {result.id}")
+            return
+        report = replay_events(**kwargs)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Replayed {replayed} events ({failed} failed) in {seconds}s, "
+                "{events_per_second} events/s; last id {last_id}".format(**report)
+            )
+        )
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channels', '0002_alter_webhookevent_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='status',
+            field=models.CharField(choices=[('received', 'Received'), ('normalized', 'Normalized'), ('persisted', 'Persisted'), ('orchestrated', 'Orchestrated'), ('sent', 'Sent'), ('failed', 'Failed')], default='received', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+    ]
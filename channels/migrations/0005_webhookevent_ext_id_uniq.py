@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def collapse_duplicate_events(apps, schema_editor):
+    """Keep the oldest tenant-less event per provider event id so the unique constraint can be added.
+
+    Nothing holds a foreign key to WebhookEvent. If a later copy was already
+    processed, the kept row takes over its outcome so it is not handled twice.
+    """
+    WebhookEvent = apps.get_model('channels', 'WebhookEvent')
+    duplicates = (
+        WebhookEvent.objects.filter(tenant_id__isnull=True)
+        .exclude(external_event_id='')
+        .order_by()
+        .values('channel', 'external_event_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        events = list(
+            WebhookEvent.objects.filter(
+                tenant_id__isnull=True, channel=group['channel'], external_event_id=group['external_event_id']
+            ).order_by('received_at', 'id')
+        )
+        keep, extra = events[0], events[1:]
+        processed = next((event for event in extra if event.processed), None)
+        if not keep.processed and processed is not None:
+            keep.processed, keep.status, keep.last_error = True, processed.status, processed.last_error
+            keep.pending_conversations = 0
+            keep.save(update_fields=['processed', 'status', 'last_error', 'pending_conversations'])
+        WebhookEvent.objects.filter(id__in=[event.id for event in extra]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channels', '0004_webhookevent_pending_conversations'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_duplicate_events, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='webhookevent',
+            constraint=models.UniqueConstraint(condition=models.Q(('tenant_id__isnull', True), models.Q(('external_event_id', ''), _negated=True)), fields=('channel', 'external_event_id'), name='channels_webhookevent_ext_id_uniq'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 
-from core.constants import Channel
+from core.constants import Channel, WebhookEventStatus
 from core.models import BaseModel
 
 
@@ -9,7 +11,13 @@ class WebhookEvent(BaseModel):
     external_event_id = models.CharField(max_length=255, blank=True)
     payload = models.JSONField(default=dict, blank=True)
     processed = models.BooleanField(default=False)
-    received_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(
+        max_length=32, choices=WebhookEventStatus.choices, default=WebhookEventStatus.RECEIVED
+    )
+    last_error = models.TextField(blank=True)
+    pending_conversations = models.IntegerField(default=0)
+    # When the webhook reached us (the edge passes its own receive time); debouncing measures from it.
+    received_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         indexes = [
@@ -17,6 +25,14 @@ class WebhookEvent(BaseModel):
             models.Index(fields=["processed"]),
         ]
         unique_together = (("tenant_id", "channel", "external_event_id"),)
+        # unique_together does not cover tenant-less rows (NULLs are distinct).
+        constraints = [
+            models.UniqueConstraint(
+                fields=["channel", "external_event_id"],
+                condition=Q(tenant_id__isnull=True) & ~Q(external_event_id=""),
+                name="channels_webhookevent_ext_id_uniq",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Webhook {self.channel} {self.external_event_id}"
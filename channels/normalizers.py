@@ -1,4 +1,5 @@
-from typing import Any, Dict, List
+import datetime
+from typing import Any, Dict, List, Optional
 
 from core.constants import Channel
 
@@ -30,12 +31,21 @@ def _extract_attachments(msg: Dict[str, Any]) -> List[Dict[str, Any]]:
     return attachments
 
 
-def normalize_whatsapp_payload(payload: Dict[str, Any], event_id: str = "") -> List[Dict[str, Any]]:
-    """Normalize WhatsApp Cloud API webhook payload into internal message dicts."""
+def normalize_whatsapp_payload(
+    payload: Dict[str, Any], event_id: str = "", received_at: Optional[datetime.datetime] = None
+) -> List[Dict[str, Any]]:
+    """Normalize WhatsApp Cloud API webhook payload into internal message dicts.
+
+    ``received_at`` (when the webhook reached us) is kept on every message so
+    debouncing measures arrival, not how long the message waited to be stored.
+    """
+    arrived = received_at.isoformat() if received_at else None
     normalized_messages: List[Dict[str, Any]] = []
+    has_statuses = False
     for entry in payload.get("entry", []):
         for change in entry.get("changes", []):
             value = change.get("value", {})
+            has_statuses = has_statuses or bool(value.get("statuses"))
             contacts = value.get("contacts", [])
             sender_id = contacts[0].get("wa_id") if contacts else None
             for msg in value.get("messages", []) or []:
@@ -55,9 +65,11 @@ def normalize_whatsapp_payload(payload: Dict[str, Any], event_id: str = "") -> L
                         "attachments": attachments,
                         "raw_payload": msg,
                         "external_event_id": event_id,
+                        "received_at": arrived,
                     }
                 )
-    if not normalized_messages and payload:
+    # Delivery/read receipts are handled by normalize_whatsapp_statuses, not as messages.
+    if not normalized_messages and payload and not has_statuses:
         normalized_messages.append(
             {
                 "channel": Channel.WHATSAPP,
@@ -67,6 +79,43 @@ def normalize_whatsapp_payload(payload: Dict[str, Any], event_id: str = "") -> L
                 "attachments": [],
                 "raw_payload": payload,
                 "external_event_id": event_id,
+                "received_at": arrived,
             }
         )
     return normalized_messages
+
+
+def whatsapp_sender(payload: Dict[str, Any]) -> str:
+    """The first sender (or status recipient) of a raw payload, read without normalizing it."""
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            contacts = value.get("contacts", [])
+            for msg in value.get("messages", []) or []:
+                sender = msg.get("from") or (contacts[0].get("wa_id") if contacts else None)
+                if sender:
+                    return sender
+            for status in value.get("statuses", []) or []:
+                if status.get("recipient_id"):
+                    return status["recipient_id"]
+    return "unknown"
+
+
+def normalize_whatsapp_statuses(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Extract sent/delivered/read/failed callbacks for outbound messages."""
+    statuses: List[Dict[str, Any]] = []
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            for status in change.get("value", {}).get("statuses", []) or []:
+                if not status.get("id") or not status.get("status"):
+                    continue
+                statuses.append(
+                    {
+                        "external_message_id": status["id"],
+                        "status": status["status"],
+                        "timestamp": status.get("timestamp"),
+                        "recipient_id": status.get("recipient_id"),
+                        "errors": status.get("errors") or [],
+                    }
+                )
+    return statuses
@@ -0,0 +1,210 @@
+"""Coalesced order webhook writes for Shopify/Magento.
+
+Stores send several order webhooks per order within seconds (payment,
+fulfillment, tags). They are buffered in Redis per (source, external_order_id)
+for ``ORDER_WEBHOOK_COALESCE_SECONDS`` and a single flush applies only the
+newest version of each order by ``updated_at``, with one upsert per batch.
+The WebhookEvents behind an order are only marked processed once the batch
+holding its newest version has been written.
+"""
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from channels.models import WebhookEvent
+from commerce.models import Order
+from core.constants import Channel, WebhookEventStatus
+from core.metrics import ORDER_WEBHOOKS
+from core.redis import get_redis
+from core.upsert import upsert
+from customers.services import resolve_customer
+
+logger = logging.getLogger(__name__)
+
+ORDER_UNIQUE = "commerce_order_source_ext_uniq"
+PENDING_KEY = "commerce:orders:pending"
+FLUSH_SCHEDULED_KEY = "commerce:orders:flush_scheduled"
+
+
+def _updated_ts(value: Any) -> float:
+    parsed = parse_datetime(value) if isinstance(value, str) and value else None
+    return parsed.timestamp() if parsed else 0.0
+
+
+def _field(order: Dict[str, Any]) -> str:
+    return f"{order['source']}:{order['external_order_id']}:{_updated_ts(order['updated_at'])}"
+
+
+def _newest(orders: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+    newest: Dict[tuple, Dict[str, Any]] = {}
+    for order in orders:
+        key = (order["source"], order["external_order_id"])
+        current = newest.get(key)
+        # Later arrivals win ties, matching the previous last-write-wins behaviour.
+        if current is None or _updated_ts(order["updated_at"]) >= _updated_ts(current["updated_at"]):
+            newest[key] = order
+    return newest
+
+
+def apply_orders(orders: List[Dict[str, Any]]) -> int:
+    """Write the newest version of each order in one upsert; returns the number of orders written.
+
+    Versions that are not newer than the stored ``details.updated_at`` are skipped,
+    so out-of-order deliveries across flush windows cannot roll an order back.
+    """
+    without_id = [order for order in orders if not order["external_order_id"]]
+    for order in without_id:
+        resolve_customer(**order["customer"])
+    newest = _newest([order for order in orders if order["external_order_id"]])
+    if not newest:
+        return 0
+
+    stored = {}
+    for source in {source for source, _ in newest}:
+        ids = [external_id for src, external_id in newest if src == source]
+        for external_id, details in Order.objects.filter(
+            source=source, external_order_id__in=ids, tenant_id__isnull=True
+        ).values_list("external_order_id", "details"):
+            stored[(source, external_id)] = _updated_ts((details or {}).get("updated_at"))
+    fresh = {
+        key: order
+        for key, order in newest.items()
+        if not (stored.get(key) and _updated_ts(order["updated_at"]) and stored[key] >= _updated_ts(order["updated_at"]))
+    }
+    ORDER_WEBHOOKS.labels(result="superseded").inc(len(orders) - len(without_id) - len(fresh))
+    if not fresh:
+        return 0
+
+    customer_ids = {}
+    for order in fresh.values():
+        identity = (order["customer"]["channel"], order["customer"]["external_id"])
+        if identity not in customer_ids:
+            customer_ids[identity] = resolve_customer(**order["customer"]).id
+    upsert(
+        Order,
+        [
+            {
+                "source": order["source"],
+                "external_order_id": order["external_order_id"],
+                "customer_id": customer_ids[(order["customer"]["channel"], order["customer"]["external_id"])],
+                "status": order["status"],
+                "total": order["total"],
+                "currency": order["currency"],
+                "details": order["details"],
+            }
+            for order in fresh.values()
+        ],
+        ORDER_UNIQUE,
+        update_fields=["customer", "status", "total", "currency", "details"],
+    )
+    ORDER_WEBHOOKS.labels(result="applied").inc(len(fresh))
+    return len(fresh)
+
+
+def _mark_processed(orders: List[Dict[str, Any]]) -> None:
+    """Mark the WebhookEvents behind written order versions as processed."""
+    event_ids = {event_id for order in orders for event_id in order.get("webhook_events", [])}
+    if event_ids:
+        WebhookEvent.objects.filter(pk__in=event_ids).update(processed=True, status=WebhookEventStatus.SENT)
+
+
+def _apply_inline(order: Dict[str, Any]) -> None:
+    apply_orders([order])
+    _mark_processed([order])
+
+
+def buffer_order(order: Dict[str, Any], event_id: Optional[int] = None) -> bool:
+    """Queue an order version for the next flush; True if buffered, False if applied inline.
+
+    Without Redis (or with coalescing disabled) the order is written immediately.
+    ``event_id`` is the stored WebhookEvent; it is marked processed once the order is written.
+    """
+    from channels.tasks import flush_order_webhooks
+
+    if event_id:
+        order = {**order, "webhook_events": [event_id]}
+    window = settings.ORDER_WEBHOOK_COALESCE_SECONDS
+    client = get_redis()
+    if client is None or window <= 0 or not order["external_order_id"]:
+        _apply_inline(order)
+        return False
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.hset(PENDING_KEY, _field(order), json.dumps(order, default=str))
+        pipe.set(FLUSH_SCHEDULED_KEY, 1, nx=True, ex=max(int(window * 10), 60))
+        _, schedule = pipe.execute()
+    except Exception as exc:  # noqa: broad-except
+        logger.warning("Order buffer unavailable (%s); applying order webhook inline.", exc)
+        _apply_inline(order)
+        return False
+    ORDER_WEBHOOKS.labels(result="buffered").inc()
+    if schedule:
+        flush_order_webhooks.apply_async(countdown=window)
+    return True
+
+
+def _requeue(client, orders: List[Dict[str, Any]]) -> None:
+    from channels.tasks import flush_order_webhooks
+
+    pipe = client.pipeline(transaction=False)
+    for order in orders:
+        pipe.hset(PENDING_KEY, _field(order), json.dumps(order, default=str))
+    pipe.set(FLUSH_SCHEDULED_KEY, 1, nx=True, ex=max(int(settings.ORDER_WEBHOOK_COALESCE_SECONDS * 10), 60))
+    if pipe.execute()[-1]:
+        flush_order_webhooks.apply_async(countdown=settings.ORDER_WEBHOOK_COALESCE_SECONDS)
+
+
+def flush_orders() -> int:
+    """Atomically take every buffered version and apply the newest per order in batches."""
+    client = get_redis()
+    if client is None:
+        return 0
+    pipe = client.pipeline(transaction=True)
+    pipe.hgetall(PENDING_KEY)
+    pipe.delete(PENDING_KEY)
+    # Arrivals after this point schedule the next flush.
+    pipe.delete(FLUSH_SCHEDULED_KEY)
+    pending, _, _ = pipe.execute()
+    orders = [json.loads(value) for value in pending.values()]
+    written = 0
+    batch_size = settings.ORDER_WEBHOOK_FLUSH_BATCH
+    # Events of superseded versions are done once the newest version of their order is written.
+    events: Dict[tuple, Set[int]] = defaultdict(set)
+    for order in orders:
+        events[(order["source"], order["external_order_id"])].update(order.get("webhook_events", []))
+    newest = [
+        {**order, "webhook_events": sorted(events[key])} for key, order in _newest(orders).items()
+    ]
+    ORDER_WEBHOOKS.labels(result="superseded").inc(len(orders) - len(newest))
+    for start in range(0, len(newest), batch_size):
+        batch = newest[start : start + batch_size]
+        try:
+            written += apply_orders(batch)
+        except Exception:
+            # Put the unapplied versions back so the next flush retries them.
+            _requeue(client, newest[start:])
+            raise
+        _mark_processed(batch)
+    logger.info("Flushed %s buffered order webhooks into %s order writes", len(orders), written)
+    return written
+
+
+def accept_order_event(event: WebhookEvent) -> str:
+    """Buffer the order carried by a stored Shopify/Magento event; returns ``queued``, ``accepted`` or ``failed``.
+
+    A failure is recorded on the event and left for the replay engine.
+    """
+    from channels.magento import parse_order as parse_magento_order
+    from channels.shopify import parse_order as parse_shopify_order
+
+    parse = parse_shopify_order if event.channel == Channel.SHOPIFY else parse_magento_order
+    try:
+        return "queued" if buffer_order(parse(event.payload), event.id) else "accepted"
+    except Exception as exc:  # noqa: broad-except - leave the event for the replay engine
+        logger.exception("%s webhook %s failed", event.channel, event.external_event_id)
+        WebhookEvent.objects.filter(pk=event.id).update(status=WebhookEventStatus.FAILED, last_error=str(exc)[:2000])
+        return "failed"
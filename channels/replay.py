@@ -0,0 +1,167 @@
+"""Re-run stored WebhookEvents that never finished, e.g. after an LLM or database outage."""
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from channels.magento import upsert_customer_and_order as magento_upsert
+from channels.models import WebhookEvent
+from channels.normalizers import normalize_whatsapp_payload, normalize_whatsapp_statuses
+from channels.shopify import upsert_customer_and_order as shopify_upsert
+from conversations.models import Message
+from conversations.services import (
+    apply_message_statuses,
+    deliver_reply,
+    ingest_normalized_messages,
+    reply_to_inbound,
+    should_reply,
+)
+from core.constants import Channel, WebhookEventStatus
+from core.dedup import release
+from core.metrics import REPLAYED_EVENTS
+
+logger = logging.getLogger(__name__)
+
+
+def replayable_events(
+    after_id: int = 0,
+    batch_size: int = 100,
+    channel: Optional[str] = None,
+    min_age: float = 60.0,
+    include_stalled: bool = False,
+) -> Iterator[List[int]]:
+    """Yield batches of ids of failed events in primary-key order.
+
+    An unprocessed event that has not failed may still be queued behind a
+    lagging worker, so it is only picked up with ``include_stalled`` (for use
+    once the workers are known to be drained or dead).
+    Keyset pagination (``pk > last seen``) keeps every batch an index range scan.
+    Events younger than ``min_age`` seconds are left to the live pipeline.
+    """
+    selected = Q(status=WebhookEventStatus.FAILED)
+    if include_stalled:
+        selected |= Q(processed=False)
+    events = WebhookEvent.objects.filter(selected)
+    if channel:
+        events = events.filter(channel=channel)
+    if min_age:
+        events = events.filter(received_at__lte=timezone.now() - datetime.timedelta(seconds=min_age))
+    while True:
+        batch = list(events.filter(pk__gt=after_id).order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        after_id = batch[-1]
+
+
+def _was_sent(outbound: Message) -> bool:
+    return bool(outbound.delivery_status or (outbound.raw_payload.get("send_result") or {}).get("sent"))
+
+
+def _finish_turn(inbound: Message) -> bool:
+    """Reply to ``inbound`` unless a reply already went out; returns True if something was sent."""
+    outbound = (
+        Message.objects.filter(conversation_id=inbound.conversation_id, direction="outbound", id__gt=inbound.id)
+        .select_related("conversation")
+        .order_by("id")
+        .first()
+    )
+    if outbound is None:
+        outbound = reply_to_inbound(inbound)
+    elif _was_sent(outbound):
+        return False
+    if outbound is None:
+        return False
+    deliver_reply(outbound)
+    return True
+
+
+def _replay_whatsapp(event: WebhookEvent) -> int:
+    apply_message_statuses(normalize_whatsapp_statuses(event.payload))
+    normalized = normalize_whatsapp_payload(event.payload, event_id=event.external_event_id, received_at=event.received_at)
+    external_ids = [n["external_message_id"] for n in normalized if n.get("external_message_id")]
+    stored = set(Message.objects.filter(external_message_id__in=external_ids).values_list("external_message_id", flat=True))
+    # The first attempt may have claimed ids in Redis and died before storing them.
+    release(f"message:{Channel.WHATSAPP}", [i for i in external_ids if i not in stored])
+    ingest_normalized_messages(normalized)
+    inbound = Message.objects.filter(
+        direction="inbound", external_message_id__in=external_ids
+    ).select_related("conversation").order_by("id")
+    return sum(_finish_turn(message) for message in inbound if should_reply(message.raw_payload))
+
+
+def replay_event(event_id: int) -> bool:
+    """Re-run normalization, ingest and any missing replies for one event; True on success."""
+    event = WebhookEvent.objects.get(pk=event_id)
+    try:
+        if event.channel == Channel.WHATSAPP:
+            _replay_whatsapp(event)
+        elif event.channel == Channel.SHOPIFY:
+            shopify_upsert(event.payload)
+        elif event.channel == Channel.MAGENTO:
+            magento_upsert(event.payload)
+    except Exception as exc:  # noqa: broad-except - keep draining, the event stays replayable
+        logger.exception("Replay of webhook event %s failed", event_id)
+        WebhookEvent.objects.filter(pk=event_id).update(status=WebhookEventStatus.FAILED, last_error=str(exc)[:2000])
+        REPLAYED_EVENTS.labels(channel=event.channel, result="failed").inc()
+        return False
+    WebhookEvent.objects.filter(pk=event_id).update(
+        processed=True, status=WebhookEventStatus.SENT, last_error="", pending_conversations=0
+    )
+    REPLAYED_EVENTS.labels(channel=event.channel, result="replayed").inc()
+    return True
+
+
+def _replay_in_thread(event_id: int) -> bool:
+    try:
+        return replay_event(event_id)
+    finally:
+        close_old_connections()
+
+
+def replay_events(
+    batch_size: int = 100,
+    concurrency: int = 4,
+    limit: Optional[int] = None,
+    channel: Optional[str] = None,
+    min_age: float = 60.0,
+    after_id: int = 0,
+    pause: float = 0.0,
+    include_stalled: bool = False,
+) -> Dict[str, Any]:
+    """Drain replayable events batch by batch with at most ``concurrency`` in flight.
+
+    ``pause`` seconds are slept between batches to leave headroom for live traffic.
+    Returns a throughput report; ``last_id`` can be passed back as ``after_id``
+    to resume an interrupted run.
+    """
+    started = time.monotonic()
+    report = {"replayed": 0, "failed": 0, "last_id": after_id}
+    executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+    try:
+        for batch in replayable_events(after_id, batch_size, channel, min_age, include_stalled):
+            if limit is not None:
+                batch = batch[: max(limit - report["replayed"] - report["failed"], 0)]
+            results = executor.map(_replay_in_thread, batch) if executor else map(replay_event, batch)
+            for ok in results:
+                report["replayed" if ok else "failed"] += 1
+            if batch:
+                report["last_id"] = batch[-1]
+            total = report["replayed"] + report["failed"]
+            logger.info("Replayed %s events (%s failed) up to id %s", total, report["failed"], report["last_id"])
+            if limit is not None and total >= limit:
+                break
+            if pause:
+                time.sleep(pause)
+    finally:
+        if executor:
+            executor.shutdown()
+    report["seconds"] = round(time.monotonic() - started, 3)
+    total = report["replayed"] + report["failed"]
+    report["events_per_second"] = round(total / report["seconds"], 2) if report["seconds"] else float(total)
+    return report
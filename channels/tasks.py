@@ -1,3 +1,5 @@
+import datetime
+import json
 import logging
 import os
 from pathlib import Path
@@ -6,12 +8,16 @@ from typing import Optional
 import requests
 from celery import shared_task
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 
 from channels.tts import synthesize_tts
 from core.metrics import ASR_REQUESTS, ASR_LATENCY, TTS_REQUESTS, TTS_LATENCY
 from channels.whatsapp_media import upload_media
 from channels.asr import transcribe_audio
+from channels.models import WebhookEvent
 from conversations.models import Message
+from core.constants import Channel
 
 logger = logging.getLogger(__name__)
 
@@ -98,3 +104,51 @@ def generate_tts(text: str, message_id: int) -> Optional[str]:
     msg.save(update_fields=["attachments"])
     logger.info("Attached TTS audio to message %s at %s", message_id, audio_path)
     return audio_path
+
+
+@shared_task
+def replay_webhook_events(**options) -> dict:
+    """Drain unprocessed/failed WebhookEvents; see channels.replay.replay_events for options."""
+    from channels.replay import replay_events
+
+    report = replay_events(**options)
+    logger.info("Webhook replay finished: %s", report)
+    return report
+
+
+@shared_task
+def accept_webhook(channel: str, body: str, event_id: str, received_at: Optional[float] = None) -> Optional[int]:
+    """Store a raw webhook body handed off by the ASGI edge; WhatsApp events continue on their sender's shard.
+
+    The edge already verified the signature and claimed ``event_id``; the unique
+    constraint on WebhookEvent catches anything Redis let through twice.
+    ``received_at`` is the edge's receive time (epoch seconds), kept as the event's arrival time.
+    """
+    from channels.orders import accept_order_event
+    from conversations.tasks import enqueue_webhook_pipeline
+
+    payload = json.loads(body)
+    try:
+        with transaction.atomic():
+            event = WebhookEvent.objects.create(
+                channel=channel,
+                payload=payload,
+                external_event_id=event_id,
+                received_at=datetime.datetime.fromtimestamp(received_at, tz=datetime.timezone.utc) if received_at else timezone.now(),
+            )
+    except IntegrityError:
+        logger.info("Duplicate %s webhook %s ignored.", channel, event_id)
+        return None
+    if channel == Channel.WHATSAPP:
+        enqueue_webhook_pipeline(event.id, payload)
+    elif channel in (Channel.SHOPIFY, Channel.MAGENTO):
+        accept_order_event(event)
+    return event.id
+
+
+@shared_task
+def flush_order_webhooks() -> int:
+    """Apply the newest buffered version of each order; scheduled by channels.orders.buffer_order."""
+    from channels.orders import flush_orders
+
+    return flush_orders()
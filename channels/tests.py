@@ -1,14 +1,22 @@
+import datetime
 import json
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
 from channels.models import WebhookEvent
-from conversations.models import Message
-from core.constants import Channel
+from channels.orders import accept_order_event, buffer_order, flush_orders
+from channels.shopify import parse_order as parse_shopify_order
+from commerce.models import Order
+from channels.replay import replay_events
+from conversations.models import Conversation, Message
+from customers.models import Customer
+from core.celery import celery_app
+from core.constants import Channel, WebhookEventStatus
+from core.upsert import upsert
 
 
 class WhatsAppWebhookTests(TestCase):
@@ -64,6 +72,200 @@ class WhatsAppWebhookTests(TestCase):
         self.assertEqual(Message.objects.count(), 1)
 
 
+@override_settings(WHATSAPP_ASYNC_WEBHOOKS=True)
+class WhatsAppAsyncPipelineTests(TestCase):
+    def setUp(self):
+        self.url = reverse("whatsapp-webhook")
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+    @patch("conversations.services.generate_tts")
+    @patch("conversations.services.send_whatsapp_text", return_value={"sent": True})
+    @patch("conversations.services._call_llm_router", return_value="hello back")
+    @patch("channels.views.verify_meta_signature", return_value=True)
+    def test_webhook_queues_pipeline_and_tracks_stages(self, _sig, _llm, send, _tts):
+        payload = {
+            "entry": [
+                {
+                    "id": "evt-1",
+                    "changes": [
+                        {
+                            "value": {
+                                "contacts": [{"wa_id": "123"}],
+                                "messages": [
+                                    {"id": "mid-async", "from": "123", "type": "text", "text": {"body": "hi"}}
+                                ],
+                            }
+                        }
+                    ],
+                }
+            ]
+        }
+        resp = self.client.post(self.url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.json()["status"], "queued")
+        event = WebhookEvent.objects.get()
+        self.assertTrue(event.processed)
+        self.assertEqual(event.status, WebhookEventStatus.SENT)
+        self.assertEqual(Message.objects.filter(direction="inbound").count(), 1)
+        self.assertEqual(Message.objects.filter(direction="outbound").count(), 1)
+        send.assert_called_once_with(to="123", body="hello back")
+
+
+class WebhookReplayTests(TestCase):
+    def _event(self, mid):
+        payload = {
+            "entry": [
+                {
+                    "changes": [
+                        {
+                            "value": {
+                                "contacts": [{"wa_id": "123"}],
+                                "messages": [{"id": mid, "from": "123", "type": "text", "text": {"body": "hi"}}],
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+        return WebhookEvent.objects.create(channel=Channel.WHATSAPP, external_event_id=mid, payload=payload)
+
+    @patch("conversations.services.generate_tts")
+    @patch("conversations.services.send_whatsapp_text")
+    @patch("conversations.services._call_llm_router", return_value="hello back")
+    def test_replay_ingests_and_replies_once(self, _llm, send, _tts):
+        send.side_effect = lambda to, body: {"sent": True, "response": {"messages": [{"id": f"wamid.{send.call_count}"}]}}
+        first, second = self._event("mid-r1"), self._event("mid-r2")
+        WebhookEvent.objects.filter(pk=second.pk).update(status=WebhookEventStatus.FAILED, processed=True)
+        report = replay_events(batch_size=1, concurrency=1, min_age=0, include_stalled=True)
+        self.assertEqual(report["replayed"], 2)
+        self.assertEqual(report["last_id"], second.pk)
+        self.assertFalse(WebhookEvent.objects.filter(processed=False).exists())
+        self.assertEqual(Message.objects.filter(direction="inbound").count(), 2)
+        self.assertEqual(send.call_count, 2)
+
+        # A second pass over the same events must not re-send delivered replies.
+        WebhookEvent.objects.update(processed=False)
+        replay_events(concurrency=1, min_age=0, include_stalled=True)
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(Message.objects.filter(direction="outbound").count(), 2)
+
+    def test_recent_events_are_left_to_the_live_pipeline(self):
+        self._event("mid-fresh")
+        self.assertEqual(replay_events(concurrency=1, min_age=60, include_stalled=True)["replayed"], 0)
+
+    @patch("channels.replay.release")
+    def test_unfailed_events_in_a_lagging_pipeline_are_not_replayed(self, release):
+        event = self._event("mid-lagging")
+        WebhookEvent.objects.filter(pk=event.pk).update(received_at=event.received_at - datetime.timedelta(minutes=10))
+        self.assertEqual(replay_events(concurrency=1, min_age=60)["replayed"], 0)
+        release.assert_not_called()
+        WebhookEvent.objects.filter(pk=event.pk).update(status=WebhookEventStatus.FAILED)
+        with patch("channels.replay.replay_event", return_value=True) as replay:
+            replay_events(concurrency=1, min_age=60)
+        replay.assert_called_once_with(event.pk)
+
+
+class WebhookEdgeTests(TestCase):
+    def setUp(self):
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+    def test_rejects_bad_signature_without_touching_the_database(self):
+        from webhook_edge.main import accept
+
+        with self.assertNumQueries(0):
+            status_code, _ = accept(Channel.WHATSAPP, b"{}", {"X-Hub-Signature-256": "sha256=bad"}, "127.0.0.1")
+        self.assertEqual(status_code, 401)
+
+    @patch("conversations.services.generate_tts")
+    @patch("conversations.services.send_whatsapp_text", return_value={"sent": True})
+    @patch("conversations.services._call_llm_router", return_value="hello back")
+    @patch("webhook_edge.main.verify_meta_signature", return_value=True)
+    def test_queues_raw_body_for_workers(self, _sig, _llm, send, _tts):
+        from webhook_edge.main import accept
+
+        body = json.dumps(
+            {
+                "entry": [
+                    {
+                        "changes": [
+                            {
+                                "value": {
+                                    "contacts": [{"wa_id": "123"}],
+                                    "messages": [{"id": "mid-edge", "from": "123", "type": "text", "text": {"body": "hi"}}],
+                                }
+                            }
+                        ]
+                    }
+                ]
+            }
+        ).encode()
+        self.assertEqual(accept(Channel.WHATSAPP, body, {}, "127.0.0.1"), (202, {"status": "queued"}))
+        accept(Channel.WHATSAPP, body, {}, "127.0.0.1")
+        event = WebhookEvent.objects.get()
+        self.assertTrue(event.processed)
+        self.assertEqual(Message.objects.filter(direction="inbound").count(), 1)
+        send.assert_called_once_with(to="123", body="hello back")
+
+    @patch("webhook_edge.main.validate_hmac", return_value=True)
+    def test_shopify_orders_are_stored_as_events(self, _hmac):
+        from webhook_edge.main import accept
+
+        body = json.dumps({"id": 9, "financial_status": "paid", "customer": {"id": 1}}).encode()
+        accept(Channel.SHOPIFY, body, {"X-Shopify-Webhook-Id": "wh-1"}, "127.0.0.1")
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.external_event_id, event.status), ("wh-1", WebhookEventStatus.SENT))
+
+
+class WhatsAppStatusCallbackTests(TestCase):
+    def setUp(self):
+        self.url = reverse("whatsapp-webhook")
+        customer = Customer.objects.create()
+        conversation = Conversation.objects.create(customer=customer, channel=Channel.WHATSAPP)
+        self.outbound = Message.objects.create(
+            conversation=conversation, direction="outbound", text="hello", external_message_id="wamid.out-1"
+        )
+
+    def _status_payload(self, *statuses):
+        return {
+            "entry": [
+                {
+                    "changes": [
+                        {
+                            "value": {
+                                "statuses": [
+                                    {"id": "wamid.out-1", "status": s, "timestamp": "1700000000", "recipient_id": "123"}
+                                    for s in statuses
+                                ]
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+
+    @patch("channels.views.verify_meta_signature", return_value=True)
+    def test_status_callback_updates_outbound_without_new_rows(self, _sig):
+        resp = self.client.post(
+            self.url, data=json.dumps(self._status_payload("delivered", "read")), content_type="application/json"
+        )
+        self.assertEqual(resp.status_code, 202)
+        self.outbound.refresh_from_db()
+        self.assertEqual(self.outbound.delivery_status, "read")
+        self.assertEqual(Message.objects.count(), 1)
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    @patch("channels.views.verify_meta_signature", return_value=True)
+    def test_late_status_does_not_regress(self, _sig):
+        self.outbound.delivery_status = "read"
+        self.outbound.save()
+        self.client.post(self.url, data=json.dumps(self._status_payload("delivered")), content_type="application/json")
+        self.outbound.refresh_from_db()
+        self.assertEqual(self.outbound.delivery_status, "read")
+
+
 class OutboundSendTests(TestCase):
     def setUp(self):
         self.url = reverse("whatsapp-send")
@@ -78,3 +280,97 @@ class OutboundSendTests(TestCase):
         resp2 = self.client.post(self.url, {"to": "123", "body": "hello"})
         self.assertEqual(resp2.status_code, 200)
         self.assertEqual(Message.objects.filter(direction="outbound").count(), 1)
+
+
+class _FakeHashPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.ops.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.ops]
+
+
+class _FakeHashRedis:
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=False):
+        return _FakeHashPipeline(self)
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+
+@override_settings(ORDER_WEBHOOK_COALESCE_SECONDS=5)
+class OrderWebhookCoalescingTests(TestCase):
+    def _order(self, status, updated_at):
+        return parse_shopify_order(
+            {"id": 77, "financial_status": status, "updated_at": updated_at, "customer": {"id": 5}}
+        )
+
+    @patch("channels.tasks.flush_order_webhooks.apply_async")
+    def test_storm_is_applied_once_with_newest_version(self, schedule):
+        fake = _FakeHashRedis()
+        with patch("channels.orders.get_redis", return_value=fake):
+            self.assertTrue(buffer_order(self._order("pending", "2024-05-01T10:00:00+00:00")))
+            buffer_order(self._order("fulfilled", "2024-05-01T10:00:09+00:00"))
+            buffer_order(self._order("paid", "2024-05-01T10:00:05+00:00"))
+            self.assertEqual(Order.objects.count(), 0)
+            schedule.assert_called_once_with(countdown=5)
+            with patch("channels.orders.upsert", wraps=upsert) as upsert_call:
+                self.assertEqual(flush_orders(), 1)
+            upsert_call.assert_called_once()
+        self.assertEqual(Order.objects.get().status, "fulfilled")
+
+    @patch("channels.tasks.flush_order_webhooks.apply_async")
+    def test_events_are_processed_only_once_their_order_is_written(self, _schedule):
+        events = [
+            WebhookEvent.objects.create(channel=Channel.SHOPIFY, external_event_id=f"wh-{n}", payload=payload)
+            for n, payload in enumerate(
+                {"id": 77, "financial_status": status, "updated_at": updated_at, "customer": {"id": 5}}
+                for status, updated_at in (("pending", "2024-05-01T10:00:00+00:00"), ("paid", "2024-05-01T10:00:05+00:00"))
+            )
+        ]
+        fake = _FakeHashRedis()
+        with patch("channels.orders.get_redis", return_value=fake):
+            self.assertEqual([accept_order_event(event) for event in events], ["queued", "queued"])
+            self.assertFalse(WebhookEvent.objects.filter(processed=True).exists())
+            flush_orders()
+        self.assertEqual(WebhookEvent.objects.filter(processed=True, status=WebhookEventStatus.SENT).count(), 2)
+
+    @patch("channels.views.validate_hmac", return_value=True)
+    def test_drf_views_store_order_events(self, _hmac):
+        body = {"id": 78, "financial_status": "paid", "customer": {"id": 5}}
+        with patch("channels.orders.get_redis", return_value=None):
+            response = self.client.post(
+                reverse("shopify-webhook"), body, content_type="application/json", HTTP_X_SHOPIFY_WEBHOOK_ID="wh-78"
+            )
+            duplicate = self.client.post(
+                reverse("shopify-webhook"), body, content_type="application/json", HTTP_X_SHOPIFY_WEBHOOK_ID="wh-78"
+            )
+        self.assertEqual((response.json()["status"], duplicate.json()["status"]), ("accepted", "duplicate_skipped"))
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.channel, event.external_event_id, event.processed), (Channel.SHOPIFY, "wh-78", True))
+        self.assertEqual(Order.objects.get().external_order_id, "78")
+
+    def test_older_version_does_not_roll_back_stored_order(self):
+        with patch("channels.orders.get_redis", return_value=None):
+            self.assertFalse(buffer_order(self._order("refunded", "2024-05-02T10:00:00+00:00")))
+            buffer_order(self._order("paid", "2024-05-01T10:00:00+00:00"))
+        self.assertEqual(Order.objects.get().status, "refunded")
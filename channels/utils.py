@@ -1,5 +1,6 @@
 import hmac
 import hashlib
+import os
 from typing import Optional
 
 from django.conf import settings
@@ -25,9 +26,27 @@ def verify_meta_signature(body: bytes, signature_header: Optional[str]) -> bool:
     return hmac.compare_digest(expected, provided_sig)
 
 
-def is_ip_allowed(request) -> bool:
+def ip_in_allowlist(ip: str) -> bool:
     allowlist = settings.WEBHOOK_IP_ALLOWLIST
     if not allowlist:
         return True
-    ip = request.META.get("REMOTE_ADDR", "")
     return ip in allowlist
+
+
+def is_ip_allowed(request) -> bool:
+    return ip_in_allowlist(request.META.get("REMOTE_ADDR", ""))
+
+
+def magento_secret_ok(provided: Optional[str]) -> bool:
+    """Magento sends the shared secret verbatim; no secret configured means no check."""
+    shared_secret = os.environ.get("MAGENTO_WEBHOOK_SECRET")
+    return not shared_secret or provided == shared_secret
+
+
+def webhook_event_id(payload: dict, body: bytes) -> str:
+    """Stable id for dedup: the payload id when present, else a hash of the raw body.
+
+    Provider retries resend the identical body; WhatsApp entry ids are the
+    (constant) business account id, so they cannot be used.
+    """
+    return str(payload.get("id") or hashlib.sha256(body).hexdigest())
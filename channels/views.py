@@ -1,6 +1,8 @@
 import os
 from html import escape
 
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.http import HttpResponse
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -8,16 +10,37 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from channels.models import WebhookEvent
-from channels.normalizers import normalize_whatsapp_payload
+from channels.normalizers import normalize_whatsapp_payload, normalize_whatsapp_statuses
 from channels.senders import send_whatsapp_text
-from channels.shopify import upsert_customer_and_order as shopify_upsert, validate_hmac
-from channels.magento import upsert_customer_and_order as magento_upsert
-from channels.utils import verify_meta_signature, is_ip_allowed
+from channels.orders import accept_order_event
+from channels.shopify import validate_hmac
+from channels.utils import is_ip_allowed, magento_secret_ok, verify_meta_signature, webhook_event_id
 from core.auth import APIKeyPermission
-from core.constants import Channel
+from core.dedup import claim, release
+from core.constants import Channel, WebhookEventStatus
 from core.metrics import WEBHOOK_REQUESTS
 from conversations.models import Conversation, Message
-from conversations.services import handle_normalized_message, send_outbound_message
+from conversations.services import (
+    apply_message_statuses,
+    handle_normalized_messages,
+    record_send_result,
+    send_outbound_message,
+)
+from conversations.tasks import enqueue_webhook_pipeline
+
+
+def _store_webhook_event(channel: str, payload, event_id: str):
+    """Claim ``event_id`` and persist the WebhookEvent; None when it was already seen."""
+    if not claim(f"webhook:{channel}", event_id):
+        return None
+    try:
+        with transaction.atomic():
+            return WebhookEvent.objects.create(channel=channel, payload=payload, external_event_id=event_id)
+    except IntegrityError:
+        return None
+    except Exception:
+        release(f"webhook:{channel}", [event_id])
+        raise
 
 
 class WhatsAppWebhookView(APIView):
@@ -40,20 +63,21 @@ class WhatsAppWebhookView(APIView):
         if not verify_meta_signature(request.body, signature):
             return Response({"detail": "invalid signature"}, status=status.HTTP_401_UNAUTHORIZED)
         payload = request.data
-        event_id = str(payload.get("id") or payload.get("entry", [{}])[0].get("id", ""))
-        # Deduplicate on external_event_id if provided
-        if event_id and WebhookEvent.objects.filter(
-            channel=Channel.WHATSAPP, external_event_id=event_id
-        ).exists():
+        event = _store_webhook_event(Channel.WHATSAPP, payload, webhook_event_id(payload, request.body))
+        if event is None:
             WEBHOOK_REQUESTS.labels(channel=Channel.WHATSAPP, status="duplicate").inc()
             return Response({"status": "duplicate_skipped"}, status=status.HTTP_202_ACCEPTED)
-
-        event = WebhookEvent.objects.create(
-            channel=Channel.WHATSAPP, payload=payload, external_event_id=event_id
+        if settings.WHATSAPP_ASYNC_WEBHOOKS:
+            enqueue_webhook_pipeline(event.id, payload)
+            WEBHOOK_REQUESTS.labels(channel=Channel.WHATSAPP, status="queued").inc()
+            return Response({"status": "queued"}, status=status.HTTP_202_ACCEPTED)
+
+        apply_message_statuses(normalize_whatsapp_statuses(payload))
+        normalized_messages = normalize_whatsapp_payload(
+            payload, event_id=event.external_event_id, received_at=event.received_at
         )
-        normalized_messages = normalize_whatsapp_payload(payload, event_id=event.external_event_id)
-        for message in normalized_messages:
-            handle_normalized_message(message)
+        handle_normalized_messages(normalized_messages)
+        WebhookEvent.objects.filter(pk=event.pk).update(processed=True, status=WebhookEventStatus.SENT)
         WEBHOOK_REQUESTS.labels(channel=Channel.WHATSAPP, status="accepted").inc()
         return Response({"status": "accepted"}, status=status.HTTP_202_ACCEPTED)
 
@@ -68,8 +92,7 @@ class OutboundWhatsAppMessageView(APIView):
             return Response({"detail": "to and body are required"}, status=status.HTTP_400_BAD_REQUEST)
         ctx, message = send_outbound_message(channel=Channel.WHATSAPP, external_id=to, text=body)
         result = send_whatsapp_text(to=to, body=body)
-        message.raw_payload.update({"send_result": result})
-        message.save(update_fields=["raw_payload"])
+        record_send_result(message, result)
         result.update(ctx)
         return Response(
             result,
@@ -155,9 +178,11 @@ class ShopifyWebhookView(APIView):
             WEBHOOK_REQUESTS.labels(channel=Channel.SHOPIFY, status="unauthorized").inc()
             return Response({"detail": "invalid hmac"}, status=status.HTTP_401_UNAUTHORIZED)
 
-        shopify_upsert(request.data)
-        WEBHOOK_REQUESTS.labels(channel=Channel.SHOPIFY, status="accepted").inc()
-        return Response({"status": "accepted"}, status=status.HTTP_202_ACCEPTED)
+        event_id = request.headers.get("X-Shopify-Webhook-Id") or webhook_event_id(request.data, request.body)
+        event = _store_webhook_event(Channel.SHOPIFY, request.data, event_id)
+        result = accept_order_event(event) if event else "duplicate"
+        WEBHOOK_REQUESTS.labels(channel=Channel.SHOPIFY, status=result).inc()
+        return Response({"status": "duplicate_skipped" if event is None else result}, status=status.HTTP_202_ACCEPTED)
 
 
 class MagentoWebhookView(APIView):
@@ -166,11 +191,10 @@ class MagentoWebhookView(APIView):
     def post(self, request, *args, **kwargs):
         if not is_ip_allowed(request):
             return Response({"detail": "ip_not_allowed"}, status=status.HTTP_403_FORBIDDEN)
-        shared_secret = os.environ.get("MAGENTO_WEBHOOK_SECRET")
-        provided = request.headers.get("X-Magento-Signature")
-        if shared_secret and provided != shared_secret:
+        if not magento_secret_ok(request.headers.get("X-Magento-Signature")):
             WEBHOOK_REQUESTS.labels(channel=Channel.MAGENTO, status="unauthorized").inc()
             return Response({"detail": "invalid signature"}, status=status.HTTP_401_UNAUTHORIZED)
-        magento_upsert(request.data)
-        WEBHOOK_REQUESTS.labels(channel=Channel.MAGENTO, status="accepted").inc()
-        return Response({"status": "accepted"}, status=status.HTTP_202_ACCEPTED)
+        event = _store_webhook_event(Channel.MAGENTO, request.data, webhook_event_id(request.data, request.body))
+        result = accept_order_event(event) if event else "duplicate"
+        WEBHOOK_REQUESTS.labels(channel=Channel.MAGENTO, status=result).inc()
+        return Response({"status": "duplicate_skipped" if event is None else result}, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,53 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_orders(apps, schema_editor):
+    """Fold repeated (tenant, source, external id) orders into the oldest row.
+
+    Upserts kept writing to whichever copy they found, so the kept row takes
+    the fields of the most recently updated copy and inherits its payment intents.
+    """
+    Order = apps.get_model('commerce', 'Order')
+    PaymentIntent = apps.get_model('commerce', 'PaymentIntent')
+    duplicates = (
+        Order.objects.exclude(external_order_id='')
+        .order_by()
+        .values('tenant_id', 'source', 'external_order_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        orders = list(
+            Order.objects.filter(
+                tenant_id=group['tenant_id'], source=group['source'], external_order_id=group['external_order_id']
+            ).order_by('created_at', 'id')
+        )
+        keep, extra = orders[0], orders[1:]
+        latest = max(orders, key=lambda order: order.updated_at)
+        if latest is not keep:
+            for field in ('customer_id', 'status', 'total', 'currency', 'details'):
+                setattr(keep, field, getattr(latest, field))
+            keep.save()
+        extra_ids = [order.id for order in extra]
+        PaymentIntent.objects.filter(order_id__in=extra_ids).update(order_id=keep.id)
+        Order.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_orders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('tenant_id__isnull', False), models.Q(('external_order_id', ''), _negated=True)), fields=('tenant_id', 'source', 'external_order_id'), name='commerce_order_tenant_source_ext_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('tenant_id__isnull', True), models.Q(('external_order_id', ''), _negated=True)), fields=('source', 'external_order_id'), name='commerce_order_source_ext_uniq'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 
 from core.constants import (
     OrderSource,
@@ -29,6 +30,18 @@ class Order(BaseModel):
             models.Index(fields=["tenant_id", "source", "external_order_id"]),
             models.Index(fields=["customer", "status"]),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["tenant_id", "source", "external_order_id"],
+                condition=Q(tenant_id__isnull=False) & ~Q(external_order_id=""),
+                name="commerce_order_tenant_source_ext_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["source", "external_order_id"],
+                condition=Q(tenant_id__isnull=True) & ~Q(external_order_id=""),
+                name="commerce_order_source_ext_uniq",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Order {self.external_order_id or self.id}"
@@ -3,6 +3,78 @@ from typing import Any, Dict, List, Optional
 from commerce.models import Order, PaymentIntent, Ticket
 from conversations.models import Conversation
 
+# Write tools the orchestrator only runs with these arguments set and ``confirmed`` true
+# (see conversations.services.execute_tool); their specs require the same arguments.
+CONFIRMED_TOOLS: Dict[str, List[str]] = {
+    "refund_order": ["customer_id"],
+    "create_payment_intent": ["customer_id"],
+    "update_order_status": [],
+    "capture_payment_intent": [],
+}
+
+# Back-office tools: not offered to an agent unless its ``allowed_tools`` names them.
+STAFF_TOOLS = ("update_order_status", "capture_payment_intent")
+
+_CONFIRMED = {"type": "boolean", "description": "True only once the customer has explicitly confirmed this action."}
+
+
+def _spec(name: str, description: str, properties: Dict[str, Any], required: List[str]) -> Dict[str, Any]:
+    gate = CONFIRMED_TOOLS.get(name)
+    if gate is not None:
+        properties = {**properties, "confirmed": _CONFIRMED}
+        required = list(dict.fromkeys([*required, *gate, "confirmed"]))
+    return {
+        "name": name,
+        "description": description,
+        "parameters": {"type": "object", "properties": properties, "required": required},
+    }
+
+
+# Tools offered to agents, as JSON-schema function specs for native tool calling.
+TOOL_SPECS: List[Dict[str, Any]] = [
+    _spec(
+        "list_customer_orders",
+        "List the customer's ten most recent orders.",
+        {"customer_id": {"type": "integer"}},
+        ["customer_id"],
+    ),
+    _spec(
+        "refund_order",
+        "Refund an order, fully or by the given amount.",
+        {"customer_id": {"type": "integer"}, "order_id": {"type": "integer"}, "amount": {"type": "number"}},
+        ["order_id"],
+    ),
+    _spec(
+        "create_payment_intent",
+        "Create a payment request for the customer.",
+        {
+            "customer_id": {"type": "integer"},
+            "amount": {"type": "number"},
+            "currency": {"type": "string"},
+            "order_id": {"type": "integer"},
+        },
+        ["customer_id", "amount"],
+    ),
+    _spec(
+        "schedule_followup",
+        "Schedule a follow-up on this conversation.",
+        {"conversation_id": {"type": "integer"}, "topic": {"type": "string"}},
+        ["conversation_id"],
+    ),
+    _spec(
+        "update_order_status",
+        "Set an order's status.",
+        {"order_id": {"type": "integer"}, "status": {"type": "string"}},
+        ["order_id", "status"],
+    ),
+    _spec(
+        "capture_payment_intent",
+        "Capture an authorized payment.",
+        {"payment_intent_id": {"type": "integer"}},
+        ["payment_intent_id"],
+    ),
+]
+
 
 def list_customer_orders(customer_id: int) -> List[Dict[str, Any]]:
     orders = (
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def collapse_duplicate_messages(apps, schema_editor):
+    """Keep the oldest row per provider message id so the unique constraints can be added.
+
+    Nothing holds a foreign key to Message, so the later copies are deleted outright.
+    """
+    Message = apps.get_model('conversations', 'Message')
+    duplicates = (
+        Message.objects.exclude(external_message_id='')
+        .order_by()
+        .values('tenant_id', 'external_message_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        ids = list(
+            Message.objects.filter(tenant_id=group['tenant_id'], external_message_id=group['external_message_id'])
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+        )
+        Message.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0003_message_delivery_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_duplicate_messages, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('tenant_id__isnull', False), models.Q(('external_message_id', ''), _negated=True)), fields=('tenant_id', 'external_message_id'), name='conversations_message_tenant_ext_id_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('tenant_id__isnull', True), models.Q(('external_message_id', ''), _negated=True)), fields=('external_message_id',), name='conversations_message_ext_id_uniq'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def close_extra_open_conversations(apps, schema_editor):
+    """Leave one open conversation per customer and channel so the constraint can be added.
+
+    The oldest stays open, matching which one ``resolve_open_conversations``
+    already picked; the others are resolved and keep their messages.
+    """
+    Conversation = apps.get_model('conversations', 'Conversation')
+    duplicates = (
+        Conversation.objects.filter(status='open')
+        .order_by()
+        .values('customer_id', 'channel')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        ids = list(
+            Conversation.objects.filter(status='open', customer_id=group['customer_id'], channel=group['channel'])
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        Conversation.objects.filter(id__in=ids[1:]).update(status='resolved', closed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversations', '0004_message_external_id_uniq'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_extra_open_conversations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'open')), fields=('customer', 'channel'), name='conversations_one_open_per_channel'),
+        ),
+    ]
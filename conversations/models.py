@@ -1,8 +1,10 @@
 from django.db import models
+from django.db.models import Q
 
 from core.constants import (
     Channel,
     ConversationStatus,
+    DeliveryStatus,
     FollowUpStatus,
     MessageDirection,
     MessageType,
@@ -34,6 +36,13 @@ class Conversation(BaseModel):
             models.Index(fields=["tenant_id", "channel", "status"]),
             models.Index(fields=["customer", "status"]),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "channel"],
+                condition=Q(status="open"),
+                name="conversations_one_open_per_channel",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Conversation {self.id} ({self.channel})"
@@ -52,6 +61,10 @@ class Message(BaseModel):
     text = models.TextField(blank=True, null=True)
     attachments = models.JSONField(default=list, blank=True)
     llm_metadata = models.JSONField(default=dict, blank=True)
+    delivery_status = models.CharField(
+        max_length=16, choices=DeliveryStatus.choices, blank=True, default=""
+    )
+    delivery_updated_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ["created_at"]
@@ -60,6 +73,19 @@ class Message(BaseModel):
             models.Index(fields=["tenant_id", "message_type"]),
             models.Index(fields=["external_message_id"]),
         ]
+        # Source of truth for dedup: provider message ids are unique per tenant.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["tenant_id", "external_message_id"],
+                condition=Q(tenant_id__isnull=False) & ~Q(external_message_id=""),
+                name="conversations_message_tenant_ext_id_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["external_message_id"],
+                condition=Q(tenant_id__isnull=True) & ~Q(external_message_id=""),
+                name="conversations_message_ext_id_uniq",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.direction} message {self.id}"
@@ -34,5 +34,7 @@ class MessageSerializer(serializers.ModelSerializer):
             "text",
             "attachments",
             "llm_metadata",
+            "delivery_status",
+            "delivery_updated_at",
             "created_at",
         ]
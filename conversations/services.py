@@ -1,87 +1,314 @@
+import datetime
+import hashlib
 import json
 import logging
-from typing import Any, Dict, Optional
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
+from celery import group
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 
 from agents.models import AgentProfile
 from channels.senders import send_whatsapp_text
 from channels.tasks import download_media, transcribe_voice, generate_tts
-from customers.models import Customer, CustomerIdentity
-from core.constants import Channel
+from core.cache import ReadThroughCache
+from customers.models import Customer
+from customers.services import IDENTITY_CACHE, resolve_customer_ids
+from core.constants import Channel, ConversationStatus, DeliveryStatus
 from commerce import tools as commerce_tools
 from commerce.models import Order, Ticket
 from conversations.models import Conversation, Message
+from conversations.sharding import conversation_owner
 from llm.tool_logs import ToolCallLog
 from analytics.models import AuditLog
+from core.dedup import claim_many, release
+from core.upsert import upsert
 from core.utils import mask_payload
-from core.metrics import LLM_REQUESTS, LLM_LATENCY, ASR_REQUESTS, ASR_LATENCY, TOOL_CALLS
+from core.metrics import LLM_REQUESTS, LLM_LATENCY, ASR_REQUESTS, ASR_LATENCY, TOOL_CALLS, DEBOUNCED_REPLIES
+from core.metrics import LLM_CASCADE_DECISIONS, LLM_CASCADE_OVERHEAD, LLM_CASCADE_SAVED
 from channels.whatsapp_media import upload_media
 from core.constants import Channel
 
 logger = logging.getLogger(__name__)
 
+# (customer_id, channel) -> id of the open conversation
+OPEN_CONVERSATION_CACHE = ReadThroughCache("open_conversation")
+
+# What an agent's small cascade model must answer with; anything else escalates the turn.
+CASCADE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string"},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        "tool": {"type": "string"},
+    },
+    "required": ["answer", "confidence"],
+}
+CASCADE_INSTRUCTION = (
+    'Respond as JSON: {"answer": "<reply to the customer>", "confidence": <0 to 1, how sure you are the reply '
+    'is correct and complete>}. If the customer needs a tool, call it (or set "tool" to its name) instead of answering.'
+)
+# (backend, model) -> smoothed latency of the agents' large models in this process, to estimate cascade savings.
+_LARGE_MODEL_SECONDS: Dict[Tuple[str, str], float] = {}
+
+
+def should_reply(normalized: Dict[str, Any]) -> bool:
+    """Whether an inbound normalized message warrants an orchestrated reply."""
+    return normalized.get("channel") == Channel.WHATSAPP and bool(normalized.get("text"))
+
+
+def resolve_open_conversations(
+    keys: Iterable[Tuple[str, str]], source: str = "webhook", use_cache: bool = True
+) -> Dict[Tuple[str, str], Conversation]:
+    """Map (channel, external_id) -> open conversation, upserting the missing ones.
+
+    Identity and open-conversation ids are read through ``IDENTITY_CACHE`` and
+    ``OPEN_CONVERSATION_CACHE``; cached ids are re-checked against ``status="open"``
+    in the same query that loads the rows. At most one conversation per customer
+    and channel is open (partial unique constraint), so concurrent workers
+    converge on the same row.
+    """
+    keys = set(keys)
+    customer_ids = resolve_customer_ids(keys, use_cache=use_cache)
+    owners = {(customer_id, key[0]) for key, customer_id in customer_ids.items()}
+    by_owner: Dict[Tuple[int, str], Conversation] = {}
+    cached = OPEN_CONVERSATION_CACHE.get_many(owners) if use_cache else {}
+    if cached:
+        for conversation in Conversation.objects.filter(id__in=set(cached.values()), status=ConversationStatus.OPEN):
+            owner = (conversation.customer_id, conversation.channel)
+            if cached.get(owner) == conversation.id:
+                by_owner[owner] = conversation
+
+    unresolved = owners - set(by_owner)
+    if unresolved:
+        existing = Conversation.objects.filter(
+            customer_id__in={customer_id for customer_id, _ in unresolved},
+            channel__in={channel for _, channel in unresolved},
+            status=ConversationStatus.OPEN,
+        ).order_by("id")
+        loaded = {}
+        for conversation in existing:
+            owner = (conversation.customer_id, conversation.channel)
+            if owner in unresolved and owner not in loaded:
+                loaded[owner] = conversation
+        missing = unresolved - set(loaded)
+        if missing and use_cache:
+            wanted = {customer_id for customer_id, _ in missing}
+            if Customer.objects.filter(id__in=wanted).count() != len(wanted):
+                # A cached identity points at a customer that is gone (merged or deleted).
+                IDENTITY_CACHE.invalidate(keys)
+                return resolve_open_conversations(keys, source, use_cache=False)
+        created = upsert(
+            Conversation,
+            [
+                {"customer_id": customer_id, "channel": channel, "status": ConversationStatus.OPEN, "metadata": {"source": source}}
+                for customer_id, channel in missing
+            ],
+            "conversations_one_open_per_channel",
+        )
+        loaded.update({(conversation.customer_id, conversation.channel): conversation for conversation in created})
+        OPEN_CONVERSATION_CACHE.set_many({owner: conversation.id for owner, conversation in loaded.items()})
+        by_owner.update(loaded)
+    return {key: by_owner[(customer_id, key[0])] for key, customer_id in customer_ids.items()}
 
-def resolve_customer(channel: str, external_id: str) -> Customer:
-    """Resolve or create a customer by channel + external id."""
-    identity, _ = CustomerIdentity.objects.get_or_create(
-        channel=channel, external_id=external_id, defaults={"customer": Customer.objects.create()}
-    )
-    return identity.customer
 
+def forget_open_conversations(owners: Iterable[Tuple[int, str]]) -> None:
+    """Invalidate cached open-conversation ids for (customer_id, channel) owners."""
+    OPEN_CONVERSATION_CACHE.invalidate(owners)
 
-def handle_normalized_message(normalized: Dict[str, Any]) -> None:
-    """Stub orchestrator entry point; persists minimal conversation/message data."""
-    channel = normalized.get("channel") or Channel.WEB
-    external_id = normalized.get("external_id") or normalized.get("user_id") or "unknown"
-    external_message_id = normalized.get("external_message_id") or ""
-    customer = resolve_customer(channel, external_id)
 
-    conversation, _ = Conversation.objects.get_or_create(
-        customer=customer,
-        channel=channel,
-        status="open",
-        defaults={"metadata": {"source": "webhook"}},
-    )
+def close_conversation(conversation: Conversation, status: str = ConversationStatus.RESOLVED) -> Conversation:
+    """Move a conversation out of ``open`` and drop it from the resolution cache."""
+    conversation.status = status
+    conversation.closed_at = timezone.now()
+    conversation.save(update_fields=["status", "closed_at", "updated_at"])
+    forget_open_conversations([(conversation.customer_id, conversation.channel)])
+    return conversation
 
-    if external_message_id and Message.objects.filter(external_message_id=external_message_id).exists():
-        logger.info("Duplicate message %s ignored.", external_message_id)
-        return
 
-    message = Message.objects.create(
+def _create_inbound_message(conversation: Conversation, normalized: Dict[str, Any]) -> Message:
+    return Message(
         conversation=conversation,
         direction="inbound",
         message_type=normalized.get("message_type", "text"),
-        external_message_id=external_message_id,
+        external_message_id=normalized.get("external_message_id") or "",
         raw_payload=normalized,
         text=normalized.get("text", ""),
         attachments=normalized.get("attachments", []),
         llm_metadata=normalized.get("llm_metadata", {}),
     )
 
-    logger.info("Accepted normalized message on channel %s for customer %s", channel, customer.id)
 
-    # Media/voice handling stubs
-    for attachment in normalized.get("attachments", []):
-        media_id = attachment.get("id")
-        if media_id:
-            res = download_media.delay(media_id, attachment.get("mime_type"), message.id)
-            logger.info("Scheduled media download task %s for media %s", res.id, media_id)
+def ingest_normalized_messages(normalized_messages: List[Dict[str, Any]]) -> List[Message]:
+    """Persist a batch of normalized inbound messages with set-based queries.
+
+    Duplicates are filtered with one dedup round-trip per channel, identities and
+    open conversations are resolved in bulk, messages are inserted with a single
+    bulk_create and media downloads are dispatched as one Celery group after commit.
+    Returns the newly stored messages in arrival order.
+    """
+    fresh = []
+    by_channel: Dict[str, List[str]] = defaultdict(list)
+    for normalized in normalized_messages:
+        if normalized.get("external_message_id"):
+            by_channel[conversation_owner(normalized)[0]].append(normalized["external_message_id"])
+    claimed = {channel: claim_many(f"message:{channel}", ids) for channel, ids in by_channel.items()}
+    for normalized in normalized_messages:
+        external_message_id = normalized.get("external_message_id")
+        if external_message_id and external_message_id not in claimed[conversation_owner(normalized)[0]]:
+            logger.info("Duplicate message %s ignored.", external_message_id)
+            continue
+        fresh.append(normalized)
+    if not fresh:
+        return []
+
+    try:
+        conversations = resolve_open_conversations(conversation_owner(n) for n in fresh)
+        pending = [_create_inbound_message(conversations[conversation_owner(n)], n) for n in fresh]
+        try:
+            with transaction.atomic():
+                messages = Message.objects.bulk_create(pending)
+        except IntegrityError:
+            # Something slipped past the dedup filter; insert row by row and skip stored ids.
+            messages = []
+            for message in pending:
+                try:
+                    with transaction.atomic():
+                        message.save()
+                    messages.append(message)
+                except IntegrityError:
+                    logger.info("Duplicate message %s ignored (already stored).", message.external_message_id)
+    except Exception:
+        # Let a retry or the replay engine claim these ids again.
+        for channel, ids in claimed.items():
+            release(f"message:{channel}", list(ids))
+        raise
+
+    downloads = [
+        download_media.s(attachment["id"], attachment.get("mime_type"), message.id)
+        for message in messages
+        for attachment in message.attachments or []
+        if attachment.get("id")
+    ]
+    if downloads:
+        transaction.on_commit(lambda: group(downloads).apply_async())
+    logger.info("Ingested %s of %s normalized messages", len(messages), len(normalized_messages))
+    return messages
+
+
+def handle_normalized_messages(normalized_messages: List[Dict[str, Any]], reply: bool = True) -> List[Message]:
+    """Persist a batch of normalized inbound messages and optionally reply inline."""
+    messages = ingest_normalized_messages(normalized_messages)
+    if reply:
+        for message in messages:
+            if should_reply(message.raw_payload):
+                respond_to_inbound(message)
+    return messages
+
+
+def handle_normalized_message(normalized: Dict[str, Any], reply: bool = True) -> Optional[Message]:
+    """Persist a single normalized inbound message; returns None when it was a duplicate."""
+    messages = handle_normalized_messages([normalized], reply=reply)
+    return messages[0] if messages else None
 
-    if channel == Channel.WHATSAPP and normalized.get("text"):
-        orchestrate_reply(conversation, external_id=external_id, inbound_text=normalized["text"])
+
+def respond_to_inbound(message: Message) -> None:
+    """Reply now, or defer the reply when the message is part of a burst."""
+    delay = debounce_delay(message)
+    if delay:
+        from conversations.tasks import schedule_debounced_reply
+
+        schedule_debounced_reply(message, delay)
+        return
+    outbound = reply_to_inbound(message)
+    if outbound:
+        deliver_reply(outbound)
+
+
+def debounce_window(conversation: Conversation) -> float:
+    """Seconds to wait for a burst to settle; per-conversation metadata overrides the default."""
+    window = (conversation.metadata or {}).get("debounce_seconds")
+    if window is None:
+        window = settings.CONVERSATION_DEBOUNCE_SECONDS
+    return max(float(window), 0.0)
+
+
+def _arrived_at(created_at: datetime.datetime, received_at: Optional[str]) -> datetime.datetime:
+    """When an inbound message reached the webhook; its insert time if that was not recorded."""
+    return datetime.datetime.fromisoformat(received_at) if received_at else created_at
+
+
+def debounce_delay(inbound: Message) -> float:
+    """Return 0 to reply immediately, or the delay before replying to a burst.
+
+    A message that arrived within the window of the previous inbound message is
+    part of a burst: its reply is deferred until the window after its arrival has
+    passed, so the whole burst is answered in one turn. Arrival is the webhook
+    receive time, so time spent queued before persistence counts towards the
+    window. Single messages (no recent predecessor) are answered without delay.
+    """
+    window = debounce_window(inbound.conversation)
+    if not window:
+        return 0.0
+    previous = (
+        Message.objects.filter(conversation_id=inbound.conversation_id, direction="inbound", id__lt=inbound.id)
+        .order_by("-id")
+        .values_list("created_at", "raw_payload__received_at")
+        .first()
+    )
+    if not previous:
+        return 0.0
+    arrived = _arrived_at(inbound.created_at, (inbound.raw_payload or {}).get("received_at"))
+    if arrived - _arrived_at(*previous) >= datetime.timedelta(seconds=window):
+        return 0.0
+    return max(window - (timezone.now() - arrived).total_seconds(), 0.0)
+
+
+def is_superseded(inbound: Message) -> bool:
+    """True once a newer inbound message exists; its turn will answer both."""
+    return Message.objects.filter(
+        conversation_id=inbound.conversation_id, direction="inbound", id__gt=inbound.id
+    ).exists()
+
+
+def pending_turn(inbound: Message) -> List[Message]:
+    """Inbound messages since the last outbound reply, up to and including ``inbound``."""
+    last_outbound_id = (
+        Message.objects.filter(conversation_id=inbound.conversation_id, direction="outbound")
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    turn = Message.objects.filter(
+        conversation_id=inbound.conversation_id, direction="inbound", id__lte=inbound.id
+    )
+    if last_outbound_id:
+        turn = turn.filter(id__gt=last_outbound_id)
+    return list(turn.order_by("id"))
+
+
+def reply_to_inbound(inbound: Message) -> Optional[Message]:
+    """Generate one reply for the turn ending at ``inbound``, coalescing earlier unanswered messages."""
+    if is_superseded(inbound):
+        DEBOUNCED_REPLIES.labels(outcome="superseded").inc()
+        logger.info("Inbound message %s superseded by a newer message; skipping reply.", inbound.id)
+        return None
+    turn_text = "\n".join(m.text for m in pending_turn(inbound) if m.text) or inbound.text or ""
+    return generate_reply(
+        inbound.conversation,
+        external_id=inbound.raw_payload.get("external_id") or "",
+        inbound_text=turn_text,
+        superseded_check=inbound,
+    )
 
 
 def send_outbound_message(channel: str, external_id: str, text: str):
     """Create or reuse conversation, log outbound message, and return context for sender."""
-    customer = resolve_customer(channel, external_id)
-    conversation, _ = Conversation.objects.get_or_create(
-        customer=customer,
-        channel=channel,
-        status="open",
-        defaults={"metadata": {"source": "outbound"}},
-    )
+    conversation = resolve_open_conversations([(channel, external_id)], source="outbound")[(channel, external_id)]
 
     message = Message.objects.create(
         conversation=conversation,
@@ -94,25 +321,74 @@ def send_outbound_message(channel: str, external_id: str, text: str):
     logger.info(
         "Queued outbound message %s on channel %s to external_id %s", message.id, channel, external_id
     )
-    ctx = {"conversation_id": conversation.id, "message_id": message.id, "customer_id": customer.id}
+    ctx = {"conversation_id": conversation.id, "message_id": message.id, "customer_id": conversation.customer_id}
     return ctx, message
 
 
 def orchestrate_reply(conversation: Conversation, external_id: str, inbound_text: str) -> None:
-    """Minimal orchestrator: choose agent, call LLM router, validate tools, persist + send reply."""
+    """Minimal orchestrator: generate the reply and deliver it in the same call."""
+    outbound = generate_reply(conversation, external_id=external_id, inbound_text=inbound_text)
+    if outbound:
+        deliver_reply(outbound)
+
+
+def generate_reply(
+    conversation: Conversation,
+    external_id: str,
+    inbound_text: str,
+    superseded_check: Optional[Message] = None,
+) -> Optional[Message]:
+    """Choose agent, call LLM router, validate tools and persist the outbound reply (unsent).
+
+    With ``superseded_check`` the reply is dropped if a newer inbound message
+    arrived while the LLM was generating.
+    """
     agent = _select_agent(conversation)
     if not agent:
         logger.warning("No active agent configured; skipping reply.")
-        return
+        return None
 
     context_text = build_context(conversation)
-    llm_response = _call_llm_router(agent, inbound_text, context_text)
-    if not llm_response:
+    session_id = str(conversation.id)
+    native_calls: List[Dict[str, Any]] = []
+    llm_response, cascade, model = None, None, agent.model_name
+    if agent.cascade_model_name:
+        llm_response, cascade = _cascade_reply(agent, inbound_text, context_text, session_id)
+        model = agent.cascade_model_name
+    large_seconds = None
+    if llm_response is None:
+        started = time.monotonic()
+        meta: Dict[str, Any] = {}
+        llm_response = _call_llm_router(
+            agent, inbound_text, context_text, on_tool_calls=native_calls.extend, session_id=session_id,
+            on_meta=meta.update,
+        )
+        if _malformed_output(llm_response, native_calls, meta):
+            logger.warning("LLM returned malformed JSON for conversation %s; retrying once.", conversation.id)
+            meta.clear()
+            llm_response = _call_llm_router(
+                agent, inbound_text, context_text, on_tool_calls=native_calls.extend, session_id=session_id,
+                on_meta=meta.update, bypass_cache=True,
+            )
+            if _malformed_output(llm_response, native_calls, meta):
+                logger.error("LLM returned malformed JSON again for conversation %s; sending the fallback reply.", conversation.id)
+                llm_response = settings.LLM_FALLBACK_REPLY
+        large_seconds = time.monotonic() - started
+        model = agent.model_name
+        if llm_response or native_calls:
+            _observe_large_model(agent, large_seconds)
+    if cascade is not None:
+        _log_cascade(agent, cascade, large_seconds)
+    if not llm_response and not native_calls:
         logger.warning("LLM router returned empty response; skipping outbound send.")
-        return
+        return None
+    if superseded_check and is_superseded(superseded_check):
+        DEBOUNCED_REPLIES.labels(outcome="superseded").inc()
+        logger.info("Reply to message %s superseded while in flight; dropping it.", superseded_check.id)
+        return None
 
     tool_result_text = None
-    parsed = parse_tool_call(llm_response)
+    parsed = native_calls[0] if native_calls else parse_tool_call(llm_response)
     final_text = llm_response
     if parsed:
         allowed = agent.tool_schema.get("allowed_tools") if isinstance(agent.tool_schema, dict) else None
@@ -121,25 +397,92 @@ def orchestrate_reply(conversation: Conversation, external_id: str, inbound_text
         else:
             tool_output = execute_tool(parsed["tool"], parsed.get("arguments", {}), conversation, agent)
             tool_result_text = f"Tool {parsed['tool']} result: {tool_output}"
-            final_text = parsed.get("final_answer") or tool_result_text
+            final_text = parsed.get("final_answer") or (llm_response if native_calls else None) or tool_result_text
+    if not final_text:
+        final_text = tool_result_text
 
-    outbound = Message.objects.create(
+    return Message.objects.create(
         conversation=conversation,
         direction="outbound",
         message_type="text",
         text=final_text,
-        llm_metadata={"agent_id": agent.id, "model": agent.model_name},
-        raw_payload={"llm_output": llm_response, "tool_result": tool_result_text},
+        llm_metadata={"agent_id": agent.id, "model": model, **({"cascade": cascade} if cascade else {})},
+        raw_payload={
+            "llm_output": llm_response,
+            "tool_calls": native_calls,
+            "tool_result": tool_result_text,
+            "to": external_id,
+        },
     )
 
+
+def deliver_reply(outbound: Message) -> None:
+    """Send a generated reply over its channel and schedule TTS audio for it."""
+    conversation = outbound.conversation
     if conversation.channel == Channel.WHATSAPP:
-        send_result = send_whatsapp_text(to=external_id, body=final_text)
-        outbound.raw_payload.update({"send_result": send_result})
-        outbound.save(update_fields=["raw_payload"])
-        generate_tts.delay(final_text, outbound.id)
+        send_result = send_whatsapp_text(to=outbound.raw_payload.get("to"), body=outbound.text)
+        record_send_result(outbound, send_result)
+        generate_tts.delay(outbound.text, outbound.id)
     logger.info("Sent outbound reply message %s for conversation %s", outbound.id, conversation.id)
 
 
+def record_send_result(outbound: Message, send_result: Dict[str, Any]) -> None:
+    """Store the channel send result and the provider message id used by status callbacks."""
+    outbound.raw_payload.update({"send_result": send_result})
+    update_fields = ["raw_payload"]
+    sent_ids = (send_result.get("response") or {}).get("messages") or []
+    if sent_ids and sent_ids[0].get("id"):
+        outbound.external_message_id = sent_ids[0]["id"]
+        outbound.delivery_status = DeliveryStatus.SENT
+        update_fields += ["external_message_id", "delivery_status"]
+    outbound.save(update_fields=update_fields)
+
+
+_DELIVERY_RANK = {
+    "": 0,
+    DeliveryStatus.SENT: 1,
+    DeliveryStatus.DELIVERED: 2,
+    DeliveryStatus.READ: 3,
+    DeliveryStatus.FAILED: 4,
+}
+
+
+def apply_message_statuses(statuses: List[Dict[str, Any]]) -> int:
+    """Apply delivery/read callbacks to outbound messages in bulk; returns rows updated.
+
+    Statuses only move forward (sent -> delivered -> read), so out-of-order
+    callbacks never regress a message. Customers and conversations are untouched.
+    """
+    latest: Dict[str, Dict[str, Any]] = {}
+    for status in statuses:
+        if status.get("status") not in _DELIVERY_RANK:
+            continue
+        current = latest.get(status["external_message_id"])
+        if not current or _DELIVERY_RANK[status["status"]] >= _DELIVERY_RANK[current["status"]]:
+            latest[status["external_message_id"]] = status
+    if not latest:
+        return 0
+
+    changed = []
+    for message in Message.objects.filter(direction="outbound", external_message_id__in=latest.keys()).only(
+        "id", "external_message_id", "delivery_status", "delivery_updated_at", "llm_metadata"
+    ):
+        status = latest[message.external_message_id]
+        if _DELIVERY_RANK[status["status"]] <= _DELIVERY_RANK.get(message.delivery_status, 0):
+            continue
+        message.delivery_status = status["status"]
+        message.delivery_updated_at = (
+            datetime.datetime.fromtimestamp(int(status["timestamp"]), tz=datetime.timezone.utc)
+            if status.get("timestamp")
+            else timezone.now()
+        )
+        if status.get("errors"):
+            message.llm_metadata = {**(message.llm_metadata or {}), "delivery_errors": status["errors"]}
+        changed.append(message)
+    Message.objects.bulk_update(changed, ["delivery_status", "delivery_updated_at", "llm_metadata"])
+    return len(changed)
+
+
 def _get_default_agent() -> Optional[AgentProfile]:
     agent = AgentProfile.objects.filter(is_active=True).order_by("created_at").first()
     if agent:
@@ -176,35 +519,208 @@ def _select_agent(conversation: Conversation) -> Optional[AgentProfile]:
     return _get_default_agent()
 
 
-def _call_llm_router(agent: AgentProfile, user_text: str, context: str = "") -> Optional[str]:
-    url = f"{settings.LLM_ROUTER_URL}/llm/infer"
-    payload = {
-        "backend": agent.model_backend,
-        "model": agent.model_name,
+def _prompt_version(agent: AgentProfile) -> Optional[str]:
+    """Identifies the agent's prompt revision so the router's response cache never serves an old prompt's answer.
+
+    Read from the loaded AgentProfile, no query: a digest of the live system
+    prompt (rollbacks rewrite it without touching ``updated_at``) plus ``updated_at``.
+    """
+    if agent.pk is None:
+        return None
+    digest = hashlib.sha1(agent.system_prompt.encode()).hexdigest()[:12]
+    return f"{agent.pk}.{digest}.{int(agent.updated_at.timestamp())}"
+
+
+def _agent_tools(agent: AgentProfile) -> List[Dict[str, Any]]:
+    allowed = agent.tool_schema.get("allowed_tools") if isinstance(agent.tool_schema, dict) else None
+    if allowed:
+        return [spec for spec in commerce_tools.TOOL_SPECS if spec["name"] in allowed]
+    return [spec for spec in commerce_tools.TOOL_SPECS if spec["name"] not in commerce_tools.STAFF_TOOLS]
+
+
+def _router_payload(
+    agent: AgentProfile,
+    user_text: str,
+    context: str = "",
+    priority: str = "interactive",
+    session_id: Optional[str] = None,
+    cascade: bool = False,
+) -> Dict[str, Any]:
+    """The ``/llm/infer`` body for one turn; ``cascade`` targets the small model and asks for ``CASCADE_SCHEMA``."""
+    # The system message is byte-identical across turns for one prompt version, so backends
+    # reuse its KV cache; everything that changes per turn goes after it, in the user message.
+    system = agent.system_prompt
+    payload: Dict[str, Any] = {}
+    if settings.LLM_NATIVE_TOOLS:
+        # The router passes tools to the backend's native tool calling and returns parsed calls.
+        payload["tools"] = _agent_tools(agent)
+    else:
+        system += "\n\nIf you need to use a tool, respond as JSON: {\"tool\":\"<name>\",\"arguments\":{...},\"final_answer\":\"<text>\"}. Tools available: list_customer_orders, refund_order, create_payment_intent, schedule_followup."
+    backend, model = agent.model_backend, agent.model_name
+    if cascade:
+        backend, model = agent.cascade_model_backend or agent.model_backend, agent.cascade_model_name
+        system += f"\n\n{CASCADE_INSTRUCTION}"
+        payload.update(response_format="json", json_schema=CASCADE_SCHEMA)
+    return {
+        "backend": backend,
+        "model": model,
         "messages": [
-            {
-                "role": "system",
-                "content": f"{agent.system_prompt}\n\nContext:\n{context}\n\nIf you need to use a tool, respond as JSON: {{\"tool\":\"<name>\",\"arguments\":{{...}},\"final_answer\":\"<text>\"}}. Tools available: list_customer_orders, refund_order, create_payment_intent, schedule_followup.",
-            },
-            {"role": "user", "content": user_text},
+            {"role": "system", "content": system},
+            {"role": "user", "content": f"Context:\n{context}\n\nCustomer message:\n{user_text}" if context else user_text},
         ],
         "temperature": agent.temperature,
         "max_tokens": agent.max_tokens,
+        "priority": priority,
+        "tenant": str(agent.tenant_id) if agent.tenant_id else None,
+        "prompt_version": _prompt_version(agent),
+        "agent_id": agent.pk,
+        # Keeps a conversation's turns on one replica, where its prompt prefix is still cached.
+        "session_id": session_id,
+        "cache_prompt": True,
+        "keep_alive": settings.LLM_KEEP_ALIVE or None,
+        **payload,
     }
-    LLM_REQUESTS.labels(backend=agent.model_backend, model=agent.model_name).inc()
-    with LLM_LATENCY.labels(backend=agent.model_backend, model=agent.model_name).time():
+
+
+def stream_llm_router(payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield the router's normalized SSE events (``delta`` ... ``done`` or ``error``) for ``payload``.
+
+    The read timeout applies between events, so long generations are fine as
+    long as tokens keep arriving.
+    """
+    url = f"{settings.LLM_ROUTER_URL}/llm/infer"
+    with requests.post(url, json={**payload, "stream": True}, stream=True, timeout=(5, 15)) as resp:
+        if not resp.ok:
+            yield {"type": "error", "detail": f"LLM router error {resp.status_code}: {resp.text[:200]}"}
+            return
+        for line in resp.iter_lines(decode_unicode=True):
+            if line and line.startswith("data:"):
+                yield json.loads(line[len("data:"):])
+
+
+def _call_llm_router(
+    agent: AgentProfile,
+    user_text: str,
+    context: str = "",
+    on_delta: Optional[Callable[[str], None]] = None,
+    on_tool_calls: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    session_id: Optional[str] = None,
+    cascade: bool = False,
+    on_meta: Optional[Callable[[Dict[str, Any]], None]] = None,
+    bypass_cache: bool = False,
+) -> Optional[str]:
+    """Return the full reply text; with ``LLM_ROUTER_STREAM`` deltas are passed to ``on_delta`` as they arrive.
+
+    Native tool calls parsed by the router are handed to ``on_tool_calls`` and
+    the response ``meta`` (e.g. ``json_valid``) to ``on_meta``.
+    ``session_id`` (the conversation id) routes successive turns to the same replica.
+    ``cascade`` sends the turn to the agent's small cascade model instead.
+    ``bypass_cache`` skips the router's response cache, for retries of a bad answer.
+    """
+    url = f"{settings.LLM_ROUTER_URL}/llm/infer"
+    payload = _router_payload(agent, user_text, context, session_id=session_id, cascade=cascade)
+    if bypass_cache:
+        payload["cache_control"] = {"bypass": True}
+    LLM_REQUESTS.labels(backend=payload["backend"], model=payload["model"]).inc()
+    with LLM_LATENCY.labels(backend=payload["backend"], model=payload["model"]).time():
         try:
+            if settings.LLM_ROUTER_STREAM:
+                parts = []
+                for event in stream_llm_router(payload):
+                    if event.get("type") == "delta":
+                        parts.append(event["delta"])
+                        if on_delta:
+                            on_delta(event["delta"])
+                    elif event.get("type") == "done":
+                        if event.get("tool_calls") and on_tool_calls:
+                            on_tool_calls(event["tool_calls"])
+                        if on_meta:
+                            on_meta(event.get("meta") or {})
+                    elif event.get("type") == "error":
+                        logger.error("LLM router stream error: %s", event.get("detail"))
+                        return None
+                return "".join(parts) or None
             resp = requests.post(url, json=payload, timeout=15)
             if not resp.ok:
                 logger.error("LLM router error %s: %s", resp.status_code, resp.text)
                 return None
             data = resp.json()
+            if data.get("tool_calls") and on_tool_calls:
+                on_tool_calls(data["tool_calls"])
+            if on_meta:
+                on_meta(data.get("meta") or {})
             return data.get("output") or None
         except Exception as exc:  # noqa: broad-except
             logger.exception("Failed to call LLM router: %s", exc)
             return None
 
 
+def _cascade_reply(
+    agent: AgentProfile, user_text: str, context: str, session_id: Optional[str]
+) -> Tuple[Optional[str], Dict[str, Any]]:
+    """Ask the agent's small model first; its answer if it can be kept (else None), and the decision."""
+    calls: List[Dict[str, Any]] = []
+    meta: Dict[str, Any] = {}
+    started = time.monotonic()
+    output = _call_llm_router(
+        agent, user_text, context, on_tool_calls=calls.extend, session_id=session_id, cascade=True, on_meta=meta.update
+    )
+    decision: Dict[str, Any] = {"model": agent.cascade_model_name, "small_ms": round((time.monotonic() - started) * 1000)}
+    try:
+        parsed = json.loads(output) if output and meta.get("json_valid") is not False else None
+    except ValueError:
+        parsed = None
+    valid = (
+        isinstance(parsed, dict)
+        and isinstance(parsed.get("answer"), str)
+        and isinstance(parsed.get("confidence"), (int, float))
+    )
+    if valid:
+        decision["confidence"] = parsed["confidence"]
+    if calls or (valid and parsed.get("tool")):
+        decision["outcome"] = "tool_call"
+    elif output is None:
+        decision["outcome"] = "error"
+    elif not valid:
+        decision["outcome"] = "invalid_json"
+    elif parsed["confidence"] < agent.cascade_min_confidence or not parsed["answer"].strip():
+        decision["outcome"] = "low_confidence"
+    else:
+        decision["outcome"] = "accepted"
+        return parsed["answer"].strip(), decision
+    return None, decision
+
+
+def _observe_large_model(agent: AgentProfile, seconds: float) -> None:
+    key = (agent.model_backend, agent.model_name)
+    previous = _LARGE_MODEL_SECONDS.get(key)
+    _LARGE_MODEL_SECONDS[key] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+
+def _log_cascade(agent: AgentProfile, decision: Dict[str, Any], large_seconds: Optional[float]) -> None:
+    """Record the outcome and what it cost or saved against the large model's typical latency."""
+    small_seconds = decision["small_ms"] / 1000
+    LLM_CASCADE_DECISIONS.labels(outcome=decision["outcome"]).inc()
+    if decision["outcome"] == "accepted":
+        expected = _LARGE_MODEL_SECONDS.get((agent.model_backend, agent.model_name))
+        if expected is not None:
+            decision["saved_ms"] = round((expected - small_seconds) * 1000)
+            LLM_CASCADE_SAVED.inc(max(expected - small_seconds, 0.0))
+    else:
+        if large_seconds is not None:
+            decision["large_ms"] = round(large_seconds * 1000)
+        decision["saved_ms"] = -decision["small_ms"]
+        LLM_CASCADE_OVERHEAD.inc(small_seconds)
+    logger.info(
+        "Cascade for agent %s: %s (confidence %s, small model %sms, saved %sms)",
+        agent.id,
+        decision["outcome"],
+        decision.get("confidence"),
+        decision["small_ms"],
+        decision.get("saved_ms"),
+    )
+
+
 def build_context(conversation: Conversation) -> str:
     customer = conversation.customer
     language = detect_language(conversation)
@@ -254,6 +770,15 @@ def detect_language(conversation: Conversation) -> str:
     return "en"
 
 
+def _malformed_output(output: Optional[str], native_calls: List[Dict[str, Any]], meta: Dict[str, Any]) -> bool:
+    """True for output the customer must never see: JSON the router flagged, or a tool call that does not parse."""
+    if native_calls or not output:
+        return False
+    if meta.get("json_valid") is False:
+        return True
+    return output.lstrip().startswith("{") and parse_tool_call(output) is None
+
+
 def parse_tool_call(raw: str) -> Optional[Dict[str, Any]]:
     try:
         data = json.loads(raw)
@@ -280,18 +805,15 @@ def execute_tool(tool_name: str, args: Dict[str, Any], conversation: Optional[Co
     if tool_name not in registry:
         TOOL_CALLS.labels(tool=tool_name, success=False).inc()
         return {"error": "unknown_tool"}
-    if tool_name in ("refund_order", "create_payment_intent"):
-        required = ["customer_id"]
-        missing = [r for r in required if not args.get(r)]
+    gate = commerce_tools.CONFIRMED_TOOLS.get(tool_name)
+    if gate is not None:
+        missing = [r for r in gate if not args.get(r)]
         if missing:
             TOOL_CALLS.labels(tool=tool_name, success=False).inc()
             return {"error": "missing_args", "missing": missing}
         if not args.get("confirmed"):
             TOOL_CALLS.labels(tool=tool_name, success=False).inc()
             return {"error": "confirmation_required"}
-    if tool_name in ("update_order_status", "capture_payment_intent") and not args.get("confirmed"):
-        TOOL_CALLS.labels(tool=tool_name, success=False).inc()
-        return {"error": "confirmation_required"}
     try:
         result = registry[tool_name]()
         if tool_name in ("refund_order", "create_payment_intent"):
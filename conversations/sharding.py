@@ -0,0 +1,66 @@
+import time
+import zlib
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+
+from core.constants import Channel
+from core.metrics import SHARD_DISPATCHES, SHARD_WAIT
+
+
+def conversation_key(channel: str, external_id: str) -> str:
+    return f"{channel}:{external_id}"
+
+
+def conversation_owner(normalized: Dict[str, Any]) -> Tuple[str, str]:
+    """The (channel, external_id) a normalized message belongs to; shared by sharding and persistence."""
+    channel = normalized.get("channel") or Channel.WEB
+    external_id = normalized.get("external_id") or normalized.get("user_id") or "unknown"
+    return channel, external_id
+
+
+def shard_for(channel: str, external_id: str) -> int:
+    """Stable shard index for a (channel, external_id) pair."""
+    shards = max(settings.CONVERSATION_SHARDS, 1)
+    return zlib.crc32(conversation_key(channel, external_id).encode()) % shards
+
+
+def shard_queue(shard: int) -> str:
+    return f"{settings.CONVERSATION_SHARD_QUEUE_PREFIX}.{shard}"
+
+
+def shard_queues() -> List[str]:
+    return [shard_queue(i) for i in range(settings.CONVERSATION_SHARDS)]
+
+
+def group_by_conversation(normalized_messages: List[Dict[str, Any]]) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """Group normalized messages by (channel, external_id), keeping arrival order."""
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for normalized in normalized_messages:
+        groups.setdefault(conversation_owner(normalized), []).append(normalized)
+    return groups
+
+
+def route_to_shard(signature, channel: str, external_id: str):
+    """Pin a task signature to the shard queue owning the conversation.
+
+    Each shard queue is consumed by a single-process worker, so work for one
+    conversation runs in order while different shards run in parallel.
+    With CONVERSATION_SHARDS=0 the signature is left on the default queue.
+    """
+    if settings.CONVERSATION_SHARDS <= 0:
+        return signature
+    shard = shard_for(channel, external_id)
+    SHARD_DISPATCHES.labels(shard=str(shard)).inc()
+    return signature.set(queue=shard_queue(shard))
+
+
+def dispatch_stamp(channel: str, external_id: str) -> Dict[str, Any]:
+    """Task kwargs used to measure how long work waited in its shard queue."""
+    shard = shard_for(channel, external_id) if settings.CONVERSATION_SHARDS > 0 else -1
+    return {"shard": shard, "enqueued_at": time.time()}
+
+
+def observe_wait(shard: int, enqueued_at: float) -> None:
+    if enqueued_at:
+        SHARD_WAIT.labels(shard=str(shard)).observe(max(time.time() - enqueued_at, 0))
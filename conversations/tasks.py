@@ -0,0 +1,159 @@
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from celery import chain, shared_task
+from django.db.models import F
+
+from channels.models import WebhookEvent
+from channels.normalizers import normalize_whatsapp_payload, normalize_whatsapp_statuses, whatsapp_sender
+from conversations.models import Message
+from conversations.services import (
+    apply_message_statuses,
+    debounce_delay,
+    deliver_reply,
+    handle_normalized_messages,
+    reply_to_inbound,
+    should_reply,
+)
+from conversations.sharding import (
+    dispatch_stamp,
+    group_by_conversation,
+    observe_wait,
+    route_to_shard,
+    shard_queues,
+)
+from core.celery import celery_app
+from core.constants import Channel, WebhookEventStatus
+from core.metrics import DEBOUNCED_REPLIES, SHARD_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _track_stage(event_id: int, stage: str, **extra):
+    """Record the pipeline stage on the WebhookEvent once the wrapped block succeeds.
+
+    A failure is sticky: later stages of other conversations in the same event
+    do not overwrite it, so the event stays visible for replay.
+    """
+    events = WebhookEvent.objects.filter(pk=event_id)
+    try:
+        yield
+    except Exception as exc:
+        events.update(status=WebhookEventStatus.FAILED, last_error=str(exc)[:2000])
+        raise
+    if extra:
+        events.update(**extra)
+    events.exclude(status=WebhookEventStatus.FAILED).update(status=stage)
+
+
+def enqueue_webhook_pipeline(event_id: int, payload: Dict[str, Any]):
+    """Run normalize -> persist -> orchestrate -> send (-> TTS) for a stored webhook event.
+
+    Normalization already runs on the shard queue of the payload's sender, so two
+    events from one sender are normalized and fanned out in arrival order. The
+    remaining stages are chained per conversation; only persistence is pinned to
+    that conversation's shard queue, so a slow LLM call never holds up ingest.
+    """
+    return route_to_shard(normalize_webhook_event.si(event_id), Channel.WHATSAPP, whatsapp_sender(payload)).apply_async()
+
+
+def dispatch_conversation_pipeline(normalized_messages: List[Dict[str, Any]], event_id: int, channel: str, external_id: str):
+    persist = persist_inbound_messages.s(normalized_messages, event_id, **dispatch_stamp(channel, external_id))
+    return chain(
+        route_to_shard(persist, channel, external_id),
+        orchestrate_replies.s(event_id),
+        send_replies.s(event_id),
+    ).apply_async()
+
+
+@shared_task
+def normalize_webhook_event(event_id: int) -> int:
+    """Normalize a stored event and fan it out to one ordered chain per conversation.
+
+    Delivery/read statuses are applied here in bulk; they never reach the shards.
+    """
+    with _track_stage(event_id, WebhookEventStatus.NORMALIZED):
+        event = WebhookEvent.objects.get(pk=event_id)
+        apply_message_statuses(normalize_whatsapp_statuses(event.payload))
+        normalized = normalize_whatsapp_payload(event.payload, event_id=event.external_event_id, received_at=event.received_at)
+        groups = group_by_conversation(normalized)
+        WebhookEvent.objects.filter(pk=event_id).update(pending_conversations=len(groups))
+    if not groups:
+        WebhookEvent.objects.filter(pk=event_id).update(processed=True)
+    for (channel, external_id), messages in groups.items():
+        dispatch_conversation_pipeline(messages, event_id, channel, external_id)
+    return len(groups)
+
+
+@shared_task
+def persist_inbound_messages(
+    normalized_messages: List[Dict[str, Any]], event_id: int, shard: int = -1, enqueued_at: float = 0.0
+) -> List[int]:
+    """Store inbound messages; return ids of those that need a reply."""
+    observe_wait(shard, enqueued_at)
+    with _track_stage(event_id, WebhookEventStatus.PERSISTED):
+        messages = handle_normalized_messages(normalized_messages, reply=False)
+    return [message.id for message in messages if should_reply(message.raw_payload)]
+
+
+def schedule_debounced_reply(inbound: Message, delay: float, event_id: Optional[int] = None):
+    """Answer ``inbound`` after ``delay`` seconds unless a newer message supersedes it first.
+
+    The deferred reply counts as one more pending conversation of ``event_id``,
+    so the event is only marked processed once that reply has been sent too.
+    Like every reply it runs on the default queue, never on a shard.
+    """
+    DEBOUNCED_REPLIES.labels(outcome="deferred").inc()
+    WebhookEvent.objects.filter(pk=event_id).update(pending_conversations=F("pending_conversations") + 1)
+    return chain(
+        orchestrate_replies.si([inbound.id], event_id, debounced=True).set(countdown=delay),
+        send_replies.s(event_id),
+    ).apply_async()
+
+
+@shared_task
+def orchestrate_replies(message_ids: List[int], event_id: Optional[int], debounced: bool = False) -> List[int]:
+    """Generate (but do not send) replies for the given inbound messages.
+
+    Messages that are part of a burst are re-scheduled after the debounce window;
+    earlier messages of a burst are skipped because the latest one answers for all.
+    """
+    outbound_ids = []
+    with _track_stage(event_id, WebhookEventStatus.ORCHESTRATED):
+        for inbound in Message.objects.filter(id__in=message_ids).select_related("conversation"):
+            delay = 0.0 if debounced else debounce_delay(inbound)
+            if delay:
+                schedule_debounced_reply(inbound, delay, event_id)
+                continue
+            outbound = reply_to_inbound(inbound)
+            if outbound:
+                outbound_ids.append(outbound.id)
+    return outbound_ids
+
+
+@shared_task
+def send_replies(outbound_ids: List[int], event_id: Optional[int]) -> None:
+    """Deliver generated replies; TTS is scheduled per message by deliver_reply."""
+    with _track_stage(event_id, WebhookEventStatus.SENT, pending_conversations=F("pending_conversations") - 1):
+        for outbound in Message.objects.filter(id__in=outbound_ids).select_related("conversation"):
+            deliver_reply(outbound)
+    WebhookEvent.objects.filter(pk=event_id, pending_conversations__lte=0).update(processed=True)
+    logger.info("Webhook event %s: %s replies sent", event_id, len(outbound_ids))
+
+
+@shared_task
+def sample_shard_queue_depths() -> Dict[str, int]:
+    """Publish the broker-side backlog of every shard queue as a gauge."""
+    depths = {}
+    with celery_app.connection_for_read() as conn:
+        channel = conn.default_channel
+        for index, queue in enumerate(shard_queues()):
+            try:
+                _, depth, _ = channel.queue_declare(queue=queue, passive=True)
+            except Exception:  # noqa: broad-except - an empty Redis queue does not exist
+                depth = 0
+            SHARD_QUEUE_DEPTH.labels(shard=str(index)).set(depth)
+            depths[queue] = depth
+    return depths
@@ -1,3 +1,543 @@
-from django.test import TestCase
+import datetime
+import json
+from unittest.mock import patch
 
-# Create your tests here.
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from channels.models import WebhookEvent
+from conversations.models import Conversation, Message
+from agents.models import AgentProfile
+from conversations.services import (
+    OPEN_CONVERSATION_CACHE,
+    _call_llm_router,
+    _router_payload,
+    close_conversation,
+    debounce_delay,
+    generate_reply,
+    handle_normalized_message,
+    ingest_normalized_messages,
+    is_superseded,
+    reply_to_inbound,
+    resolve_open_conversations,
+)
+from conversations.sharding import group_by_conversation, route_to_shard, shard_for, shard_queue
+from conversations.tasks import (
+    dispatch_conversation_pipeline,
+    enqueue_webhook_pipeline,
+    normalize_webhook_event,
+    orchestrate_replies,
+    persist_inbound_messages,
+    send_replies,
+)
+from core.celery import celery_app
+from core.constants import Channel
+from core.dedup import claim_many
+from customers.models import Customer, CustomerIdentity
+from customers.services import IDENTITY_CACHE
+
+
+def clear_resolution_caches():
+    IDENTITY_CACHE.clear()
+    OPEN_CONVERSATION_CACHE.clear()
+
+
+@override_settings(CONVERSATION_SHARDS=4, CONVERSATION_SHARD_QUEUE_PREFIX="conversations.shard")
+class ConversationShardingTests(TestCase):
+    def test_shard_is_stable_per_conversation(self):
+        first = shard_for(Channel.WHATSAPP, "123")
+        self.assertEqual(first, shard_for(Channel.WHATSAPP, "123"))
+        self.assertIn(first, range(4))
+        spread = {shard_for(Channel.WHATSAPP, str(n)) for n in range(50)}
+        self.assertGreater(len(spread), 1)
+
+    def test_group_by_conversation_keeps_arrival_order(self):
+        messages = [
+            {"channel": Channel.WHATSAPP, "external_id": "a", "text": "1"},
+            {"channel": Channel.WHATSAPP, "external_id": "b", "text": "2"},
+            {"channel": Channel.WHATSAPP, "external_id": "a", "text": "3"},
+        ]
+        groups = group_by_conversation(messages)
+        self.assertEqual([m["text"] for m in groups[(Channel.WHATSAPP, "a")]], ["1", "3"])
+        self.assertEqual(len(groups), 2)
+
+    def test_normalization_runs_on_the_senders_shard(self):
+        payload = {"entry": [{"changes": [{"value": {"messages": [{"from": "123", "id": "wamid.1"}]}}]}]}
+        with patch.object(normalize_webhook_event, "apply_async") as apply_async:
+            enqueue_webhook_pipeline(5, payload)
+        self.assertEqual(apply_async.call_args.kwargs["queue"], shard_queue(shard_for(Channel.WHATSAPP, "123")))
+
+    def test_grouping_and_persistence_share_one_conversation_key(self):
+        (key,) = group_by_conversation([{"user_id": "u1", "text": "hi"}])
+        self.assertEqual(key, (Channel.WEB, "u1"))
+
+    def test_route_to_shard_sets_queue(self):
+        signature = route_to_shard(persist_inbound_messages.s([], 1), Channel.WHATSAPP, "123")
+        self.assertEqual(signature.options["queue"], shard_queue(shard_for(Channel.WHATSAPP, "123")))
+
+    def test_replies_run_on_the_default_queue(self):
+        with patch("conversations.tasks.chain") as chained:
+            dispatch_conversation_pipeline([], 5, Channel.WHATSAPP, "123")
+        persist, orchestrate, send = chained.call_args.args
+        self.assertEqual(persist.options["queue"], shard_queue(shard_for(Channel.WHATSAPP, "123")))
+        self.assertNotIn("queue", orchestrate.options)
+        self.assertNotIn("queue", send.options)
+
+    @override_settings(CONVERSATION_SHARDS=0)
+    def test_sharding_disabled_keeps_default_queue(self):
+        signature = route_to_shard(persist_inbound_messages.s([], 1), Channel.WHATSAPP, "123")
+        self.assertNotIn("queue", signature.options)
+
+
+@override_settings(CONVERSATION_DEBOUNCE_SECONDS=3)
+class InboundDebounceTests(TestCase):
+    def setUp(self):
+        customer = Customer.objects.create()
+        self.conversation = Conversation.objects.create(customer=customer, channel=Channel.WHATSAPP)
+
+    def _inbound(self, text, received_at=None):
+        raw_payload = {"external_id": "123"}
+        if received_at:
+            raw_payload["received_at"] = received_at.isoformat()
+        return Message.objects.create(
+            conversation=self.conversation, direction="inbound", text=text, raw_payload=raw_payload
+        )
+
+    def test_single_message_is_not_delayed(self):
+        self.assertEqual(debounce_delay(self._inbound("hi")), 0)
+
+    def test_burst_is_deferred_unless_disabled_per_conversation(self):
+        self._inbound("hi")
+        second = self._inbound("are you there?")
+        self.assertAlmostEqual(debounce_delay(second), 3, delta=0.5)
+        self.conversation.metadata = {"debounce_seconds": 0}
+        self.conversation.save()
+        second.refresh_from_db()
+        self.assertEqual(debounce_delay(second), 0)
+
+    def test_window_is_measured_from_webhook_arrival(self):
+        arrived = timezone.now() - datetime.timedelta(seconds=10)
+        first = self._inbound("hi", received_at=arrived)
+        queued = self._inbound("my order", received_at=arrived + datetime.timedelta(seconds=1))
+        self.assertEqual(debounce_delay(queued), 0)
+        self.assertTrue(is_superseded(first))
+        late = self._inbound("hello?", received_at=arrived + datetime.timedelta(seconds=5))
+        self.assertEqual(debounce_delay(late), 0)
+
+    @patch("conversations.services._call_llm_router", return_value="Sure, one moment.")
+    def test_burst_is_answered_in_one_turn(self, llm):
+        first = self._inbound("hi")
+        self._inbound("my order")
+        last = self._inbound("is late")
+        self.assertIsNone(reply_to_inbound(first))
+        outbound = reply_to_inbound(last)
+        self.assertEqual(outbound.text, "Sure, one moment.")
+        llm.assert_called_once()
+        self.assertEqual(llm.call_args.args[1], "hi\nmy order\nis late")
+
+    def test_event_is_processed_only_after_the_debounced_reply_is_sent(self):
+        event = WebhookEvent.objects.create(channel=Channel.WHATSAPP, external_event_id="evt-1", pending_conversations=1)
+        self._inbound("hi")
+        second = self._inbound("are you there?")
+        with patch("conversations.tasks.chain") as chained:
+            self.assertEqual(orchestrate_replies([second.id], event.id), [])
+        deferred_orchestrate, deferred_send = chained.call_args.args
+        self.assertEqual((deferred_orchestrate.args[1], deferred_send.args[0]), (event.id, event.id))
+
+        send_replies([], event.id)
+        event.refresh_from_db()
+        self.assertEqual((event.processed, event.pending_conversations), (False, 1))
+        send_replies([], event.id)
+        event.refresh_from_db()
+        self.assertEqual((event.processed, event.pending_conversations), (True, 0))
+
+    def test_in_flight_reply_is_superseded(self):
+        first = self._inbound("hi")
+
+        def newer_message_arrives(*_args, **_kwargs):
+            self._inbound("hello??")
+            return "Hello!"
+
+        with patch("conversations.services._call_llm_router", side_effect=newer_message_arrives):
+            self.assertIsNone(reply_to_inbound(first))
+        self.assertFalse(Message.objects.filter(direction="outbound").exists())
+
+
+@override_settings(CONVERSATION_DEBOUNCE_SECONDS=3, CONVERSATION_SHARDS=4)
+class AsyncPipelineDebounceTests(TestCase):
+    def setUp(self):
+        clear_resolution_caches()
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+        self.agent = AgentProfile.objects.create(name="a", slug="a", system_prompt="Be brief.")
+
+    def _webhook(self, message_id, text):
+        payload = {
+            "entry": [{"changes": [{"value": {
+                "contacts": [{"wa_id": "123"}],
+                "messages": [{"from": "123", "id": message_id, "type": "text", "text": {"body": text}}],
+            }}]}]
+        }
+        event = WebhookEvent.objects.create(channel=Channel.WHATSAPP, payload=payload, external_event_id=message_id)
+        enqueue_webhook_pipeline(event.id, payload)
+        return event
+
+    def test_message_arriving_during_a_reply_is_answered_in_the_same_turn(self):
+        turns = []
+
+        def router(_agent, text, *_args, **_kwargs):
+            turns.append(text)
+            if len(turns) == 1:
+                self._webhook("wamid.2", "it never arrived")
+            return "Let me check."
+
+        sent = {"sent": True, "response": {"messages": [{"id": "wamid.out"}]}}
+        with patch("conversations.services._call_llm_router", side_effect=router), patch(
+            "conversations.services.send_whatsapp_text", return_value=sent
+        ) as send, patch("conversations.services.generate_tts"):
+            first = self._webhook("wamid.1", "where is my order?")
+        send.assert_called_once()
+        self.assertEqual(turns, ["where is my order?", "where is my order?\nit never arrived"])
+        self.assertEqual(Message.objects.filter(direction="outbound").count(), 1)
+        first.refresh_from_db()
+        self.assertTrue(first.processed)
+
+
+class _FakePipeline:
+    def __init__(self, store):
+        self.store = store
+        self.ops = []
+
+    def set(self, key, value, nx=False, ex=None):
+        self.ops.append(key)
+
+    def execute(self):
+        results = []
+        for key in self.ops:
+            results.append(key not in self.store)
+            self.store.add(key)
+        return results
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.store = set()
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self.store)
+
+    def delete(self, *keys):
+        self.store.difference_update(keys)
+
+
+class DedupTests(TestCase):
+    def test_claim_many_returns_only_unseen_ids(self):
+        fake = _FakeRedis()
+        with patch("core.dedup.get_redis", return_value=fake):
+            self.assertEqual(claim_many("message:whatsapp", ["a", "b", "a"]), {"a", "b"})
+            self.assertEqual(claim_many("message:whatsapp", ["b", "c"]), {"c"})
+            self.assertEqual(claim_many("message:shopify", ["b"]), {"b"})
+
+    def test_database_constraint_rejects_duplicate_without_redis(self):
+        normalized = {
+            "channel": Channel.WEB,
+            "external_id": "123",
+            "external_message_id": "mid-db",
+            "text": "hi",
+        }
+        with patch("core.dedup.get_redis", return_value=None):
+            self.assertIsNotNone(handle_normalized_message(normalized))
+            self.assertIsNone(handle_normalized_message(normalized))
+        self.assertEqual(Message.objects.filter(external_message_id="mid-db").count(), 1)
+
+
+    def test_failed_insert_releases_claimed_ids(self):
+        normalized = {"channel": Channel.WHATSAPP, "external_id": "123", "external_message_id": "mid-fail", "text": "hi"}
+        with patch("core.dedup.get_redis", return_value=_FakeRedis()):
+            with patch.object(Message.objects, "bulk_create", side_effect=OperationalError("database is down")):
+                with self.assertRaises(OperationalError):
+                    handle_normalized_message(normalized, reply=False)
+            self.assertIsNotNone(handle_normalized_message(normalized, reply=False))
+        self.assertEqual(Message.objects.filter(external_message_id="mid-fail").count(), 1)
+
+
+class BatchIngestTests(TestCase):
+    def setUp(self):
+        self.addCleanup(clear_resolution_caches)
+
+    def _normalized(self, sender, mid, **extra):
+        return {
+            "channel": Channel.WHATSAPP,
+            "external_id": sender,
+            "external_message_id": mid,
+            "message_type": "text",
+            "text": f"msg {mid}",
+            "attachments": [],
+            **extra,
+        }
+
+    @patch("conversations.services.group")
+    def test_batch_resolves_identities_and_dispatches_media_once(self, group):
+        batch = [
+            self._normalized("a", "m1"),
+            self._normalized("b", "m2", attachments=[{"type": "image", "id": "media-1", "mime_type": "image/jpeg"}]),
+            self._normalized("a", "m3"),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            messages = ingest_normalized_messages(batch)
+        self.assertEqual([m.external_message_id for m in messages], ["m1", "m2", "m3"])
+        self.assertEqual(CustomerIdentity.objects.count(), 2)
+        self.assertEqual(Customer.objects.count(), 2)
+        self.assertEqual(Conversation.objects.count(), 2)
+        self.assertEqual(messages[0].conversation_id, messages[2].conversation_id)
+        group.assert_called_once()
+        self.assertEqual(len(group.call_args.args[0]), 1)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        ingest_normalized_messages([self._normalized("a", "warm-a"), self._normalized("b", "warm-b")])
+        batch = [self._normalized("a" if n % 2 else "b", f"n{n}") for n in range(10)]
+        # identity lookup + open conversations + one bulk insert (inside a savepoint)
+        with self.assertNumQueries(5):
+            messages = ingest_normalized_messages(batch)
+        self.assertEqual(len(messages), 10)
+
+
+class ResolutionCacheTests(TestCase):
+    key = (Channel.WHATSAPP, "cached")
+
+    def setUp(self):
+        self.addCleanup(clear_resolution_caches)
+
+    def test_cached_lookup_skips_identity_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            conversation = resolve_open_conversations([self.key])[self.key]
+        # only the primary-key load of the cached open conversation
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_open_conversations([self.key])[self.key].id, conversation.id)
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_closing_conversation_invalidates_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            conversation = resolve_open_conversations([self.key])[self.key]
+            close_conversation(conversation)
+        fresh = resolve_open_conversations([self.key])[self.key]
+        self.assertNotEqual(fresh.id, conversation.id)
+        self.assertEqual(Conversation.objects.filter(status="open").count(), 1)
+        self.assertEqual(Customer.objects.count(), 1)
+
+
+class _FakeStreamResponse:
+    ok = True
+
+    def __init__(self, events):
+        self.lines = [f"data: {json.dumps(event)}" for event in events]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self.lines:
+            yield line
+            yield ""
+
+
+@override_settings(LLM_ROUTER_STREAM=True)
+class RouterStreamingClientTests(TestCase):
+    def test_deltas_are_forwarded_and_joined(self):
+        agent = AgentProfile(name="a", model_backend="ollama", model_name="m")
+        events = [{"type": "delta", "delta": "Hel"}, {"type": "delta", "delta": "lo"}, {"type": "done", "output": "Hello"}]
+        seen = []
+        with patch("conversations.services.requests.post", return_value=_FakeStreamResponse(events)) as post:
+            self.assertEqual(_call_llm_router(agent, "hi", on_delta=seen.append, session_id="42"), "Hello")
+        self.assertTrue(post.call_args.kwargs["stream"])
+        self.assertTrue(post.call_args.kwargs["json"]["stream"])
+        self.assertEqual(post.call_args.kwargs["json"]["session_id"], "42")
+        self.assertEqual(seen, ["Hel", "lo"])
+
+    def test_error_event_yields_no_reply(self):
+        agent = AgentProfile(name="a", model_backend="ollama", model_name="m")
+        events = [{"type": "delta", "delta": "Hel"}, {"type": "error", "detail": "backend down"}]
+        with patch("conversations.services.requests.post", return_value=_FakeStreamResponse(events)):
+            self.assertIsNone(_call_llm_router(agent, "hi"))
+
+
+class NativeToolCallingTests(TestCase):
+    def setUp(self):
+        self.agent = AgentProfile.objects.create(
+            name="a", slug="a", system_prompt="Be brief.", tool_schema={"allowed_tools": ["refund_order"]}
+        )
+
+    def test_payload_offers_allowed_tools_natively(self):
+        payload = _router_payload(self.agent, "refund please")
+        self.assertEqual([tool["name"] for tool in payload["tools"]], ["refund_order"])
+        self.assertNotIn("respond as JSON", payload["messages"][0]["content"])
+        with override_settings(LLM_NATIVE_TOOLS=False):
+            legacy = _router_payload(self.agent, "refund please")
+        self.assertNotIn("tools", legacy)
+        self.assertIn("respond as JSON", legacy["messages"][0]["content"])
+
+    def test_prompt_prefix_is_stable_across_turns(self):
+        first = _router_payload(self.agent, "where is my order?", context="Recent messages:\n- inbound: hi")
+        second = _router_payload(self.agent, "thanks", context="Recent messages:\n- inbound: where is my order?")
+        self.assertEqual(first["messages"][0], second["messages"][0])
+        self.assertEqual(first["tools"], second["tools"])
+        self.assertEqual(first["messages"][0]["content"], "Be brief.")
+        self.assertTrue(second["messages"][1]["content"].startswith("Context:\nRecent messages:"))
+        self.assertTrue(second["messages"][1]["content"].endswith("Customer message:\nthanks"))
+        self.assertTrue(first["cache_prompt"])
+
+    def test_prompt_version_comes_from_the_loaded_agent(self):
+        with self.assertNumQueries(0):
+            version = _router_payload(self.agent, "hi")["prompt_version"]
+        self.assertEqual(version, _router_payload(self.agent, "hello")["prompt_version"])
+        AgentProfile.objects.filter(pk=self.agent.pk).update(system_prompt="Be very brief.")
+        self.agent.refresh_from_db()
+        self.assertNotEqual(_router_payload(self.agent, "hi")["prompt_version"], version)
+
+    @override_settings(LLM_ROUTER_STREAM=True)
+    def test_streamed_tool_calls_reach_the_callback(self):
+        call = {"tool": "refund_order", "arguments": {"order_id": 7}}
+        events = [{"type": "done", "output": "", "tool_calls": [call]}]
+        calls = []
+        with patch("conversations.services.requests.post", return_value=_FakeStreamResponse(events)):
+            self.assertIsNone(_call_llm_router(self.agent, "hi", on_tool_calls=calls.extend))
+        self.assertEqual(calls, [call])
+
+    def test_native_tool_call_is_executed_without_parsing_text(self):
+        conversation = Conversation.objects.create(customer=Customer.objects.create(), channel=Channel.WHATSAPP)
+        call = {"tool": "refund_order", "arguments": {"order_id": 7}}
+
+        def router(*_args, on_tool_calls=None, session_id=None, **_kwargs):
+            self.assertEqual(session_id, str(conversation.id))
+            on_tool_calls([call])
+            return None
+
+        with patch("conversations.services._select_agent", return_value=self.agent), patch(
+            "conversations.services._call_llm_router", side_effect=router
+        ), patch("conversations.services.execute_tool", return_value={"status": "refunded"}) as tool:
+            outbound = generate_reply(conversation, external_id="123", inbound_text="refund order 7")
+        tool.assert_called_once_with("refund_order", {"order_id": 7}, conversation, self.agent)
+        self.assertEqual(outbound.text, "Tool refund_order result: {'status': 'refunded'}")
+        self.assertEqual(outbound.raw_payload["tool_calls"], [call])
+
+
+    def test_well_formed_native_refund_reaches_the_commerce_tool(self):
+        customer = Customer.objects.create()
+        conversation = Conversation.objects.create(customer=customer, channel=Channel.WHATSAPP)
+        (spec,) = _router_payload(self.agent, "refund please")["tools"]
+        arguments = {"customer_id": customer.id, "order_id": 7, "confirmed": True}
+        self.assertEqual(set(spec["parameters"]["required"]), {"customer_id", "order_id", "confirmed"})
+        self.assertLessEqual(set(arguments), set(spec["parameters"]["properties"]))
+
+        def router(*_args, on_tool_calls=None, **_kwargs):
+            on_tool_calls([{"tool": "refund_order", "arguments": arguments}])
+            return None
+
+        with patch("conversations.services._select_agent", return_value=self.agent), patch(
+            "conversations.services._call_llm_router", side_effect=router
+        ), patch("commerce.tools.refund_order", return_value={"status": "queued"}) as refund:
+            outbound = generate_reply(conversation, external_id="123", inbound_text="yes, refund order 7")
+        refund.assert_called_once_with(7, None)
+        self.assertEqual(outbound.text, "Tool refund_order result: {'status': 'queued'}")
+
+    def test_back_office_tools_are_only_offered_when_allowed_by_name(self):
+        agent = AgentProfile.objects.create(name="b", slug="b", system_prompt="Be brief.")
+        names = [tool["name"] for tool in _router_payload(agent, "hi")["tools"]]
+        self.assertNotIn("capture_payment_intent", names)
+        self.assertIn("refund_order", names)
+        agent.tool_schema = {"allowed_tools": ["capture_payment_intent"]}
+        self.assertEqual([tool["name"] for tool in _router_payload(agent, "hi")["tools"]], ["capture_payment_intent"])
+
+
+class _FakeJSONResponse:
+    ok = True
+    status_code = 200
+    text = ""
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+@override_settings(LLM_ROUTER_STREAM=False)
+class CascadeTests(TestCase):
+    def setUp(self):
+        self.agent = AgentProfile.objects.create(
+            name="a", slug="a", system_prompt="Be brief.", model_name="large", cascade_model_name="small"
+        )
+        self.conversation = Conversation.objects.create(customer=Customer.objects.create(), channel=Channel.WHATSAPP)
+        self.models = []
+
+    def reply(self, small):
+        def post(url, json=None, timeout=None):
+            self.models.append(json["model"])
+            if json["model"] == "small":
+                return _FakeJSONResponse(small)
+            return _FakeJSONResponse({"output": "Let me check that order for you."})
+
+        with patch("conversations.services._select_agent", return_value=self.agent), patch(
+            "conversations.services.requests.post", side_effect=post
+        ) as post_mock:
+            outbound = generate_reply(self.conversation, external_id="123", inbound_text="thanks!")
+        return outbound, post_mock
+
+    def test_confident_small_model_answer_is_kept(self):
+        outbound, post = self.reply({"output": json.dumps({"answer": "You're welcome!", "confidence": 0.95})})
+        self.assertEqual(self.models, ["small"])
+        self.assertEqual(post.call_args.kwargs["json"]["json_schema"]["required"], ["answer", "confidence"])
+        self.assertEqual(outbound.text, "You're welcome!")
+        self.assertEqual(outbound.llm_metadata["model"], "small")
+        self.assertEqual(outbound.llm_metadata["cascade"]["outcome"], "accepted")
+
+    def test_tool_request_low_confidence_or_invalid_json_escalate(self):
+        cases = {
+            "tool_call": {"output": "", "tool_calls": [{"tool": "list_customer_orders", "arguments": {}}]},
+            "low_confidence": {"output": json.dumps({"answer": "Maybe?", "confidence": 0.2})},
+            "invalid_json": {"output": "Sure thing"},
+        }
+        for outcome, small in cases.items():
+            self.models = []
+            outbound, _ = self.reply(small)
+            self.assertEqual(self.models, ["small", "large"])
+            self.assertEqual(outbound.text, "Let me check that order for you.")
+            self.assertEqual(outbound.llm_metadata["model"], "large")
+            cascade = outbound.llm_metadata["cascade"]
+            self.assertEqual(cascade["outcome"], outcome)
+            self.assertEqual(cascade["saved_ms"], -cascade["small_ms"])
+            self.assertIn("large_ms", cascade)
+        self.assertEqual(outbound.raw_payload["tool_calls"], [])
+
+
+@override_settings(LLM_ROUTER_STREAM=False, LLM_FALLBACK_REPLY="One moment, a teammate will follow up.")
+class MalformedOutputTests(TestCase):
+    def setUp(self):
+        self.agent = AgentProfile.objects.create(name="a", slug="a", system_prompt="Be brief.")
+        self.conversation = Conversation.objects.create(customer=Customer.objects.create(), channel=Channel.WHATSAPP)
+
+    def reply(self, *responses):
+        with patch("conversations.services._select_agent", return_value=self.agent), patch(
+            "conversations.services.requests.post", side_effect=[_FakeJSONResponse(r) for r in responses]
+        ) as post:
+            outbound = generate_reply(self.conversation, external_id="123", inbound_text="refund order 7")
+        return outbound, post
+
+    def test_malformed_tool_json_is_retried_past_the_cache(self):
+        outbound, post = self.reply(
+            {"output": '{"tool": "refund_order", "arguments": {"order_id": 7'},
+            {"output": "Which order would you like refunded?"},
+        )
+        self.assertEqual(outbound.text, "Which order would you like refunded?")
+        self.assertNotIn("cache_control", post.call_args_list[0].kwargs["json"])
+        self.assertEqual(post.call_args_list[1].kwargs["json"]["cache_control"], {"bypass": True})
+
+    def test_output_flagged_twice_is_replaced_by_the_fallback_reply(self):
+        flagged = {"output": '{"answer": "Sure"', "meta": {"json_valid": False}}
+        outbound, post = self.reply(flagged, flagged)
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(outbound.text, "One moment, a teammate will follow up.")
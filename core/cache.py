@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from core.metrics import RESOLUTION_CACHE
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class ReadThroughCache:
+    """Two-tier id cache: an in-process LRU in front of Redis, in front of the database.
+
+    Values are primary keys, so a stale entry can at worst point at a row the
+    caller then fails to find and resolves again. Writes are deferred until the
+    surrounding transaction commits so rolled-back rows never get cached.
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._local: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _redis_key(self, key: Hashable) -> str:
+        parts = key if isinstance(key, tuple) else (key,)
+        return f"cache:{self.namespace}:" + ":".join(str(part) for part in parts)
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, int]:
+        keys = list(dict.fromkeys(keys))
+        found: Dict[Hashable, int] = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._local.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at < now:
+                    del self._local[key]
+                    continue
+                self._local.move_to_end(key)
+                found[key] = value
+        RESOLUTION_CACHE.labels(cache=self.namespace, result="local_hit").inc(len(found))
+
+        remote = [key for key in keys if key not in found]
+        client = get_redis()
+        if remote and client is not None:
+            try:
+                values = client.mget([self._redis_key(key) for key in remote])
+            except Exception as exc:  # noqa: broad-except
+                logger.warning("Resolution cache Redis unavailable (%s); reading from the database.", exc)
+                values = [None] * len(remote)
+            hits = {key: int(value) for key, value in zip(remote, values) if value is not None}
+            self._store_local(hits)
+            found.update(hits)
+            RESOLUTION_CACHE.labels(cache=self.namespace, result="redis_hit").inc(len(hits))
+        RESOLUTION_CACHE.labels(cache=self.namespace, result="miss").inc(len(keys) - len(found))
+        return found
+
+    def get(self, key: Hashable) -> Optional[int]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, mapping: Dict[Hashable, int]) -> None:
+        if mapping:
+            mapping = dict(mapping)
+            transaction.on_commit(lambda: self._write(mapping))
+
+    def _write(self, mapping: Dict[Hashable, int]) -> None:
+        self._store_local(mapping)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipe.set(self._redis_key(key), value, ex=settings.RESOLUTION_CACHE_TTL_SECONDS)
+            pipe.execute()
+        except Exception as exc:  # noqa: broad-except
+            logger.warning("Failed to populate resolution cache %s: %s", self.namespace, exc)
+
+    def _store_local(self, mapping: Dict[Hashable, int]) -> None:
+        maxsize = settings.RESOLUTION_CACHE_SIZE
+        if maxsize <= 0 or not mapping:
+            return
+        expires_at = time.monotonic() + settings.RESOLUTION_CACHE_TTL_SECONDS
+        with self._lock:
+            for key, value in mapping.items():
+                self._local[key] = (value, expires_at)
+                self._local.move_to_end(key)
+            while len(self._local) > maxsize:
+                self._local.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[Hashable]) -> None:
+        """Drop keys now and again after commit, so a concurrent reader cannot re-cache the old value."""
+        keys = list(keys)
+        if keys:
+            self._forget(keys)
+            transaction.on_commit(lambda: self._forget(keys))
+
+    def _forget(self, keys) -> None:
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.delete(*[self._redis_key(key) for key in keys])
+        except Exception as exc:  # noqa: broad-except
+            logger.warning("Failed to invalidate resolution cache %s: %s", self.namespace, exc)
+
+    def clear(self) -> None:
+        """Drop the in-process tier (Redis entries expire on their own)."""
+        with self._lock:
+            self._local.clear()
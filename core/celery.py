@@ -15,4 +15,14 @@ celery_app.conf.beat_schedule = {
         "schedule": 60 * 60 * 24,  # daily
         "options": {"expires": 60 * 60 * 2},
     },
+    "preload-agent-models": {
+        "task": "agents.tasks.preload_agent_models",
+        "schedule": 60,
+        "options": {"expires": 60},
+    },
+    "sample-shard-queue-depths": {
+        "task": "conversations.tasks.sample_shard_queue_depths",
+        "schedule": 15,
+        "options": {"expires": 15},
+    },
 }
@@ -21,6 +21,13 @@ class MessageDirection(models.TextChoices):
     OUTBOUND = "outbound", "Outbound"
 
 
+class DeliveryStatus(models.TextChoices):
+    SENT = "sent", "Sent"
+    DELIVERED = "delivered", "Delivered"
+    READ = "read", "Read"
+    FAILED = "failed", "Failed"
+
+
 class MessageType(models.TextChoices):
     TEXT = "text", "Text"
     IMAGE = "image", "Image"
@@ -80,3 +87,12 @@ class FollowUpStatus(models.TextChoices):
     SENT = "sent", "Sent"
     CANCELED = "canceled", "Canceled"
     FAILED = "failed", "Failed"
+
+
+class WebhookEventStatus(models.TextChoices):
+    RECEIVED = "received", "Received"
+    NORMALIZED = "normalized", "Normalized"
+    PERSISTED = "persisted", "Persisted"
+    ORCHESTRATED = "orchestrated", "Orchestrated"
+    SENT = "sent", "Sent"
+    FAILED = "failed", "Failed"
@@ -0,0 +1,59 @@
+import logging
+from typing import Iterable, Optional, Set
+
+from django.conf import settings
+
+from core.metrics import DEDUP_CHECKS
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def _key(namespace: str, key: str, tenant_id: Optional[str] = None) -> str:
+    return f"dedup:{namespace}:{tenant_id or '-'}:{key}"
+
+
+def claim_many(namespace: str, keys: Iterable[str], tenant_id: Optional[str] = None, ttl: Optional[int] = None) -> Set[str]:
+    """Claim a batch of ids with SET NX EX in one Redis round-trip; return the ids seen for the first time.
+
+    Redis is only a fast filter: without it (or if it is down) every id is
+    returned and the database uniqueness constraints decide.
+    """
+    keys = [k for k in dict.fromkeys(keys) if k]
+    if not keys:
+        return set()
+    client = get_redis()
+    if client is None:
+        return set(keys)
+    ttl = ttl or settings.DEDUP_TTL_SECONDS
+    try:
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(_key(namespace, key, tenant_id), 1, nx=True, ex=ttl)
+        results = pipe.execute()
+    except Exception as exc:  # noqa: broad-except
+        logger.warning("Dedup Redis unavailable (%s); falling back to database constraints.", exc)
+        return set(keys)
+    fresh = {key for key, created in zip(keys, results) if created}
+    DEDUP_CHECKS.labels(namespace=namespace, result="new").inc(len(fresh))
+    DEDUP_CHECKS.labels(namespace=namespace, result="duplicate").inc(len(keys) - len(fresh))
+    return fresh
+
+
+def claim(namespace: str, key: str, tenant_id: Optional[str] = None, ttl: Optional[int] = None) -> bool:
+    """True if ``key`` has not been seen in ``namespace`` within the TTL."""
+    if not key:
+        return True
+    return key in claim_many(namespace, [key], tenant_id=tenant_id, ttl=ttl)
+
+
+def release(namespace: str, keys: Iterable[str], tenant_id: Optional[str] = None) -> None:
+    """Forget claimed ids, e.g. when processing failed and a retry must get through."""
+    client = get_redis()
+    keys = [k for k in keys if k]
+    if client is None or not keys:
+        return
+    try:
+        client.delete(*[_key(namespace, key, tenant_id) for key in keys])
+    except Exception as exc:  # noqa: broad-except
+        logger.warning("Failed to release dedup keys in %s: %s", namespace, exc)
@@ -1,12 +1,47 @@
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 
 # Webhooks
 WEBHOOK_REQUESTS = Counter("webhook_requests_total", "Webhook requests", ["channel", "status"])
+WEBHOOK_ACK_LATENCY = Histogram(
+    "webhook_ack_latency_seconds",
+    "Time from request to acknowledgement at the webhook edge",
+    ["channel"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# Deduplication (Redis fast path)
+DEDUP_CHECKS = Counter("dedup_checks_total", "Dedup id checks", ["namespace", "result"])
+
+# Commerce order webhook coalescing
+ORDER_WEBHOOKS = Counter("order_webhooks_total", "Order webhook versions by outcome", ["result"])
+
+# Webhook replay
+REPLAYED_EVENTS = Counter("webhook_events_replayed_total", "Webhook events re-run by the replay engine", ["channel", "result"])
+
+# Identity / open-conversation resolution cache
+RESOLUTION_CACHE = Counter("resolution_cache_lookups_total", "Resolution cache lookups", ["cache", "result"])
+
+# Conversation shard dispatch
+SHARD_DISPATCHES = Counter("conversation_shard_dispatches_total", "Work items routed to a shard", ["shard"])
+SHARD_QUEUE_DEPTH = Gauge("conversation_shard_queue_depth", "Messages waiting in a shard queue", ["shard"])
+SHARD_WAIT = Histogram("conversation_shard_wait_seconds", "Time work waited in its shard queue", ["shard"])
+
+# Inbound burst debouncing
+DEBOUNCED_REPLIES = Counter("conversation_replies_debounced_total", "Deferred or superseded replies", ["outcome"])
 
 # LLM calls
 LLM_REQUESTS = Counter("llm_requests_total", "LLM requests", ["backend", "model"])
 LLM_LATENCY = Histogram("llm_latency_seconds", "LLM latency", ["backend", "model"])
 
+# Cascaded model routing (small model first)
+LLM_CASCADE_DECISIONS = Counter("llm_cascade_decisions_total", "Small-model-first turns by outcome", ["outcome"])
+LLM_CASCADE_SAVED = Counter(
+    "llm_cascade_latency_saved_seconds_total", "Estimated large-model latency avoided by accepted small-model answers"
+)
+LLM_CASCADE_OVERHEAD = Counter(
+    "llm_cascade_latency_overhead_seconds_total", "Small-model time spent on turns that escalated anyway"
+)
+
 # ASR/TTS
 ASR_REQUESTS = Counter("asr_requests_total", "ASR requests", ["model"])
 ASR_LATENCY = Histogram("asr_latency_seconds", "ASR latency", ["model"])
@@ -0,0 +1,20 @@
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_redis():
+    """Shared Redis client for hot-path dedup/caches; None when REDIS_URL is unset."""
+    url = getattr(settings, "REDIS_URL", "")
+    if not url:
+        return None
+    try:
+        import redis
+    except ImportError:
+        logger.warning("redis not installed; Redis-backed helpers disabled.")
+        return None
+    return redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
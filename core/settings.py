@@ -118,9 +118,19 @@ REST_FRAMEWORK = {
 }
 
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+# Redis used for hot-path dedup and caches (unset: fall back to the database).
+REDIS_URL = os.environ.get("REDIS_URL", "")
+DEDUP_TTL_SECONDS = int(os.environ.get("DEDUP_TTL_SECONDS", str(60 * 60 * 24)))
+RESOLUTION_CACHE_SIZE = int(os.environ.get("RESOLUTION_CACHE_SIZE", "10000"))
+RESOLUTION_CACHE_TTL_SECONDS = int(os.environ.get("RESOLUTION_CACHE_TTL_SECONDS", "300"))
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = int(os.environ.get("CELERY_TASK_TIME_LIMIT", "900"))
+# Opt-in: inbound ingest (normalize/persist) is hashed per conversation onto N queues, each
+# consumed by a single-process worker (see scripts/shard_workers.sh); replies always run on
+# the default queue. 0 keeps everything on the default queue.
+CONVERSATION_SHARDS = int(os.environ.get("CONVERSATION_SHARDS", "0"))
+CONVERSATION_SHARD_QUEUE_PREFIX = os.environ.get("CONVERSATION_SHARD_QUEUE_PREFIX", "conversations.shard")
 
 CSRF_TRUSTED_ORIGINS = [
     origin for origin in os.environ.get("DJANGO_CSRF_TRUSTED_ORIGINS", "").split(",") if origin
@@ -130,8 +140,23 @@ WHATSAPP_PHONE_NUMBER_ID = os.environ.get("WHATSAPP_PHONE_NUMBER_ID", "")
 WHATSAPP_TOKEN = os.environ.get("WHATSAPP_TOKEN", "")
 WHATSAPP_API_BASE = os.environ.get("WHATSAPP_API_BASE", "https://graph.facebook.com/v18.0")
 WHATSAPP_APP_SECRET = os.environ.get("WHATSAPP_APP_SECRET", "")
+# Ack WhatsApp webhooks immediately and run normalize/persist/orchestrate/send on Celery.
+WHATSAPP_ASYNC_WEBHOOKS = os.environ.get("WHATSAPP_ASYNC_WEBHOOKS", "false").lower() == "true"
+# Inbound messages arriving within this many seconds of each other are answered in one turn.
+CONVERSATION_DEBOUNCE_SECONDS = float(os.environ.get("CONVERSATION_DEBOUNCE_SECONDS", "3"))
 LLM_ROUTER_URL = os.environ.get("LLM_ROUTER_URL", "http://localhost:8001")
+# Consume /llm/infer as Server-Sent Events (per-token read timeout, deltas available to callers).
+LLM_ROUTER_STREAM = os.environ.get("LLM_ROUTER_STREAM", "true").lower() == "true"
+LLM_NATIVE_TOOLS = os.environ.get("LLM_NATIVE_TOOLS", "true").lower() == "true"
+# Ollama keep_alive sent with each chat request; empty uses the router's LLM_ROUTER_OLLAMA_KEEP_ALIVE.
+LLM_KEEP_ALIVE = os.environ.get("LLM_KEEP_ALIVE", "")
+# Sent instead of the model's output when it is malformed JSON twice in a row.
+LLM_FALLBACK_REPLY = os.environ.get(
+    "LLM_FALLBACK_REPLY", "Sorry, I couldn't process that just now. A member of our team will follow up shortly."
+)
 SHOPIFY_SHARED_SECRET = os.environ.get("SHOPIFY_SHARED_SECRET", "")
+ORDER_WEBHOOK_COALESCE_SECONDS = float(os.environ.get("ORDER_WEBHOOK_COALESCE_SECONDS", "5"))
+ORDER_WEBHOOK_FLUSH_BATCH = int(os.environ.get("ORDER_WEBHOOK_FLUSH_BATCH", "500"))
 MAGENTO_WEBHOOK_SECRET = os.environ.get("MAGENTO_WEBHOOK_SECRET", "")
 TTS_SERVICE_URL = os.environ.get("TTS_SERVICE_URL", "")
 TTS_VOICE = os.environ.get("TTS_VOICE", "")
@@ -0,0 +1,148 @@
+"""Single-statement INSERT ... ON CONFLICT helpers for hot ingest tables.
+
+Django's get_or_create/update_or_create issue a SELECT followed by an INSERT
+(or UPDATE) and raise IntegrityError when two workers race on the same key.
+``upsert`` turns that into one ``INSERT ... ON CONFLICT ... DO UPDATE ...
+RETURNING`` statement on PostgreSQL and SQLite >= 3.35, including conflicts on
+partial unique constraints. Other backends fall back to insert-then-select.
+"""
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import UniqueConstraint
+from django.db.models.sql.query import Query
+
+Unique = Union[str, Sequence[str]]
+
+
+def supports_native_upsert(connection) -> bool:
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def _unique_spec(model, unique: Unique):
+    """Return (field names, condition) for a constraint name or a tuple of unique field names."""
+    if not isinstance(unique, str):
+        return tuple(unique), None
+    for constraint in model._meta.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.name == unique:
+            return tuple(constraint.fields), constraint.condition
+    raise ValueError(f"{model.__name__} has no unique constraint named {unique!r}")
+
+
+@lru_cache(maxsize=None)
+def _conflict_target(model, unique: Unique, alias: str) -> Tuple[Tuple[str, ...], str]:
+    """Conflict columns plus the partial-index predicate exactly as Django emits it for the index."""
+    connection = connections[alias]
+    names, condition = _unique_spec(model, unique)
+    columns = tuple(model._meta.get_field(name).column for name in names)
+    if condition is None:
+        return columns, ""
+    query = Query(model=model, alias_cols=False)
+    where = query.build_where(condition)
+    sql, params = where.as_sql(query.get_compiler(connection=connection), connection)
+    schema_editor = connection.schema_editor()
+    return columns, sql % tuple(schema_editor.quote_value(p) for p in params)
+
+
+def _conflict_key(model, unique: Unique, instance) -> Dict[str, Any]:
+    names, _ = _unique_spec(model, unique)
+    attnames = [model._meta.get_field(name).attname for name in names]
+    return {attname: getattr(instance, attname) for attname in attnames}
+
+
+def upsert(model, rows: Iterable[Dict[str, Any]], unique: Unique, update_fields: Sequence[str] = ()) -> List[Any]:
+    """Insert ``rows`` or update the rows they conflict with; return the stored instances.
+
+    ``unique`` is either the name of a ``UniqueConstraint`` on the model (partial
+    constraints are supported) or field names backed by a full unique index.
+    ``update_fields`` are overwritten on conflict; otherwise the existing row is
+    kept and only ``updated_at`` is touched so RETURNING yields it.
+    """
+    if not isinstance(unique, str):
+        unique = tuple(unique)
+    # One statement may not touch the same row twice: keep the last row per key.
+    keyed = {}
+    for row in rows:
+        instance = model(**row)
+        keyed[tuple(_conflict_key(model, unique, instance).values())] = instance
+    instances = list(keyed.values())
+    if not instances:
+        return []
+    alias = router.db_for_write(model)
+    connection = connections[alias]
+    if not supports_native_upsert(connection):
+        return _upsert_fallback(model, instances, unique, update_fields, alias)
+
+    meta = model._meta
+    fields = [f for f in meta.concrete_fields if not f.primary_key]
+    quote = connection.ops.quote_name
+    placeholders, params = [], []
+    for instance in instances:
+        values = [f.get_db_prep_save(f.pre_save(instance, True), connection) for f in fields]
+        placeholders.append("(" + ", ".join(["%s"] * len(values)) + ")")
+        params.extend(values)
+
+    columns, predicate = _conflict_target(model, unique, alias)
+    updates = [meta.get_field(name).column for name in update_fields]
+    touch = next((f.column for f in fields if f.name == "updated_at"), None)
+    if touch and touch not in updates:
+        updates.append(touch)
+    updates = updates or [columns[0]]
+    returning = [meta.pk] + fields
+    sql = (
+        "INSERT INTO {table} ({cols}) VALUES {values} "
+        "ON CONFLICT ({target}){where} DO UPDATE SET {sets} RETURNING {ret}"
+    ).format(
+        table=quote(meta.db_table),
+        cols=", ".join(quote(f.column) for f in fields),
+        values=", ".join(placeholders),
+        target=", ".join(quote(c) for c in columns),
+        where=f" WHERE {predicate}" if predicate else "",
+        sets=", ".join(f"{quote(c)} = EXCLUDED.{quote(c)}" for c in updates),
+        ret=", ".join(quote(f.column) for f in returning),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        result = cursor.fetchall()
+
+    cols = [field.get_col(meta.db_table) for field in returning]
+    converters = [connection.ops.get_db_converters(col) + col.get_db_converters(connection) for col in cols]
+    stored = []
+    for row in result:
+        values = []
+        for value, col, col_converters in zip(row, cols, converters):
+            for converter in col_converters:
+                value = converter(value, col, connection)
+            values.append(value)
+        stored.append(model.from_db(alias, [f.attname for f in returning], values))
+    return stored
+
+
+def _upsert_fallback(model, instances, unique: Unique, update_fields: Sequence[str], alias: str) -> List[Any]:
+    """Insert-then-select per row for backends without ON CONFLICT ... RETURNING."""
+    _, condition = _unique_spec(model, unique)
+    stored = []
+    for instance in instances:
+        try:
+            with transaction.atomic(using=alias):
+                instance.save(using=alias, force_insert=True)
+            stored.append(instance)
+            continue
+        except IntegrityError:
+            pass
+        existing = model._default_manager.using(alias).filter(**_conflict_key(model, unique, instance))
+        if condition is not None:
+            existing = existing.filter(condition)
+        existing = existing.get()
+        if update_fields:
+            for name in update_fields:
+                attname = model._meta.get_field(name).attname
+                setattr(existing, attname, getattr(instance, attname))
+            existing.save(using=alias, update_fields=list(update_fields))
+        stored.append(existing)
+    return stored
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_identities(apps, schema_editor):
+    """Keep the oldest tenant-less identity per (channel, external id) so the constraint can be added.
+
+    The kept identity absorbs the others' metadata. Customers that only the
+    removed identities pointed at are left alone; they may still own
+    conversations and orders.
+    """
+    CustomerIdentity = apps.get_model('customers', 'CustomerIdentity')
+    duplicates = (
+        CustomerIdentity.objects.filter(tenant_id__isnull=True)
+        .order_by()
+        .values('channel', 'external_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        identities = list(
+            CustomerIdentity.objects.filter(
+                tenant_id__isnull=True, channel=group['channel'], external_id=group['external_id']
+            ).order_by('created_at', 'id')
+        )
+        keep, extra = identities[0], identities[1:]
+        metadata = {}
+        for identity in extra:
+            metadata.update(identity.metadata or {})
+        metadata.update(keep.metadata or {})
+        if metadata != keep.metadata:
+            keep.metadata = metadata
+            keep.save(update_fields=['metadata'])
+        CustomerIdentity.objects.filter(id__in=[identity.id for identity in extra]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_identities, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customeridentity',
+            constraint=models.UniqueConstraint(condition=models.Q(('tenant_id__isnull', True)), fields=('channel', 'external_id'), name='customers_identity_channel_ext_uniq'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 
 from core.constants import Channel
 from core.models import BaseModel
@@ -43,6 +44,14 @@ class CustomerIdentity(BaseModel):
         indexes = [
             models.Index(fields=["tenant_id", "channel", "external_id"]),
         ]
+        # unique_together does not cover tenant-less rows (NULLs are distinct).
+        constraints = [
+            models.UniqueConstraint(
+                fields=["channel", "external_id"],
+                condition=Q(tenant_id__isnull=True),
+                name="customers_identity_channel_ext_uniq",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.channel}:{self.external_id}"
@@ -0,0 +1,122 @@
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import ReadThroughCache
+from core.constants import ConversationStatus
+from core.upsert import upsert
+from customers.models import Customer, CustomerIdentity
+
+IDENTITY_UNIQUE = "customers_identity_channel_ext_uniq"
+
+# (channel, external_id) -> customer id
+IDENTITY_CACHE = ReadThroughCache("identity")
+
+
+def resolve_customer(channel: str, external_id: str, **customer_fields: Any) -> Customer:
+    """Resolve a customer by channel + external id, creating it only on a real cache and DB miss.
+
+    The identity is claimed with a single upsert, so two workers racing on a new
+    external id end up with the same customer; the loser's customer is removed.
+    A new identity that comes with a ``primary_email`` attaches to the existing
+    customer with that email, so a buyer seen by several stores stays one
+    customer. Like any lookup on ``primary_email``, this only matches while
+    emails are stored in clear (no ``ENCRYPTION_KEY``).
+    """
+    customer_id = IDENTITY_CACHE.get((channel, external_id))
+    if customer_id is not None:
+        customer = Customer.objects.filter(pk=customer_id).first()
+        if customer:
+            return customer
+    identity = (
+        CustomerIdentity.objects.select_related("customer")
+        .filter(channel=channel, external_id=external_id, tenant_id__isnull=True)
+        .first()
+    )
+    if identity:
+        IDENTITY_CACHE.set_many({(channel, external_id): identity.customer_id})
+        return identity.customer
+    email = customer_fields.get("primary_email")
+    customer = Customer.objects.filter(primary_email=email).order_by("id").first() if email else None
+    created = customer is None
+    if created:
+        customer = Customer.objects.create(**customer_fields)
+    (identity,) = upsert(
+        CustomerIdentity,
+        [{"customer_id": customer.id, "channel": channel, "external_id": external_id}],
+        IDENTITY_UNIQUE,
+    )
+    IDENTITY_CACHE.set_many({(channel, external_id): identity.customer_id})
+    if identity.customer_id != customer.id:
+        if created:
+            customer.delete()
+        return Customer.objects.get(pk=identity.customer_id)
+    return customer
+
+
+def resolve_customer_ids(keys: Iterable[Tuple[str, str]], use_cache: bool = True) -> Dict[Tuple[str, str], int]:
+    """Map (channel, external_id) -> customer id with set-based queries, creating missing identities."""
+    keys = set(keys)
+    found: Dict[Tuple[str, str], int] = IDENTITY_CACHE.get_many(keys) if use_cache else {}
+    by_channel: Dict[str, set] = defaultdict(set)
+    for channel, external_id in keys:
+        if (channel, external_id) not in found:
+            by_channel[channel].add(external_id)
+    loaded: Dict[Tuple[str, str], int] = {}
+    for channel, external_ids in by_channel.items():
+        rows = CustomerIdentity.objects.filter(
+            channel=channel, external_id__in=external_ids, tenant_id__isnull=True
+        ).values_list("external_id", "customer_id")
+        for external_id, customer_id in rows:
+            loaded[(channel, external_id)] = customer_id
+
+    missing = [key for key in keys if key not in found and key not in loaded]
+    if missing:
+        customers = Customer.objects.bulk_create([Customer() for _ in missing])
+        identities = upsert(
+            CustomerIdentity,
+            [
+                {"customer_id": customer.id, "channel": channel, "external_id": external_id}
+                for (channel, external_id), customer in zip(missing, customers)
+            ],
+            IDENTITY_UNIQUE,
+        )
+        for identity in identities:
+            loaded[(identity.channel, identity.external_id)] = identity.customer_id
+        # A concurrent ingest may have won some identities; drop our orphans.
+        orphans = [customer.id for key, customer in zip(missing, customers) if loaded.get(key) != customer.id]
+        if orphans:
+            Customer.objects.filter(id__in=orphans).delete()
+    IDENTITY_CACHE.set_many(loaded)
+    found.update(loaded)
+    return found
+
+
+def merge_customers(target: Customer, source: Customer) -> Customer:
+    """Move everything owned by ``source`` onto ``target`` and delete ``source``.
+
+    Open conversations of ``source`` on channels where ``target`` already has one
+    are resolved, keeping a single open conversation per customer and channel.
+    """
+    from conversations.services import forget_open_conversations
+
+    source_id = source.pk
+    with transaction.atomic():
+        identity_keys = list(source.identities.values_list("channel", "external_id"))
+        source_channels = set(source.conversations.values_list("channel", flat=True))
+        target_open = target.conversations.filter(status=ConversationStatus.OPEN).values_list("channel", flat=True)
+        for conversation in source.conversations.filter(status=ConversationStatus.OPEN, channel__in=list(target_open)):
+            conversation.status = ConversationStatus.RESOLVED
+            conversation.closed_at = timezone.now()
+            conversation.save(update_fields=["status", "closed_at", "updated_at"])
+        for relation in Customer._meta.related_objects:
+            if relation.one_to_many:
+                relation.related_model._base_manager.filter(**{relation.field.name: source}).update(
+                    **{relation.field.name: target}
+                )
+        source.delete()
+    IDENTITY_CACHE.invalidate(identity_keys)
+    forget_open_conversations([(source_id, channel) for channel in source_channels])
+    return target
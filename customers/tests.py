@@ -1,3 +1,90 @@
+from unittest.mock import patch
+
 from django.test import TestCase
 
-# Create your tests here.
+from channels import magento
+from channels.shopify import upsert_customer_and_order
+from commerce.models import Order
+from conversations.models import Conversation
+from conversations.services import OPEN_CONVERSATION_CACHE, resolve_open_conversations, send_outbound_message
+from core.constants import Channel
+from core.upsert import upsert
+from customers.models import Customer, CustomerIdentity
+from customers.services import IDENTITY_CACHE, IDENTITY_UNIQUE, merge_customers, resolve_customer
+
+
+class UpsertTests(TestCase):
+    def setUp(self):
+        self.addCleanup(IDENTITY_CACHE.clear)
+        self.addCleanup(OPEN_CONVERSATION_CACHE.clear)
+
+    def test_conflicting_upsert_returns_existing_row(self):
+        first = Customer.objects.create()
+        second = Customer.objects.create()
+        (identity,) = upsert(
+            CustomerIdentity,
+            [{"customer_id": first.id, "channel": Channel.WHATSAPP, "external_id": "111"}],
+            IDENTITY_UNIQUE,
+        )
+        (again,) = upsert(
+            CustomerIdentity,
+            [{"customer_id": second.id, "channel": Channel.WHATSAPP, "external_id": "111"}],
+            IDENTITY_UNIQUE,
+        )
+        self.assertEqual(again.pk, identity.pk)
+        self.assertEqual(again.customer_id, first.id)
+        self.assertEqual(CustomerIdentity.objects.count(), 1)
+
+    def test_fallback_without_on_conflict_support(self):
+        customer = Customer.objects.create()
+        row = {"customer_id": customer.id, "channel": Channel.WHATSAPP, "external_id": "444"}
+        with patch("core.upsert.supports_native_upsert", return_value=False):
+            (identity,) = upsert(CustomerIdentity, [row], IDENTITY_UNIQUE)
+            (again,) = upsert(CustomerIdentity, [row], IDENTITY_UNIQUE)
+        self.assertEqual(again.pk, identity.pk)
+
+    def test_resolve_customer_creates_only_on_miss(self):
+        customer = resolve_customer(Channel.WHATSAPP, "222")
+        self.assertEqual(resolve_customer(Channel.WHATSAPP, "222").id, customer.id)
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_single_open_conversation_per_channel(self):
+        key = (Channel.WHATSAPP, "333")
+        conversation = resolve_open_conversations([key])[key]
+        ctx, _ = send_outbound_message(Channel.WHATSAPP, "333", "hello")
+        self.assertEqual(ctx["conversation_id"], conversation.id)
+        self.assertEqual(Conversation.objects.filter(status="open").count(), 1)
+
+    def test_shopify_order_webhook_is_idempotent(self):
+        payload = {
+            "id": 42,
+            "financial_status": "pending",
+            "total_price": "10.00",
+            "customer": {"id": 7, "email": "a@example.com"},
+        }
+        upsert_customer_and_order(payload)
+        upsert_customer_and_order({**payload, "financial_status": "paid"})
+        order = Order.objects.get()
+        self.assertEqual(order.status, "paid")
+        self.assertEqual(CustomerIdentity.objects.filter(channel=Channel.SHOPIFY).count(), 1)
+
+    def test_same_buyer_across_stores_is_one_customer(self):
+        upsert_customer_and_order({"id": 43, "customer": {"id": 7, "email": "b@example.com"}})
+        upsert_customer_and_order({"id": 44, "customer": {"id": 8, "email": "b@example.com"}})
+        magento.upsert_customer_and_order({"entity_id": 45, "customer": {"id": 9, "email": "b@example.com"}})
+        upsert_customer_and_order({"id": 46, "customer": {"id": 10, "email": "c@example.com"}})
+        self.assertEqual(Customer.objects.count(), 2)
+        self.assertEqual(CustomerIdentity.objects.count(), 4)
+        self.assertEqual(len({order.customer_id for order in Order.objects.exclude(external_order_id="46")}), 1)
+
+    def test_merge_moves_identities_and_invalidates_cache(self):
+        source_key, target_key = (Channel.WHATSAPP, "555"), (Channel.WHATSAPP, "666")
+        with self.captureOnCommitCallbacks(execute=True):
+            conversations = resolve_open_conversations([source_key, target_key])
+        source = conversations[source_key].customer
+        target = conversations[target_key].customer
+        with self.captureOnCommitCallbacks(execute=True):
+            merge_customers(target, source)
+        self.assertEqual(resolve_open_conversations([source_key])[source_key].id, conversations[target_key].id)
+        self.assertFalse(Customer.objects.filter(pk=source.pk).exists())
+        self.assertEqual(Conversation.objects.filter(status="open").count(), 1)
@@ -17,6 +17,15 @@ class LLMInferenceLog(BaseModel):
     response_payload = models.JSONField(default=dict, blank=True)
     latency_ms = models.IntegerField(null=True, blank=True)
     success = models.BooleanField(default=True)
+    # Router telemetry
+    endpoint = models.CharField(max_length=255, blank=True)
+    priority = models.CharField(max_length=16, blank=True)
+    queue_ms = models.IntegerField(null=True, blank=True)
+    ttft_ms = models.IntegerField(null=True, blank=True)
+    prompt_tokens = models.IntegerField(null=True, blank=True)
+    completion_tokens = models.IntegerField(null=True, blank=True)
+    tokens_per_second = models.FloatField(null=True, blank=True)
+    cache_hit = models.BooleanField(default=False)
 
     class Meta:
         indexes = [
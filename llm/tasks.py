@@ -0,0 +1,58 @@
+import uuid
+from typing import Any, Dict, List, Optional
+
+from celery import shared_task
+
+from agents.models import AgentProfile
+from llm.models import LLMInferenceLog
+
+
+def _tenant(value: Optional[str]) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(value) if value else None
+    except ValueError:
+        return None
+
+
+def _int(value: Optional[float]) -> Optional[int]:
+    return round(value) if value is not None else None
+
+
+@shared_task
+def record_inference_logs(records: List[Dict[str, Any]]) -> int:
+    """Persist a batch of LLM router telemetry records (see ``llm_router.telemetry``)."""
+    agent_ids = {r["agent_id"] for r in records if r.get("agent_id")}
+    known_agents = set(AgentProfile.objects.filter(id__in=agent_ids).values_list("id", flat=True))
+    LLMInferenceLog.objects.bulk_create(
+        [
+            LLMInferenceLog(
+                tenant_id=_tenant(r.get("tenant")),
+                agent_id=r.get("agent_id") if r.get("agent_id") in known_agents else None,
+                model_backend=r["backend"],
+                model_name=r["model"],
+                request_payload=r.get("request") or {},
+                response_payload={
+                    "cache": r.get("cache"),
+                    "deduplicated": r.get("deduplicated"),
+                    "hedged": r.get("hedged", False),
+                    "affinity": r.get("affinity") or None,
+                    "prefill_ms": r.get("prefill_ms"),
+                    "cached_tokens": r.get("cached_tokens"),
+                    "error": r.get("error"),
+                },
+                latency_ms=_int(r.get("latency_ms")),
+                success=r.get("success", True),
+                endpoint=r.get("endpoint") or "",
+                priority=r.get("priority") or "",
+                queue_ms=_int(r.get("queue_ms")),
+                ttft_ms=_int(r.get("ttft_ms")),
+                prompt_tokens=r.get("prompt_tokens"),
+                completion_tokens=r.get("completion_tokens"),
+                tokens_per_second=r.get("tokens_per_second"),
+                cache_hit=r.get("cache") == "hit",
+            )
+            for r in records
+        ],
+        batch_size=500,
+    )
+    return len(records)
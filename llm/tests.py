@@ -1,3 +1,61 @@
+import datetime
+
 from django.test import TestCase
 
-# Create your tests here.
+from agents.models import AgentProfile
+from analytics.models import DailyKPI
+from analytics.tasks import compute_daily_kpis
+from conversations.models import Conversation
+from core.constants import Channel
+from customers.models import Customer
+from llm.models import LLMInferenceLog
+from llm.tasks import record_inference_logs
+
+
+def _record(**overrides):
+    record = {
+        "backend": "ollama",
+        "model": "m",
+        "priority": "interactive",
+        "tenant": None,
+        "agent_id": None,
+        "endpoint": "http://ollama-a",
+        "cache": "miss",
+        "deduplicated": False,
+        "success": True,
+        "error": "",
+        "queue_ms": 3.4,
+        "ttft_ms": 180.2,
+        "latency_ms": 900.7,
+        "prompt_tokens": 120,
+        "completion_tokens": 40,
+        "tokens_per_second": 55.5,
+        "request": {"messages": 2},
+    }
+    record.update(overrides)
+    return record
+
+
+class RecordInferenceLogsTests(TestCase):
+    def test_batch_is_persisted_with_router_telemetry(self):
+        agent = AgentProfile.objects.create(name="A", slug="a", system_prompt="-")
+        tenant = "6f1c2b9e-4c43-4d8b-9a52-3c1b1f2d7e10"
+        written = record_inference_logs(
+            [
+                _record(agent_id=agent.id, tenant=tenant),
+                _record(agent_id=999999, tenant="not-a-uuid", cache="hit", latency_ms=1.2, ttft_ms=1.2),
+            ]
+        )
+        self.assertEqual(written, 2)
+        first, second = LLMInferenceLog.objects.order_by("id")
+        self.assertEqual((first.agent_id, str(first.tenant_id)), (agent.id, tenant))
+        self.assertEqual((first.latency_ms, first.ttft_ms, first.queue_ms), (901, 180, 3))
+        self.assertEqual((first.prompt_tokens, first.completion_tokens, first.endpoint), (120, 40, "http://ollama-a"))
+        self.assertEqual((second.agent_id, second.tenant_id, second.cache_hit), (None, None, True))
+
+    def test_daily_kpis_average_logged_latency(self):
+        Conversation.objects.create(customer=Customer.objects.create(), channel=Channel.WHATSAPP)
+        record_inference_logs([_record(latency_ms=100), _record(latency_ms=300)])
+        today = datetime.date.today()
+        compute_daily_kpis(today.isoformat())
+        self.assertEqual(DailyKPI.objects.get(date=today).avg_llm_latency_ms, 200)
@@ -0,0 +1,165 @@
+"""Per-backend admission control with priority classes and per-tenant fair queuing.
+
+Each backend has a concurrency cap. Requests above the cap wait in one queue per
+priority; within a priority, tenants are served round-robin so a single tenant's
+backfill cannot starve the others. A request that cannot start within its
+priority's queue budget is shed with ``Overloaded`` (429 + Retry-After).
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from llm_router.config import RouterConfig
+from llm_router.pool import NoBackendAvailable
+from llm_router.schemas import Backend, Priority
+
+PRIORITY_ORDER = (Priority.INTERACTIVE, Priority.BACKGROUND, Priority.BATCH)
+
+
+class Overloaded(Exception):
+    """The queue for this priority is over its deadline budget."""
+
+    def __init__(self, backend: Backend, priority: Priority, retry_after: int):
+        super().__init__(f"{backend.value} is overloaded for {priority.value} requests")
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A granted concurrency slot; ``release()`` is idempotent."""
+
+    def __init__(self, queue: "AdmissionQueue", queued_at: float):
+        self.queue = queue
+        self.queue_wait = time.monotonic() - queued_at
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.queue._release(time.monotonic() - self.started)
+
+
+class _Waiter:
+    __slots__ = ("future", "queued_at")
+
+    def __init__(self, future: asyncio.Future, queued_at: float):
+        self.future = future
+        self.queued_at = queued_at
+
+
+class AdmissionQueue:
+    """Concurrency cap and waiting room for one backend."""
+
+    def __init__(self, backend: Backend, limit: int, budgets: Dict[Priority, float]):
+        self.backend = backend
+        self.limit = limit
+        self.budgets = budgets
+        self.active = 0
+        # Exponentially weighted average slot hold time, used for Retry-After.
+        self.avg_hold = 1.0
+        self.waiting: Dict[Priority, "OrderedDict[str, Deque[_Waiter]]"] = {p: OrderedDict() for p in PRIORITY_ORDER}
+
+    def queued(self, priority: Optional[Priority] = None) -> int:
+        priorities = [priority] if priority else PRIORITY_ORDER
+        return sum(len(waiters) for p in priorities for waiters in self.waiting[p].values())
+
+    def _oldest_wait(self, priority: Priority, now: float) -> float:
+        return max((now - waiters[0].queued_at for waiters in self.waiting[priority].values() if waiters), default=0.0)
+
+    def _retry_after(self, priority: Priority) -> int:
+        ahead = sum(self.queued(p) for p in PRIORITY_ORDER[: PRIORITY_ORDER.index(priority) + 1])
+        return max(1, math.ceil(self.avg_hold * (ahead + 1) / max(self.limit, 1)))
+
+    def try_acquire(self) -> Optional[Slot]:
+        """A slot only if one is free right now and nobody is waiting for it; never queues."""
+        if self.active < self.limit and not self.queued():
+            self.active += 1
+            return Slot(self, time.monotonic())
+        return None
+
+    async def acquire(self, priority: Priority, tenant: str) -> Slot:
+        slot = self.try_acquire()
+        if slot is not None:
+            return slot
+        now = time.monotonic()
+        budget = self.budgets[priority]
+        # The queue is already behind its budget: shed instead of queueing more.
+        if self._oldest_wait(priority, now) >= budget:
+            raise Overloaded(self.backend, priority, self._retry_after(priority))
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), now)
+        self.waiting[priority].setdefault(tenant, deque()).append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=budget)
+        except asyncio.TimeoutError:
+            if not self._withdraw(priority, tenant, waiter):
+                raise Overloaded(self.backend, priority, self._retry_after(priority))
+        except asyncio.CancelledError:
+            if self._withdraw(priority, tenant, waiter):
+                self._release(0.0, hold=False)
+            raise
+        return Slot(self, now)
+
+    def _withdraw(self, priority: Priority, tenant: str, waiter: _Waiter) -> bool:
+        """Take a waiter out of the queue; True if it had already been granted a slot."""
+        if waiter.future.done():
+            return True
+        waiter.future.cancel()
+        waiters = self.waiting[priority].get(tenant)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self.waiting[priority][tenant]
+        return False
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in PRIORITY_ORDER:
+            tenants = self.waiting[priority]
+            while tenants:
+                tenant, waiters = next(iter(tenants.items()))
+                waiter = waiters.popleft()
+                # Rotate the tenant to the back so the next grant goes to someone else.
+                del tenants[tenant]
+                if waiters:
+                    tenants[tenant] = waiters
+                if not waiter.future.done():
+                    return waiter
+        return None
+
+    def _release(self, held: float, hold: bool = True) -> None:
+        if hold:
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * held
+        waiter = self._next_waiter()
+        if waiter is None:
+            self.active -= 1
+        else:
+            # The slot passes directly to the waiter; ``active`` is unchanged.
+            waiter.future.set_result(None)
+
+    def state(self) -> Dict[str, object]:
+        return {
+            "backend": self.backend.value,
+            "limit": self.limit,
+            "active": self.active,
+            "queued": {p.value: self.queued(p) for p in PRIORITY_ORDER},
+        }
+
+
+class Admission:
+    def __init__(self, config: RouterConfig):
+        self.queues = {
+            backend: AdmissionQueue(backend, config.concurrency_for(backend), config.queue_budgets)
+            for backend in config.backends
+        }
+
+    async def acquire(self, backend: Backend, priority: Priority, tenant: Optional[str]) -> Slot:
+        queue = self.queues.get(backend)
+        if queue is None:
+            raise NoBackendAvailable(f"{backend.value} is not configured")
+        return await queue.acquire(priority, tenant or "")
+
+    def try_acquire(self, backend: Backend) -> Optional[Slot]:
+        queue = self.queues.get(backend)
+        return queue.try_acquire() if queue is not None else None
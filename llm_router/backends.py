@@ -0,0 +1,358 @@
+"""Async backend clients with one persistent, bounded connection pool per endpoint."""
+import json
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from llm_router.config import BackendConfig, RouterConfig
+from llm_router.schemas import Backend
+
+logger = logging.getLogger(__name__)
+
+
+class BackendError(Exception):
+    """The backend could not be reached or answered with an error status."""
+
+
+@dataclass
+class Chunk:
+    """One normalized streaming event: a text delta, or the final usage once ``done``."""
+
+    delta: str = ""
+    done: bool = False
+    usage: Dict[str, int] = field(default_factory=dict)
+    # Parsed native tool calls ({"tool", "arguments"}), set on the ``done`` chunk.
+    tool_calls: List[Dict[str, Any]] = field(default_factory=list)
+    # The stream closed without the backend's own done marker, so the output may be cut short.
+    truncated: bool = False
+
+
+@dataclass(frozen=True)
+class Constraints:
+    """Tools and output constraints passed through to the backend's native support."""
+
+    tools: Tuple[Dict[str, Any], ...] = ()
+    tool_choice: Optional[str] = None
+    json_mode: bool = False
+    json_schema: Optional[Dict[str, Any]] = None
+    grammar: Optional[str] = None
+
+    def openai_tools(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "type": "function",
+                "function": {
+                    "name": tool["name"],
+                    "description": tool.get("description") or "",
+                    "parameters": tool.get("parameters") or {"type": "object", "properties": {}},
+                },
+            }
+            for tool in self.tools
+        ]
+
+
+@dataclass(frozen=True)
+class CacheHints:
+    """Prompt-cache hints: reuse the KV cache of a shared prefix, and how long Ollama keeps the model loaded."""
+
+    cache_prompt: bool = True
+    keep_alive: Optional[str] = None
+
+
+class BackendClient(ABC):
+    """Keeps an ``httpx.AsyncClient`` alive for the process so connections are reused.
+
+    Generations are always streamed from the backend; non-streaming callers
+    aggregate the chunks, so every request has a measurable first token.
+    """
+
+    health_path = "/health"
+
+    def __init__(
+        self,
+        backend: Backend,
+        url: str,
+        router: RouterConfig,
+        api_key: str = "",
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.backend = backend
+        self.url = url
+        self.router = router
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.http = httpx.AsyncClient(
+            base_url=url,
+            headers=headers,
+            timeout=httpx.Timeout(router.timeout, connect=router.connect_timeout),
+            limits=httpx.Limits(max_connections=router.max_connections, max_keepalive_connections=router.max_keepalive),
+            transport=transport,
+        )
+
+    @abstractmethod
+    def _request(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        constraints: Constraints,
+        hints: CacheHints,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """The path and JSON body of a streaming generation request."""
+
+    @abstractmethod
+    def _parse_line(self, line: str, state: Dict[str, Any]) -> Optional[Chunk]:
+        """Turn one line of the backend stream into a Chunk; ``state`` lives for one generation."""
+
+    async def generate(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        constraints: Constraints = Constraints(),
+        hints: CacheHints = CacheHints(),
+    ) -> AsyncIterator[Chunk]:
+        path, body = self._request(model, messages, temperature, max_tokens, constraints, hints)
+        state: Dict[str, Any] = {}
+        try:
+            async with self.http.stream("POST", path, json=body) as resp:
+                if resp.status_code >= 400:
+                    await resp.aread()
+                    raise BackendError(f"{self.backend.value} returned {resp.status_code}: {resp.text[:200]}")
+                async for line in resp.aiter_lines():
+                    chunk = self._parse_line(line.strip(), state) if line.strip() else None
+                    if chunk is None:
+                        continue
+                    yield chunk
+                    if chunk.done:
+                        return
+        except httpx.HTTPError as exc:
+            raise BackendError(f"{self.backend.value} unreachable: {exc}") from exc
+        yield Chunk(done=True, truncated=True)
+
+    async def running_models(self) -> Optional[List[str]]:
+        """Models currently loaded on this endpoint, or None when the backend cannot tell."""
+        return None
+
+    async def load(self, model: str) -> bool:
+        """Ask the endpoint to load ``model``; False when the backend cannot load models on demand."""
+        return False
+
+    async def probe(self) -> bool:
+        """Active health check used by the endpoint pool."""
+        try:
+            resp = await self.http.get(self.health_path, timeout=2)
+            return resp.status_code < 400
+        except httpx.HTTPError:
+            return False
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+class OllamaClient(BackendClient):
+    """Ollama streams newline-delimited JSON objects."""
+
+    health_path = "/api/tags"
+
+    def _request(self, model, messages, temperature, max_tokens, constraints, hints):
+        # Ollama reuses the KV cache of a matching prefix on its own; keep_alive keeps it (and the model) around.
+        body = {
+            "model": model,
+            "messages": messages,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+            "stream": True,
+            "keep_alive": hints.keep_alive or self.router.ollama_keep_alive,
+        }
+        if constraints.tools:
+            body["tools"] = constraints.openai_tools()
+        # Ollama has no grammar support; a JSON schema or plain JSON mode is the closest constraint.
+        if constraints.json_schema:
+            body["format"] = constraints.json_schema
+        elif constraints.json_mode:
+            body["format"] = "json"
+        return "/api/chat", body
+
+    def _parse_line(self, line, state):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return None
+        message = data.get("message") or {}
+        for call in message.get("tool_calls") or []:
+            function = call.get("function") or {}
+            arguments = function.get("arguments") or {}
+            if isinstance(arguments, str):
+                arguments = _json_arguments(function.get("name"), arguments)
+            if arguments is not None:
+                state.setdefault("tool_calls", []).append({"tool": function.get("name"), "arguments": arguments})
+        delta = message.get("content") or ""
+        if data.get("done"):
+            usage = {
+                "prompt_tokens": data.get("prompt_eval_count") or 0,
+                "completion_tokens": data.get("eval_count") or 0,
+            }
+            if data.get("prompt_eval_duration"):
+                usage["prompt_ms"] = round(data["prompt_eval_duration"] / 1e6, 1)
+            return Chunk(delta=delta, done=True, usage=usage, tool_calls=state.get("tool_calls", []))
+        return Chunk(delta=delta)
+
+    async def running_models(self) -> Optional[List[str]]:
+        try:
+            resp = await self.http.get("/api/ps", timeout=5)
+            if resp.status_code >= 400:
+                return None
+            names = [m.get("name") or m.get("model") for m in resp.json().get("models", [])]
+            # Requests may omit the default tag.
+            return names + [name[: -len(":latest")] for name in names if name.endswith(":latest")]
+        except (httpx.HTTPError, ValueError):
+            return None
+
+    async def load(self, model: str) -> bool:
+        # A generate call without a prompt loads the model and pins it for keep_alive.
+        try:
+            resp = await self.http.post(
+                "/api/generate",
+                json={"model": model, "keep_alive": self.router.ollama_keep_alive},
+                timeout=httpx.Timeout(self.router.model_load_timeout, connect=self.router.connect_timeout),
+            )
+            return resp.status_code < 400
+        except httpx.HTTPError:
+            return False
+
+    async def list_models(self) -> Dict[str, Any]:
+        try:
+            resp = await self.http.get("/api/tags", timeout=5)
+            if resp.status_code >= 400:
+                return {"models": [], "error": resp.text, "status_code": resp.status_code}
+            return {"models": resp.json().get("models", [])}
+        except (httpx.HTTPError, ValueError) as exc:
+            return {"models": [], "error": str(exc)}
+
+
+class OpenAICompatibleClient(BackendClient):
+    """vLLM and llama.cpp both expose /v1/chat/completions with SSE streaming."""
+
+    # Request field carrying a GBNF grammar; differs per server.
+    grammar_field = "grammar"
+    # Per-request prefix-cache switch, for servers that have one (vLLM's prefix caching is server-wide).
+    cache_prompt_field: Optional[str] = None
+
+    def _request(self, model, messages, temperature, max_tokens, constraints, hints):
+        body = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        if constraints.tools:
+            body["tools"] = constraints.openai_tools()
+            if constraints.tool_choice:
+                body["tool_choice"] = constraints.tool_choice
+        if constraints.grammar:
+            body[self.grammar_field] = constraints.grammar
+        elif constraints.json_schema:
+            body["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": constraints.json_schema},
+            }
+        elif constraints.json_mode:
+            body["response_format"] = {"type": "json_object"}
+        if self.cache_prompt_field:
+            body[self.cache_prompt_field] = hints.cache_prompt
+        return "/v1/chat/completions", body
+
+    async def running_models(self) -> Optional[List[str]]:
+        # vLLM and llama.cpp servers hold the models they serve for their whole lifetime.
+        try:
+            resp = await self.http.get("/v1/models", timeout=5)
+            if resp.status_code >= 400:
+                return None
+            return [m.get("id") for m in resp.json().get("data", [])]
+        except (httpx.HTTPError, ValueError):
+            return None
+
+    def _parse_line(self, line, state):
+        if not line.startswith("data:"):
+            return None
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            usage = {**state.get("usage", {}), **state.get("prefill", {})}
+            return Chunk(done=True, usage=usage, tool_calls=_finish_tool_calls(state))
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return None
+        if event.get("usage"):
+            state["usage"] = {
+                "prompt_tokens": event["usage"].get("prompt_tokens") or 0,
+                "completion_tokens": event["usage"].get("completion_tokens") or 0,
+            }
+            cached = (event["usage"].get("prompt_tokens_details") or {}).get("cached_tokens")
+            if cached is not None:
+                state.setdefault("prefill", {})["cached_tokens"] = cached
+        # llama.cpp reports prompt processing time and the tokens it reused from its cache.
+        timings = event.get("timings") or {}
+        if "prompt_ms" in timings:
+            state.setdefault("prefill", {})["prompt_ms"] = round(timings["prompt_ms"], 1)
+        if "cache_n" in timings:
+            state.setdefault("prefill", {})["cached_tokens"] = timings["cache_n"]
+        choices = event.get("choices") or [{}]
+        delta = choices[0].get("delta") or {}
+        # Tool calls stream as fragments keyed by index; arguments arrive as partial JSON text.
+        for fragment in delta.get("tool_calls") or []:
+            call = state.setdefault("calls", {}).setdefault(fragment.get("index", 0), {"name": "", "arguments": ""})
+            function = fragment.get("function") or {}
+            call["name"] += function.get("name") or ""
+            call["arguments"] += function.get("arguments") or ""
+        return Chunk(delta=delta.get("content") or "")
+
+
+class VLLMClient(OpenAICompatibleClient):
+    """vLLM enforces JSON schemas and grammars with guided decoding."""
+
+    grammar_field = "guided_grammar"
+
+
+class LlamaCppClient(OpenAICompatibleClient):
+    """llama.cpp server constrains sampling with a GBNF ``grammar`` and caches prompts per slot."""
+
+    grammar_field = "grammar"
+    cache_prompt_field = "cache_prompt"
+
+
+def _json_arguments(name: Optional[str], raw: str) -> Optional[Dict[str, Any]]:
+    try:
+        arguments = json.loads(raw) if raw.strip() else {}
+    except ValueError:
+        logger.warning("Dropping tool call %s with malformed arguments: %.200s", name, raw)
+        return None
+    return arguments if isinstance(arguments, dict) else None
+
+
+def _finish_tool_calls(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    calls = []
+    for _, call in sorted(state.get("calls", {}).items()):
+        arguments = _json_arguments(call["name"], call["arguments"])
+        if call["name"] and arguments is not None:
+            calls.append({"tool": call["name"], "arguments": arguments})
+    return calls
+
+
+CLIENT_CLASSES = {
+    Backend.OLLAMA: OllamaClient,
+    Backend.VLLM: VLLMClient,
+    Backend.LLAMACPP: LlamaCppClient,
+}
+
+
+def build_client(
+    config: BackendConfig, url: str, router: RouterConfig, transport: Optional[httpx.AsyncBaseTransport] = None
+) -> BackendClient:
+    return CLIENT_CLASSES[config.backend](config.backend, url, router, api_key=config.api_key, transport=transport)
@@ -0,0 +1,207 @@
+"""Offline batch jobs: persisted on disk, run at batch priority, resumable after a restart.
+
+Each job is a directory under ``batch_dir``::
+
+    <job id>/job.json         status and counters
+    <job id>/requests.jsonl   the submitted items, one per line
+    <job id>/results.jsonl    one line per finished item, appended as items finish
+
+Results are keyed by item ``index``, so on startup unfinished jobs are picked up
+again and only the items without a result line are run. Items go through the
+normal admission queues at ``Priority.BATCH``, which only get slots the
+interactive and background queues leave idle, and run ``batch_concurrency`` at
+a time so continuous-batching servers can pack them.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from llm_router.schemas import BatchItem
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ("queued", "running")
+
+
+class BatchStore:
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _dir(self, job_id: str) -> Path:
+        return self.root / job_id
+
+    def create(self, items: List[BatchItem]) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        path = self._dir(job_id)
+        path.mkdir(parents=True)
+        with open(path / "requests.jsonl", "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(item.model_dump_json(exclude_defaults=True) + "\n")
+        now = time.time()
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "total": len(items),
+            "completed": 0,
+            "failed": 0,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+        }
+        self.save(job)
+        return job
+
+    def save(self, job: Dict[str, Any]) -> None:
+        job["updated_at"] = time.time()
+        target = self._dir(job["id"]) / "job.json"
+        # Write-then-rename so a crash never leaves a truncated job file.
+        partial = target.with_suffix(".tmp")
+        partial.write_text(json.dumps(job), encoding="utf-8")
+        os.replace(partial, target)
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads((self._dir(job_id) / "job.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def items(self, job_id: str) -> List[BatchItem]:
+        with open(self._dir(job_id) / "requests.jsonl", encoding="utf-8") as f:
+            return [BatchItem.model_validate_json(line) for line in f if line.strip()]
+
+    def results_path(self, job_id: str) -> Path:
+        return self._dir(job_id) / "results.jsonl"
+
+    def results(self, job_id: str) -> List[Dict[str, Any]]:
+        """Finished result lines; a torn last line from a crash is dropped from the file."""
+        path = self.results_path(job_id)
+        if not path.exists():
+            return []
+        results, torn = [], False
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    torn = True
+        if torn:
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(result) + "\n" for result in results)
+        return results
+
+    def append_result(self, job_id: str, result: Dict[str, Any]) -> None:
+        with open(self.results_path(job_id), "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        if not self.root.exists():
+            return []
+        jobs = [self.load(path.name) for path in self.root.iterdir() if path.is_dir()]
+        return sorted((job for job in jobs if job and job["status"] in ACTIVE), key=lambda job: job["created_at"])
+
+
+class BatchRunner:
+    """Runs jobs one at a time, in submission order, with ``execute`` per item."""
+
+    def __init__(self, store: BatchStore, execute: Callable[[BatchItem], Awaitable[Dict[str, Any]]], concurrency: int):
+        self.store = store
+        self.execute = execute
+        self.concurrency = concurrency
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+
+    def submit(self, items: List[BatchItem]) -> Dict[str, Any]:
+        job = self.store.create(items)
+        self.jobs[job["id"]] = job
+        self._queue.put_nowait(job["id"])
+        return job
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(job_id) or self.store.load(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.status(job_id)
+        if job is not None and job["status"] in ACTIVE:
+            job["status"] = "cancelled"
+            job["finished_at"] = time.time()
+            self.store.save(job)
+        return job
+
+    def resume(self) -> None:
+        for job in self.store.unfinished():
+            if job["id"] in self.jobs:
+                continue
+            logger.info("Resuming batch job %s", job["id"])
+            self.jobs[job["id"]] = job
+            self._queue.put_nowait(job["id"])
+
+    async def run(self) -> None:
+        self.resume()
+        while True:
+            job = self.jobs[await self._queue.get()]
+            try:
+                await self.process(job)
+            except Exception:  # noqa: broad-except - one bad job must not stop the queue
+                logger.exception("Batch job %s failed", job["id"])
+                job["status"] = "failed"
+                self.store.save(job)
+            finally:
+                self.jobs.pop(job["id"], None)
+
+    async def process(self, job: Dict[str, Any]) -> None:
+        if job["status"] not in ACTIVE:
+            return
+        finished = self.store.results(job["id"])
+        done = {result["index"] for result in finished}
+        job.update(status="running", completed=len(finished), failed=sum(1 for r in finished if r.get("error")))
+        self.store.save(job)
+        items = self.store.items(job["id"])
+        pending = [index for index in range(len(items)) if index not in done]
+        # Neighbouring items on the same model with the same leading prompt share a prefix cache.
+        pending.sort(key=lambda index: _packing_key(items[index]))
+        await self._run_items(job, items, iter(pending))
+        if job["status"] == "running":
+            job.update(status="completed", finished_at=time.time())
+        self.store.save(job)
+
+    async def _run_items(self, job: Dict[str, Any], items: List[BatchItem], pending: Iterable[int]) -> None:
+        last_save = time.monotonic()
+
+        async def worker():
+            nonlocal last_save
+            for index in pending:
+                if job["status"] != "running":
+                    return
+                item = items[index]
+                try:
+                    outcome = await self.execute(item)
+                except Exception as exc:  # noqa: broad-except - a failed item is a result line, not a failed job
+                    logger.exception("Batch job %s item %s failed", job["id"], index)
+                    outcome = {"backend": item.backend.value, "model": item.model, "error": f"{type(exc).__name__}: {exc}"}
+                result = {"index": index, "custom_id": item.custom_id, **outcome}
+                self.store.append_result(job["id"], result)
+                job["completed"] += 1
+                job["failed"] += bool(result.get("error"))
+                if time.monotonic() - last_save >= 1.0:
+                    last_save = time.monotonic()
+                    self.store.save(job)
+
+        # Workers share one iterator, so each pending item is taken exactly once.
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, self.concurrency))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # If one worker dies (or the runner is cancelled) the others must not keep writing results.
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
+def _packing_key(item: BatchItem):
+    leading = item.messages[0].content if item.messages else ""
+    return item.backend.value if item.backend else "", item.model, leading
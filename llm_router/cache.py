@@ -0,0 +1,92 @@
+"""Opt-in response cache for low-temperature requests: in-process LRU in front of Redis.
+
+Entries are keyed on the request fingerprint plus the caller's prompt version
+and expire after ``response_cache_ttl``. Redis is optional; when it is missing
+or failing the cache degrades to the local tier.
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from llm_router.config import RouterConfig
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(self, config: RouterConfig, redis=None):
+        self.enabled = config.response_cache
+        self.max_temperature = config.response_cache_max_temperature
+        self.size = config.response_cache_size
+        self.ttl = config.response_cache_ttl
+        self.redis = redis
+        self.hits = 0
+        self.misses = 0
+        self._local: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def cacheable(self, temperature: float) -> bool:
+        return self.enabled and temperature <= self.max_temperature
+
+    @staticmethod
+    def key(fingerprint: str, prompt_version: Optional[str]) -> str:
+        return f"llm:response:{prompt_version or '-'}:{fingerprint}"
+
+    async def get(self, key: str, max_age: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], str]:
+        """The cached entry (or None) and the tier it came from."""
+        now = time.time()
+        entry, tier = self._local.get(key), "memory"
+        if entry is not None and now - entry["stored_at"] >= self.ttl:
+            del self._local[key]
+            entry = None
+        if entry is None and self.redis is not None:
+            tier = "redis"
+            try:
+                raw = await self.redis.get(key)
+            except Exception as exc:  # noqa: broad-except
+                logger.warning("Response cache Redis unavailable (%s)", exc)
+                raw = None
+            entry = json.loads(raw) if raw else None
+            if entry is not None:
+                self._store_local(key, entry)
+        if entry is not None and max_age is not None and now - entry["stored_at"] > max_age:
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None, ""
+        if tier == "memory":
+            self._local.move_to_end(key)
+        self.hits += 1
+        return entry, tier
+
+    async def set(self, key: str, entry: Dict[str, Any]) -> None:
+        entry = {**entry, "stored_at": time.time()}
+        self._store_local(key, entry)
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, json.dumps(entry), ex=int(self.ttl))
+            except Exception as exc:  # noqa: broad-except
+                logger.warning("Response cache Redis unavailable (%s)", exc)
+
+    def _store_local(self, key: str, entry: Dict[str, Any]) -> None:
+        self._local[key] = entry
+        self._local.move_to_end(key)
+        while len(self._local) > self.size:
+            self._local.popitem(last=False)
+
+    def counters(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._local)}
+
+    async def aclose(self) -> None:
+        if self.redis is not None:
+            await self.redis.aclose()
+
+
+def build_cache(config: RouterConfig) -> ResponseCache:
+    client = None
+    if config.response_cache and config.redis_url:
+        import redis.asyncio as aioredis
+
+        client = aioredis.from_url(config.redis_url)
+    return ResponseCache(config, client)
@@ -0,0 +1,159 @@
+"""Startup-time router configuration read once from the environment."""
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from llm_router.schemas import Backend, Priority
+
+
+@dataclass(frozen=True)
+class BackendConfig:
+    backend: Backend
+    urls: Tuple[str, ...]
+    api_key: str = ""
+
+
+@dataclass(frozen=True)
+class RouterConfig:
+    backends: Dict[Backend, BackendConfig] = field(default_factory=dict)
+    timeout: float = 60.0
+    connect_timeout: float = 5.0
+    max_connections: int = 256
+    max_keepalive: int = 64
+    # Groups of {backend: model name} that can stand in for each other on failover.
+    model_equivalents: Tuple[Dict[Backend, str], ...] = ()
+    health_interval: float = 10.0
+    breaker_failures: int = 3
+    breaker_cooldown: float = 30.0
+    # Concurrent generations admitted per backend (across its replicas).
+    concurrency: Dict[Backend, int] = field(default_factory=dict)
+    default_concurrency: int = 32
+    # Longest a request of each priority may wait for a slot before it is shed with 429.
+    queue_budgets: Dict[Priority, float] = field(
+        default_factory=lambda: {Priority.INTERACTIVE: 2.0, Priority.BACKGROUND: 30.0, Priority.BATCH: 300.0}
+    )
+
+    # Opt-in response cache for requests at or below response_cache_max_temperature.
+    response_cache: bool = False
+    response_cache_max_temperature: float = 0.2
+    response_cache_size: int = 1024
+    response_cache_ttl: float = 3600.0
+    redis_url: str = ""
+    # Models kept loaded on every endpoint of their backend; extended at runtime via /llm/models/preload.
+    preload_models: Tuple[Tuple[Backend, str], ...] = ()
+    ollama_keep_alive: str = "30m"
+    residency_interval: float = 30.0
+    # Endpoints holding the model are preferred until they carry this multiple of the average load.
+    residency_load_factor: float = 1.25
+    model_load_timeout: float = 300.0
+    # Inference logs are shipped as Celery tasks; empty broker URL disables them.
+    log_broker_url: str = ""
+    log_batch_size: int = 200
+    log_flush_interval: float = 2.0
+    # Opt-in hedging of interactive requests whose first token is later than the rolling quantile.
+    hedging: bool = False
+    hedge_quantile: float = 0.95
+    hedge_delay: float = 1.0
+    hedge_min_delay: float = 0.05
+    hedge_max_delay: float = 5.0
+    hedge_max_rate: float = 0.05
+    # Requests with a session_id stick to one replica unless it has more than this multiple of the average load.
+    affinity: bool = True
+    affinity_load_factor: float = 1.25
+    # Offline batch jobs (/llm/batch): where jobs and results are kept, and items in flight per job.
+    batch_dir: str = "var/llm_batches"
+    batch_concurrency: int = 16
+
+    def default_backend(self) -> Backend:
+        for backend in (Backend.VLLM, Backend.LLAMACPP):
+            if backend in self.backends:
+                return backend
+        return Backend.OLLAMA
+
+    def concurrency_for(self, backend: Backend) -> int:
+        return self.concurrency.get(backend, self.default_concurrency)
+
+    def equivalents(self, backend: Backend, model: str) -> List[Tuple[Backend, str]]:
+        """The requested (backend, model) first, then equivalent models on other configured backends."""
+        candidates = [(backend, model)]
+        for group in self.model_equivalents:
+            if group.get(backend) != model:
+                continue
+            for other, other_model in group.items():
+                if other in self.backends and (other, other_model) not in candidates:
+                    candidates.append((other, other_model))
+        return candidates
+
+
+def _urls(plural: str, singular: str, default: str = "") -> Tuple[str, ...]:
+    raw = os.environ.get(plural) or os.environ.get(singular) or default
+    return tuple(url.strip().rstrip("/") for url in raw.split(",") if url.strip())
+
+
+def _equivalents(raw: str) -> Tuple[Dict[Backend, str], ...]:
+    if not raw:
+        return ()
+    return tuple({Backend(backend): model for backend, model in group.items()} for group in json.loads(raw))
+
+
+def _pairs(raw: str, key, value) -> dict:
+    """Parse ``"a=1,b=2"`` into ``{key("a"): value("1"), ...}``."""
+    pairs = (item.split("=", 1) for item in raw.split(",") if "=" in item)
+    return {key(k.strip()): value(v.strip()) for k, v in pairs}
+
+
+def _model_refs(raw: str) -> Tuple[Tuple[Backend, str], ...]:
+    """Parse ``"ollama=llama3.1:8b,vllm=org/model"`` into (backend, model) pairs."""
+    pairs = (item.split("=", 1) for item in raw.split(",") if "=" in item)
+    return tuple((Backend(backend.strip()), model.strip()) for backend, model in pairs)
+
+
+def load_config() -> RouterConfig:
+    backends = {
+        Backend.OLLAMA: BackendConfig(Backend.OLLAMA, _urls("OLLAMA_HOSTS", "OLLAMA_HOST", "http://localhost:11434")),
+    }
+    if _urls("VLLM_URLS", "VLLM_URL"):
+        backends[Backend.VLLM] = BackendConfig(Backend.VLLM, _urls("VLLM_URLS", "VLLM_URL"), os.environ.get("VLLM_API_KEY", ""))
+    if _urls("LLAMACPP_URLS", "LLAMACPP_URL"):
+        backends[Backend.LLAMACPP] = BackendConfig(Backend.LLAMACPP, _urls("LLAMACPP_URLS", "LLAMACPP_URL"))
+    return RouterConfig(
+        backends=backends,
+        timeout=float(os.environ.get("LLM_ROUTER_TIMEOUT", "60")),
+        connect_timeout=float(os.environ.get("LLM_ROUTER_CONNECT_TIMEOUT", "5")),
+        max_connections=int(os.environ.get("LLM_ROUTER_MAX_CONNECTIONS", "256")),
+        max_keepalive=int(os.environ.get("LLM_ROUTER_MAX_KEEPALIVE", "64")),
+        model_equivalents=_equivalents(os.environ.get("LLM_MODEL_EQUIVALENTS", "")),
+        health_interval=float(os.environ.get("LLM_ROUTER_HEALTH_INTERVAL", "10")),
+        breaker_failures=int(os.environ.get("LLM_ROUTER_BREAKER_FAILURES", "3")),
+        breaker_cooldown=float(os.environ.get("LLM_ROUTER_BREAKER_COOLDOWN", "30")),
+        concurrency=_pairs(os.environ.get("LLM_ROUTER_CONCURRENCY", ""), Backend, int),
+        default_concurrency=int(os.environ.get("LLM_ROUTER_DEFAULT_CONCURRENCY", "32")),
+        response_cache=os.environ.get("LLM_ROUTER_RESPONSE_CACHE", "false").lower() == "true",
+        response_cache_max_temperature=float(os.environ.get("LLM_ROUTER_CACHE_MAX_TEMPERATURE", "0.2")),
+        response_cache_size=int(os.environ.get("LLM_ROUTER_CACHE_SIZE", "1024")),
+        response_cache_ttl=float(os.environ.get("LLM_ROUTER_CACHE_TTL_SECONDS", "3600")),
+        redis_url=os.environ.get("LLM_ROUTER_REDIS_URL") or os.environ.get("REDIS_URL", ""),
+        preload_models=_model_refs(os.environ.get("LLM_ROUTER_PRELOAD_MODELS", "")),
+        ollama_keep_alive=os.environ.get("LLM_ROUTER_OLLAMA_KEEP_ALIVE", "30m"),
+        residency_interval=float(os.environ.get("LLM_ROUTER_RESIDENCY_INTERVAL", "30")),
+        residency_load_factor=max(1.0, float(os.environ.get("LLM_ROUTER_RESIDENCY_LOAD_FACTOR", "1.25"))),
+        model_load_timeout=float(os.environ.get("LLM_ROUTER_MODEL_LOAD_TIMEOUT", "300")),
+        log_broker_url=os.environ.get("LLM_ROUTER_LOG_BROKER_URL") or os.environ.get("CELERY_BROKER_URL", ""),
+        log_batch_size=int(os.environ.get("LLM_ROUTER_LOG_BATCH_SIZE", "200")),
+        log_flush_interval=float(os.environ.get("LLM_ROUTER_LOG_FLUSH_SECONDS", "2")),
+        hedging=os.environ.get("LLM_ROUTER_HEDGING", "false").lower() == "true",
+        hedge_quantile=float(os.environ.get("LLM_ROUTER_HEDGE_QUANTILE", "0.95")),
+        hedge_delay=float(os.environ.get("LLM_ROUTER_HEDGE_DELAY_SECONDS", "1")),
+        hedge_min_delay=float(os.environ.get("LLM_ROUTER_HEDGE_MIN_DELAY_SECONDS", "0.05")),
+        hedge_max_delay=float(os.environ.get("LLM_ROUTER_HEDGE_MAX_DELAY_SECONDS", "5")),
+        hedge_max_rate=float(os.environ.get("LLM_ROUTER_HEDGE_MAX_RATE", "0.05")),
+        affinity=os.environ.get("LLM_ROUTER_AFFINITY", "true").lower() == "true",
+        affinity_load_factor=max(1.0, float(os.environ.get("LLM_ROUTER_AFFINITY_LOAD_FACTOR", "1.25"))),
+        batch_dir=os.environ.get("LLM_ROUTER_BATCH_DIR", "var/llm_batches"),
+        batch_concurrency=int(os.environ.get("LLM_ROUTER_BATCH_CONCURRENCY", "16")),
+        queue_budgets={
+            **RouterConfig().queue_budgets,
+            **_pairs(os.environ.get("LLM_ROUTER_QUEUE_BUDGETS", ""), Priority, float),
+        },
+    )
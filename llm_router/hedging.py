@@ -0,0 +1,69 @@
+"""Request hedging: re-issue a generation on a second replica when its first token is late.
+
+"Late" adapts per (backend, model): the rolling ``hedge_quantile`` of observed
+time-to-first-token, clamped to ``[hedge_min_delay, hedge_max_delay]`` and
+``hedge_delay`` until enough samples exist. Hedges are paid for from a token
+bucket refilled by ``hedge_max_rate`` per generation, so over time at most that
+share of generations is duplicated.
+"""
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from llm_router.config import RouterConfig
+from llm_router.schemas import Backend
+from llm_router.telemetry import ROUTER_HEDGE_RATE, ROUTER_HEDGES
+
+SAMPLES = 200
+MIN_SAMPLES = 20
+
+
+class Hedger:
+    def __init__(self, config: RouterConfig):
+        self.enabled = config.hedging
+        self.quantile = config.hedge_quantile
+        self.initial_delay = config.hedge_delay
+        self.min_delay = config.hedge_min_delay
+        self.max_delay = config.hedge_max_delay
+        self.max_rate = config.hedge_max_rate
+        self.tokens = 1.0 if self.max_rate > 0 else 0.0
+        self._ttft: Dict[Tuple[Backend, str], Deque[float]] = {}
+        self._recent: Deque[bool] = deque(maxlen=1000)
+
+    def delay(self, backend: Backend, model: str) -> float:
+        samples = self._ttft.get((backend, model))
+        if not samples or len(samples) < MIN_SAMPLES:
+            return self.initial_delay
+        ordered = sorted(samples)
+        threshold = ordered[int(self.quantile * (len(ordered) - 1))]
+        return min(max(threshold, self.min_delay), self.max_delay)
+
+    def observe(self, backend: Backend, model: str, ttft: float) -> None:
+        self._ttft.setdefault((backend, model), deque(maxlen=SAMPLES)).append(ttft)
+
+    def allow(self, backend: Backend, model: str) -> bool:
+        """Spend one hedge from the budget; False (and counted) when it is exhausted."""
+        if self.tokens < 1.0:
+            ROUTER_HEDGES.labels(backend=backend.value, model=model, result="suppressed").inc()
+            return False
+        self.tokens -= 1.0
+        ROUTER_HEDGES.labels(backend=backend.value, model=model, result="fired").inc()
+        return True
+
+    def record(self, backend: Backend, model: str, hedged: bool, hedge_won: bool = False) -> None:
+        """Account for one finished race; every generation refills the budget by ``max_rate``."""
+        self.tokens = min(1.0, self.tokens + self.max_rate)
+        self._recent.append(hedged)
+        if hedged:
+            ROUTER_HEDGES.labels(backend=backend.value, model=model, result="won" if hedge_won else "lost").inc()
+        ROUTER_HEDGE_RATE.set(self.rate())
+
+    def rate(self) -> float:
+        return sum(self._recent) / len(self._recent) if self._recent else 0.0
+
+    def state(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "rate": round(self.rate(), 4),
+            "max_rate": self.max_rate,
+            "delays": {f"{b.value}/{m}": round(self.delay(b, m), 3) for b, m in self._ttft},
+        }
@@ -1,97 +1,68 @@
+import asyncio
+import json
 import os
-from typing import Any, Dict, List, Optional
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-import requests
+from fastapi import FastAPI, HTTPException, Request, Response
+from prometheus_client import make_asgi_app
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import ValidationError
+from starlette.background import BackgroundTask
 
-from fastapi import FastAPI
+from llm_router.admission import PRIORITY_ORDER, Admission, Overloaded
+from llm_router.backends import BackendError, CacheHints, Chunk, Constraints
+from llm_router.batch import BatchRunner, BatchStore
+from llm_router.cache import build_cache
+from llm_router.config import load_config
+from llm_router.hedging import Hedger
+from llm_router.pool import EndpointPool, Generation, NoBackendAvailable, generate
+from llm_router.residency import ResidencyManager
+from llm_router.schemas import Backend, BatchItem, InferenceRequest, InferenceResponse, PreloadRequest, Priority, ToolCall
+from llm_router.singleflight import Flight, FlightRegistry, fingerprint
+from llm_router.telemetry import InferenceRecord, RequestTimer, build_shipper, observe
 
-from llm_router.schemas import Backend, InferenceRequest, InferenceResponse
 
-app = FastAPI(title="LLM Router", version="0.1.0", docs_url="/docs")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.config = load_config()
+    app.state.pool = EndpointPool(app.state.config)
+    app.state.admission = Admission(app.state.config)
+    app.state.flights = FlightRegistry()
+    app.state.cache = build_cache(app.state.config)
+    app.state.residency = ResidencyManager(app.state.pool, app.state.config)
+    app.state.hedger = Hedger(app.state.config)
+    app.state.logs = build_shipper(app.state.config)
+    app.state.batches = BatchRunner(
+        BatchStore(app.state.config.batch_dir), lambda item: _run_batch_item(app, item), app.state.config.batch_concurrency
+    )
+    await app.state.pool.probe_all()
+    health_checks = asyncio.create_task(app.state.pool.run_health_checks())
+    residency = asyncio.create_task(app.state.residency.run())
+    log_shipping = asyncio.create_task(app.state.logs.run())
+    # Picks up jobs left unfinished by the previous process before taking new ones.
+    batches = asyncio.create_task(app.state.batches.run())
+    try:
+        yield
+    finally:
+        health_checks.cancel()
+        residency.cancel()
+        log_shipping.cancel()
+        batches.cancel()
+        await app.state.logs.flush()
+        await app.state.pool.aclose()
+        await app.state.cache.aclose()
 
 
-def _call_ollama_chat(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int, stream: bool) -> Optional[str]:
-    host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
-    try:
-        resp = requests.post(
-            f"{host}/api/chat",
-            json={
-                "model": model,
-                "messages": messages,
-                "options": {"temperature": temperature, "num_predict": max_tokens},
-                "stream": stream,
-            },
-            timeout=60,
-        )
-        if not resp.ok:
-            return None
-        data = resp.json()
-        if not data.get("message"):
-            return None
-        return data["message"].get("content")
-    except Exception:
-        return None
-
-
-def _call_vllm(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int, stream: bool) -> Optional[str]:
-    vllm_url = os.environ.get("VLLM_URL")
-    api_key = os.environ.get("VLLM_API_KEY", "")
-    if not vllm_url:
-        return None
-    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-    try:
-        resp = requests.post(
-            f"{vllm_url}/v1/chat/completions",
-            json={
-                "model": model,
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "stream": stream,
-            },
-            headers=headers,
-            timeout=60,
-        )
-        if not resp.ok:
-            return None
-        data = resp.json()
-        return data.get("choices", [{}])[0].get("message", {}).get("content")
-    except Exception:
-        return None
-
-
-def _call_llamacpp(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int, stream: bool) -> Optional[str]:
-    llama_url = os.environ.get("LLAMACPP_URL")
-    if not llama_url:
-        return None
-    try:
-        resp = requests.post(
-            f"{llama_url}/v1/chat/completions",
-            json={
-                "model": model,
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "stream": stream,
-            },
-            timeout=60,
-        )
-        if not resp.ok:
-            return None
-        data = resp.json()
-        return data.get("choices", [{}])[0].get("message", {}).get("content")
-    except Exception:
-        return None
+app = FastAPI(title="LLM Router", version="0.1.0", docs_url="/docs", lifespan=lifespan)
+app.mount("/metrics", make_asgi_app())
 
 
-def _select_backend(request: InferenceRequest) -> Backend:
+def _select_backend(request: InferenceRequest, config) -> Backend:
     if request.backend:
         return request.backend
-    if os.environ.get("VLLM_URL"):
-        return Backend.VLLM
-    if os.environ.get("LLAMACPP_URL"):
-        return Backend.LLAMACPP
-    return Backend.OLLAMA
+    return config.default_backend()
 
 
 @app.get("/health")
@@ -99,65 +70,471 @@ async def health():
     return {"status": "ok"}
 
 
+def _sse(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def _constraints(request: InferenceRequest) -> Constraints:
+    return Constraints(
+        tools=tuple(tool.model_dump() for tool in request.tools or []),
+        tool_choice=request.tool_choice,
+        json_mode=request.response_format == "json",
+        json_schema=request.json_schema,
+        grammar=request.grammar,
+    )
+
+
+def _output_meta(request: InferenceRequest, output: str, tool_calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Flags constrained output that still failed to parse, so callers never show raw JSON to a customer."""
+    if tool_calls or not (request.response_format == "json" or request.json_schema):
+        return {}
+    try:
+        json.loads(output)
+    except ValueError:
+        return {"json_valid": False}
+    return {"json_valid": True}
+
+
+def _meta(request: InferenceRequest, flight: Flight, leader: bool) -> Dict[str, Any]:
+    generation, slot = flight.generation, flight.slot
+    return {
+        "tools_received": len(request.tools or []),
+        "endpoint": generation.endpoint.url if generation.endpoint else None,
+        "attempts": generation.attempts,
+        "failover": generation.failed_over,
+        "hedged": generation.hedged,
+        "affinity": generation.affinity or None,
+        "priority": request.priority.value,
+        "deduplicated": not leader,
+        "queue_ms": round(slot.queue_wait * 1000, 1),
+        "generation_ms": round((time.monotonic() - slot.started) * 1000, 1),
+    }
+
+
+def _record(request: InferenceRequest, backend: Backend, cache_result: str) -> InferenceRecord:
+    return InferenceRecord(
+        backend=backend.value,
+        model=request.model,
+        priority=request.priority.value,
+        tenant=request.tenant,
+        agent_id=request.agent_id,
+        cache=cache_result,
+        request={
+            "messages": len(request.messages),
+            "temperature": request.temperature,
+            "max_tokens": request.max_tokens,
+            "stream": request.stream,
+            "prompt_version": request.prompt_version,
+            "session_id": request.session_id,
+        },
+    )
+
+
+def _report(app: FastAPI, record: InferenceRecord, flight: Optional[Flight] = None, leader: bool = True) -> None:
+    if flight is not None and flight.generation is not None:
+        record.backend = flight.generation.backend.value
+        record.model = flight.generation.model
+        record.endpoint = flight.generation.endpoint.url if flight.generation.endpoint else ""
+        record.queue_ms = round(flight.slot.queue_wait * 1000, 1)
+        record.deduplicated = not leader
+        record.hedged = flight.generation.hedged
+        record.affinity = flight.generation.affinity
+    observe(record)
+    app.state.logs.submit(record)
+
+
+def _cache_meta(result: str, cache, tier: str = "") -> Dict[str, Any]:
+    return {"result": result, "tier": tier or None, **cache.counters()}
+
+
+def _admission_backend(app: FastAPI, backend: Backend, model: str) -> Backend:
+    """The backend whose queue admits the request: the requested one, or its first configured equivalent."""
+    candidates = app.state.pool.candidates(backend, model)
+    return candidates[0][0] if candidates else backend
+
+
+async def _produce(
+    app: FastAPI, request: InferenceRequest, backend: Backend, flight: Flight, cache_key: Optional[str]
+) -> None:
+    """Leader side of a flight: wait for admission, publish the generation's chunks, then cache the result."""
+    flight.slot = await app.state.admission.acquire(
+        _admission_backend(app, backend, request.model), request.priority, request.tenant
+    )
+    parts = []
+    try:
+        flight.generation = Generation(backend, request.model)
+        async for chunk in generate(
+            app.state.pool,
+            backend,
+            request.model,
+            [m.model_dump() for m in request.messages],
+            request.temperature,
+            request.max_tokens,
+            flight.generation,
+            _constraints(request),
+            # Only interactive traffic is worth duplicating to cut its tail latency.
+            hedger=app.state.hedger if request.priority == Priority.INTERACTIVE else None,
+            session=request.session_id,
+            hints=CacheHints(cache_prompt=request.cache_prompt, keep_alive=request.keep_alive),
+            admission=app.state.admission,
+        ):
+            parts.append(chunk.delta)
+            if chunk.truncated:
+                # A cut-short answer is not worth reusing: new identical requests start their own generation.
+                app.state.flights.forget(flight)
+            flight.publish(chunk)
+            if chunk.done and cache_key and not chunk.truncated:
+                await app.state.cache.set(
+                    cache_key,
+                    {
+                        "backend": flight.generation.backend.value,
+                        "model": flight.generation.model,
+                        "output": "".join(parts),
+                        "usage": chunk.usage,
+                        "tool_calls": chunk.tool_calls,
+                    },
+                )
+    finally:
+        flight.slot.release()
+
+
+async def _start_generation(
+    http_request: Request, request: InferenceRequest, backend: Backend, key: str, cache_key: Optional[str]
+) -> Tuple[Flight, bool, AsyncIterator[Chunk], Chunk]:
+    """Join or start the flight for this request and wait for its first chunk.
+
+    Admission, failover and 503s all happen before any response starts.
+    """
+    app = http_request.app
+    # Flights are keyed per priority; a request may join one of its own or a higher priority.
+    keys = [f"{p.value}:{key}" for p in PRIORITY_ORDER[: PRIORITY_ORDER.index(request.priority) + 1]]
+    flight, leader = app.state.flights.join(
+        keys[-1], lambda flight: _produce(app, request, backend, flight, cache_key), shared=keys[:-1]
+    )
+    chunks = flight.subscribe()
+    try:
+        first = await chunks.__anext__()
+    except Overloaded as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
+    except (NoBackendAvailable, BackendError) as exc:
+        raise HTTPException(status_code=503, detail=f"No LLM backend available: {exc}")
+    return flight, leader, chunks, first
+
+
+async def _cached_events(entry: Dict[str, Any], meta: Dict[str, Any]) -> AsyncIterator[str]:
+    if entry["output"]:
+        yield _sse({"type": "delta", "delta": entry["output"]})
+    done = {k: entry[k] for k in ("backend", "model", "output", "usage")}
+    yield _sse({"type": "done", **done, "tool_calls": entry.get("tool_calls", []), "meta": meta})
+
+
+async def _stream_events(
+    app: FastAPI,
+    request: InferenceRequest,
+    flight: Flight,
+    leader: bool,
+    chunks: AsyncIterator[Chunk],
+    first: Chunk,
+    cache_meta: Dict[str, Any],
+    timer: RequestTimer,
+    record: InferenceRecord,
+) -> AsyncIterator[str]:
+    """Normalized SSE: ``delta`` events with incremental text, then one ``done`` event with usage/meta."""
+    parts, usage = [], {}
+
+    async def all_chunks():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    try:
+        async for chunk in all_chunks():
+            if chunk.delta:
+                timer.token()
+                parts.append(chunk.delta)
+                yield _sse({"type": "delta", "delta": chunk.delta})
+            if chunk.done:
+                usage = chunk.usage
+                yield _sse(
+                    {
+                        "type": "done",
+                        "backend": flight.generation.backend.value,
+                        "model": flight.generation.model,
+                        "output": "".join(parts),
+                        "usage": chunk.usage,
+                        "tool_calls": chunk.tool_calls,
+                        "meta": {
+                            **_meta(request, flight, leader),
+                            **_output_meta(request, "".join(parts), chunk.tool_calls),
+                            "truncated": chunk.truncated,
+                            "cache": cache_meta,
+                        },
+                    }
+                )
+    except (BackendError, NoBackendAvailable) as exc:
+        record.success, record.error = False, str(exc)
+        yield _sse({"type": "error", "detail": str(exc)})
+    finally:
+        await chunks.aclose()
+        _report(app, timer.finish(record, usage), flight, leader)
+
+
+def _cached_response(request: InferenceRequest, entry: Dict[str, Any], cache_meta: Dict[str, Any]):
+    meta = {
+        "tools_received": len(request.tools or []),
+        "priority": request.priority.value,
+        "queue_ms": 0.0,
+        "generation_ms": 0.0,
+        "cache": {**cache_meta, "age": round(time.time() - entry["stored_at"], 1)},
+        **_output_meta(request, entry["output"], entry.get("tool_calls", [])),
+    }
+    if request.stream:
+        return StreamingResponse(_cached_events(entry, meta), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    return InferenceResponse(
+        backend=Backend(entry["backend"]),
+        model=entry["model"],
+        output=entry["output"],
+        tool_calls=[ToolCall(**call) for call in entry.get("tool_calls", [])],
+        meta={**meta, "usage": entry["usage"]},
+    )
+
+
 @app.post("/llm/infer", response_model=InferenceResponse)
-async def infer(request: InferenceRequest) -> InferenceResponse:
-    """Inference endpoint with Ollama/vLLM/llama.cpp support."""
-    output = None
-    meta: Dict[str, Any] = {"tools_received": len(request.tools or [])}
-    backend = _select_backend(request)
-
-    stream_chunks = None
-    if backend == Backend.OLLAMA:
-        output = _call_ollama_chat(
-            model=request.model,
-            messages=[m.model_dump() for m in request.messages],
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            stream=request.stream,
-        )
-    elif backend == Backend.VLLM:
-        output = _call_vllm(
-            model=request.model,
-            messages=[m.model_dump() for m in request.messages],
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            stream=request.stream,
-        )
-    elif backend == Backend.LLAMACPP:
-        output = _call_llamacpp(
-            model=request.model,
-            messages=[m.model_dump() for m in request.messages],
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            stream=request.stream,
+async def infer(request: InferenceRequest, http_request: Request):
+    """Inference endpoint with Ollama/vLLM/llama.cpp support; ``stream`` switches to Server-Sent Events.
+
+    With the response cache enabled, low-temperature requests are answered from
+    it without touching a backend. Identical requests already generating share
+    that generation instead of starting another. New generations wait for a slot
+    under the backend's concurrency cap (429 with Retry-After once their
+    priority's queue budget is exceeded), then go to the least-loaded healthy
+    replica and fail over to other replicas or equivalent models before the
+    first token; 503 when none can serve. Every request is measured and logged.
+    ``tools``, ``response_format``/``json_schema`` and ``grammar`` use each
+    backend's native tool calling and constrained decoding; parsed calls are
+    returned in ``tool_calls``.
+    """
+    app = http_request.app
+    timer = RequestTimer()
+    backend = _select_backend(request, app.state.config)
+    key = fingerprint(request, backend)
+    cache = app.state.cache
+    cache_key, cache_meta = None, _cache_meta("off", cache)
+    if cache.cacheable(request.temperature):
+        cache_key = cache.key(key, request.prompt_version)
+        cache_meta = _cache_meta("bypass", cache)
+        if not request.cache_control.bypass:
+            entry, tier = await cache.get(cache_key, request.cache_control.max_age)
+            cache_meta = _cache_meta("hit" if entry else "miss", cache, tier)
+            if entry is not None:
+                timer.token()
+                record = _record(request, Backend(entry["backend"]), "hit")
+                record.model = entry["model"]
+                _report(app, timer.finish(record, entry["usage"]))
+                return _cached_response(request, entry, cache_meta)
+
+    record = _record(request, backend, cache_meta["result"])
+    try:
+        flight, leader, chunks, first = await _start_generation(http_request, request, backend, key, cache_key)
+    except HTTPException as exc:
+        record.success, record.error = False, str(exc.detail)
+        _report(app, timer.finish(record, {}))
+        raise
+    if first.delta:
+        timer.token()
+    if request.stream:
+        return StreamingResponse(
+            _stream_events(app, request, flight, leader, chunks, first, cache_meta, timer, record),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            # Also detaches from the flight if the client disconnects before the stream starts.
+            background=BackgroundTask(chunks.aclose),
         )
 
-    if output is None:
-        output = "LLM backend not available or returned no content."
-        meta["warning"] = "backend_unavailable"
+    parts, usage, tool_calls, truncated = [first.delta], first.usage, first.tool_calls, first.truncated
+    try:
+        async for chunk in chunks:
+            if chunk.delta:
+                timer.token()
+            parts.append(chunk.delta)
+            if chunk.done:
+                usage, tool_calls, truncated = chunk.usage, chunk.tool_calls, chunk.truncated
+    except BackendError as exc:
+        record.success, record.error = False, str(exc)
+        raise HTTPException(status_code=502, detail=f"LLM backend failed mid-generation: {exc}")
+    finally:
+        await chunks.aclose()
+        _report(app, timer.finish(record, usage), flight, leader)
 
+    output = "".join(parts)
+    meta = _meta(request, flight, leader)
+    meta.update(_output_meta(request, output, tool_calls))
+    meta["truncated"] = truncated
+    meta["usage"] = usage
+    meta["cache"] = cache_meta
     return InferenceResponse(
-        backend=backend,
-        model=request.model,
+        backend=flight.generation.backend,
+        model=flight.generation.model,
         output=output,
-        tool_calls=[],
+        tool_calls=[ToolCall(**call) for call in tool_calls],
         meta=meta,
-        stream_chunks=stream_chunks,
     )
 
 
-@app.get("/llm/ollama/models")
-async def list_ollama_models() -> Dict[str, List[Dict[str, Any]]]:
-    """List available Ollama models via local API."""
-    ollama_host = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+async def _run_batch_item(app: FastAPI, item: BatchItem) -> Dict[str, Any]:
+    """One batch item at batch priority; when the batch queue is shed it waits and retries instead of failing."""
+    timer = RequestTimer()
+    record = _record(item, item.backend, "off")
+    record.priority = Priority.BATCH.value
+    while True:
+        try:
+            slot = await app.state.admission.acquire(
+                _admission_backend(app, item.backend, item.model), Priority.BATCH, item.tenant
+            )
+            break
+        except Overloaded as exc:
+            await asyncio.sleep(exc.retry_after)
+    generation = Generation(item.backend, item.model)
+    parts, usage, tool_calls, truncated = [], {}, [], False
+    try:
+        async for chunk in generate(
+            app.state.pool,
+            item.backend,
+            item.model,
+            [m.model_dump() for m in item.messages],
+            item.temperature,
+            item.max_tokens,
+            generation,
+            _constraints(item),
+            session=item.session_id,
+            hints=CacheHints(cache_prompt=item.cache_prompt, keep_alive=item.keep_alive),
+            admission=app.state.admission,
+        ):
+            if chunk.delta:
+                timer.token()
+            parts.append(chunk.delta)
+            if chunk.done:
+                usage, tool_calls, truncated = chunk.usage, chunk.tool_calls, chunk.truncated
+    except (BackendError, NoBackendAvailable) as exc:
+        record.success, record.error = False, str(exc)
+    finally:
+        slot.release()
+    record.backend, record.model = generation.backend.value, generation.model
+    record.endpoint = generation.endpoint.url if generation.endpoint else ""
+    record.queue_ms = round(slot.queue_wait * 1000, 1)
+    _report(app, timer.finish(record, usage))
+    return {
+        "backend": generation.backend.value,
+        "model": generation.model,
+        "output": "".join(parts),
+        "tool_calls": tool_calls,
+        "usage": usage,
+        "truncated": truncated,
+        "error": record.error or None,
+    }
+
+
+async def _batch_items(http_request: Request) -> List[BatchItem]:
+    """Items from a JSON list (or ``{"requests": [...]}``) or, for any other content type, JSONL."""
+    raw = await http_request.body()
     try:
-        resp = requests.get(f"{ollama_host}/api/tags", timeout=5)
-        if not resp.ok:
-            return {"models": [], "error": resp.text, "status_code": resp.status_code}
-        data = resp.json()
-        return {"models": data.get("models", [])}
-    except Exception as exc:  # noqa: broad-except
-        return {"models": [], "error": str(exc)}
+        if http_request.headers.get("content-type", "").startswith("application/json"):
+            data = json.loads(raw)
+            rows = data.get("requests") if isinstance(data, dict) else data
+        else:
+            rows = [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Batch body is not JSON or JSONL: {exc}")
+    if not isinstance(rows, list) or not rows:
+        raise HTTPException(status_code=422, detail="Batch needs a non-empty list of requests")
+    items, errors = [], []
+    configured = http_request.app.state.config.backends
+    for index, row in enumerate(rows):
+        try:
+            item = BatchItem.model_validate(row)
+        except ValidationError as exc:
+            errors.append({"index": index, "errors": exc.errors(include_url=False, include_context=False)})
+            continue
+        if item.backend not in configured:
+            errors.append({"index": index, "errors": [{"loc": ["backend"], "msg": f"{item.backend.value} is not configured"}]})
+        items.append(item)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    return items
+
+
+def _batch_status(http_request: Request, job_id: str) -> Dict[str, Any]:
+    job = http_request.app.state.batches.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown batch job")
+    return {**job, "results_url": f"/llm/batch/{job_id}/results"}
+
+
+@app.post("/llm/batch", status_code=202)
+async def submit_batch(http_request: Request) -> Dict[str, Any]:
+    """Persist an offline batch job and queue it; poll ``GET /llm/batch/{id}`` for progress.
+
+    Items run at ``batch`` priority regardless of what they ask for, so they only
+    use capacity interactive and background traffic leave idle.
+    """
+    items = await _batch_items(http_request)
+    job = http_request.app.state.batches.submit(items)
+    return _batch_status(http_request, job["id"])
+
+
+@app.get("/llm/batch/{job_id}")
+async def batch_status(job_id: str, http_request: Request) -> Dict[str, Any]:
+    return _batch_status(http_request, job_id)
+
+
+@app.get("/llm/batch/{job_id}/results")
+async def batch_results(job_id: str, http_request: Request):
+    """Result lines (JSONL, in completion order) written so far."""
+    _batch_status(http_request, job_id)
+    path = http_request.app.state.batches.store.results_path(job_id)
+    if not path.exists():
+        return Response(b"", media_type="application/x-ndjson")
+    return FileResponse(path, media_type="application/x-ndjson")
+
+
+@app.delete("/llm/batch/{job_id}")
+async def cancel_batch(job_id: str, http_request: Request) -> Dict[str, Any]:
+    """Stop a queued or running job; results already written are kept."""
+    http_request.app.state.batches.cancel(job_id)
+    return _batch_status(http_request, job_id)
+
+
+@app.get("/llm/backends")
+async def backend_status(http_request: Request) -> Dict[str, List[Dict[str, Any]]]:
+    """Health, breaker state and in-flight requests per endpoint, plus admission queues and hedging per backend."""
+    return {
+        "endpoints": [endpoint.state() for endpoint in http_request.app.state.pool.all()],
+        "admission": [queue.state() for queue in http_request.app.state.admission.queues.values()],
+        "in_flight": len(http_request.app.state.flights.flights),
+        "response_cache": http_request.app.state.cache.counters(),
+        "hedging": http_request.app.state.hedger.state(),
+    }
+
+
+@app.post("/llm/models/preload")
+async def preload_models(body: PreloadRequest, http_request: Request) -> Dict[str, Any]:
+    """Set the models to keep resident (Django pushes those of active agents) and start loading them."""
+    wanted = http_request.app.state.residency.want((ref.backend, ref.model) for ref in body.models)
+    return {"wanted": [{"backend": backend.value, "model": model} for backend, model in wanted]}
+
+
+@app.get("/llm/ollama/models")
+async def list_ollama_models(http_request: Request) -> Dict[str, Any]:
+    """List available Ollama models via local API, with the endpoints each one is currently loaded on."""
+    client = http_request.app.state.pool.client(Backend.OLLAMA)
+    listing = await client.list_models()
+    resident_on = http_request.app.state.residency.resident_on()
+    for model in listing["models"]:
+        model["resident_on"] = resident_on.get(model.get("name"), [])
+    listing["residency"] = {
+        endpoint.url: endpoint.state()["resident"] for endpoint in http_request.app.state.pool.endpoints.get(Backend.OLLAMA, [])
+    }
+    return listing
 
 
 if __name__ == "__main__":
@@ -0,0 +1,358 @@
+"""Endpoint pools: health probes, least-outstanding balancing, session affinity, circuit breakers and failover."""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from llm_router.backends import BackendClient, BackendError, CacheHints, Chunk, Constraints, build_client
+from llm_router.config import RouterConfig
+from llm_router.schemas import Backend
+
+if TYPE_CHECKING:
+    from llm_router.admission import Admission, Slot
+    from llm_router.hedging import Hedger
+
+logger = logging.getLogger(__name__)
+
+
+class NoBackendAvailable(Exception):
+    """Every endpoint able to serve the request is down, open-circuited or failed."""
+
+
+class Endpoint:
+    """One replica of a backend with its own connection pool and breaker state."""
+
+    def __init__(self, client: BackendClient, breaker_failures: int, breaker_cooldown: float):
+        self.client = client
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.open_until = 0.0
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        # Filled in by the residency manager; None until the endpoint has reported.
+        self.resident: Optional[Set[str]] = None
+
+    def holds(self, model: str) -> bool:
+        return self.resident is not None and model in self.resident
+
+    @property
+    def backend(self) -> Backend:
+        return self.client.backend
+
+    @property
+    def url(self) -> str:
+        return self.client.url
+
+    def available(self, now: Optional[float] = None) -> bool:
+        # After the cooldown the breaker is half-open: requests are let through and
+        # the next failure re-opens it immediately.
+        return self.healthy and (now or time.monotonic()) >= self.open_until
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.breaker_failures:
+            self.open_until = time.monotonic() + self.breaker_cooldown
+            logger.warning("Circuit opened for %s %s after %s failures", self.backend.value, self.url, self.failures)
+
+    def state(self) -> Dict[str, object]:
+        return {
+            "backend": self.backend.value,
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit_open": time.monotonic() < self.open_until,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "resident": sorted(self.resident) if self.resident is not None else None,
+        }
+
+
+class EndpointPool:
+    """All configured endpoints, grouped per backend."""
+
+    def __init__(self, config: RouterConfig, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.config = config
+        self.endpoints: Dict[Backend, List[Endpoint]] = {
+            backend: [
+                Endpoint(build_client(backend_config, url, config, transport), config.breaker_failures, config.breaker_cooldown)
+                for url in backend_config.urls
+            ]
+            for backend, backend_config in config.backends.items()
+        }
+
+    def all(self) -> List[Endpoint]:
+        return [endpoint for endpoints in self.endpoints.values() for endpoint in endpoints]
+
+    def client(self, backend: Backend) -> Optional[BackendClient]:
+        """Any endpoint client of ``backend`` for auxiliary calls (model listing)."""
+        endpoints = self.endpoints.get(backend) or []
+        available = [e for e in endpoints if e.available()] or endpoints
+        return available[0].client if available else None
+
+    def pick(
+        self, backend: Backend, exclude=(), model: Optional[str] = None, session: Optional[str] = None
+    ) -> Optional[Endpoint]:
+        """Least-outstanding-requests choice among available endpoints of ``backend``.
+
+        Endpoints that already hold ``model`` are preferred so requests do not pay a
+        model load, but only while they are under ``residency_load_factor`` times the
+        average load; beyond that every available endpoint competes. With a
+        ``session`` the choice is sticky instead (see ``_bounded``).
+        """
+        candidates = self._available(backend, exclude, model)
+        if not candidates:
+            return None
+        if session and self.config.affinity:
+            return self._bounded(candidates, session)
+        return min(candidates, key=lambda e: e.outstanding)
+
+    def home(self, backend: Backend, session: str, model: Optional[str] = None) -> Optional[Endpoint]:
+        """The endpoint ``session`` maps to when load is ignored."""
+        candidates = self._available(backend, (), model, bounded=False)
+        return max(candidates, key=lambda e: _session_rank(session, e.url)) if candidates else None
+
+    def _available(self, backend: Backend, exclude, model: Optional[str], bounded: bool = True) -> List[Endpoint]:
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints.get(backend, []) if e not in exclude and e.available(now)]
+        holding = [e for e in candidates if model is not None and e.holds(model)]
+        if holding and bounded:
+            load = sum(e.outstanding for e in candidates) + 1
+            capacity = math.ceil(self.config.residency_load_factor * load / len(candidates))
+            holding = [e for e in holding if e.outstanding < capacity]
+        return holding or candidates
+
+    def _bounded(self, candidates: List[Endpoint], session: str) -> Endpoint:
+        """Consistent hashing with bounded loads over rendezvous-hash order.
+
+        The session goes to its highest-ranked endpoint unless that one is at
+        ``affinity_load_factor`` times the average load (this request included),
+        in which case it spills to the next in its own order. Endpoints joining or
+        leaving only move the sessions that ranked them first.
+        """
+        load = sum(e.outstanding for e in candidates) + 1
+        capacity = math.ceil(self.config.affinity_load_factor * load / len(candidates))
+        ranked = sorted(candidates, key=lambda e: _session_rank(session, e.url), reverse=True)
+        return next(e for e in ranked if e.outstanding < capacity)
+
+    def candidates(self, backend: Backend, model: str) -> List[Tuple[Backend, str]]:
+        return [(b, m) for b, m in self.config.equivalents(backend, model) if b in self.endpoints]
+
+    async def probe_all(self) -> None:
+        endpoints = self.all()
+        results = await asyncio.gather(*[e.client.probe() for e in endpoints])
+        for endpoint, healthy in zip(endpoints, results):
+            if endpoint.healthy != healthy:
+                logger.warning("%s %s is now %s", endpoint.backend.value, endpoint.url, "healthy" if healthy else "unhealthy")
+            endpoint.healthy = healthy
+
+    async def run_health_checks(self) -> None:
+        while True:
+            try:
+                await self.probe_all()
+            except Exception:  # noqa: broad-except - the probe loop must never die
+                logger.exception("Health probe round failed")
+            await asyncio.sleep(self.config.health_interval)
+
+    async def aclose(self) -> None:
+        for endpoint in self.all():
+            await endpoint.client.aclose()
+
+
+def _session_rank(session: str, url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{session}|{url}".encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class Generation:
+    """Where a generation ended up running; filled in as failover proceeds."""
+
+    def __init__(self, backend: Backend, model: str):
+        self.requested = (backend, model)
+        self.backend = backend
+        self.model = model
+        self.endpoint: Optional[Endpoint] = None
+        self.attempts = 0
+        self.hedged = False
+        # "home" or "moved" for requests with a session id.
+        self.affinity = ""
+
+    @property
+    def failed_over(self) -> bool:
+        return self.attempts > 1 + self.hedged or (self.backend, self.model) != self.requested
+
+
+async def _first_output(stream: AsyncIterator[Chunk]) -> Chunk:
+    """The first chunk that carries output; empty keep-alive/role chunks are dropped."""
+    while True:
+        try:
+            chunk = await stream.__anext__()
+        except StopAsyncIteration:
+            raise BackendError("stream ended without output")
+        if chunk.truncated and not (chunk.delta or chunk.tool_calls):
+            raise BackendError("stream ended without output")
+        if chunk.delta or chunk.done or chunk.tool_calls:
+            return chunk
+
+
+class _Attempt:
+    """One endpoint working on the request; its first chunk is fetched in a task so attempts can be raced."""
+
+    def __init__(self, endpoint: Endpoint, backend: Backend, model: str, stream: AsyncIterator[Chunk]):
+        self.endpoint = endpoint
+        self.backend = backend
+        self.model = model
+        self.stream = stream
+        self.started = time.monotonic()
+        self.first = asyncio.ensure_future(_first_output(stream))
+        # Admission slot held by a hedge or cross-backend failover; the first backend's slot belongs to the caller.
+        self.slot: Optional["Slot"] = None
+        self._closed = False
+        endpoint.outstanding += 1
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.first.cancel()
+        await asyncio.gather(self.first, return_exceptions=True)
+        await self.stream.aclose()
+        self.endpoint.outstanding -= 1
+        if self.slot is not None:
+            self.slot.release()
+
+
+async def generate(
+    pool: EndpointPool,
+    backend: Backend,
+    model: str,
+    messages,
+    temperature: float,
+    max_tokens: int,
+    generation: Generation,
+    constraints: Constraints = Constraints(),
+    hedger: Optional["Hedger"] = None,
+    session: Optional[str] = None,
+    hints: CacheHints = CacheHints(),
+    admission: Optional["Admission"] = None,
+) -> AsyncIterator[Chunk]:
+    """Stream from the best endpoint, failing over across replicas and equivalent models.
+
+    Failover only happens before the first chunk is produced; once text has been
+    emitted a failure is surfaced to the caller as BackendError. With an enabled
+    ``hedger``, a primary that is late with its first chunk is raced against one
+    more replica of the same model; the loser is cancelled. ``session`` keeps a
+    conversation on one replica so its prompt prefix stays cached there.
+
+    The caller holds an ``admission`` slot for the first candidate backend. Any
+    attempt on another backend (failover to an equivalent model, or a hedge)
+    needs its own slot there, taken without queueing; a backend with no free
+    slot is skipped, so neither failover nor hedging exceeds a concurrency cap.
+    """
+    candidates = pool.candidates(backend, model)
+    admitted = candidates[0][0] if candidates else backend
+    tried: List[Endpoint] = []
+    errors: List[str] = []
+
+    def start(candidate_backend: Backend, candidate_model: str, endpoint: Endpoint, slot: Optional["Slot"]) -> _Attempt:
+        tried.append(endpoint)
+        generation.attempts += 1
+        generation.backend, generation.model, generation.endpoint = candidate_backend, candidate_model, endpoint
+        stream = endpoint.client.generate(candidate_model, messages, temperature, max_tokens, constraints, hints)
+        attempt = _Attempt(endpoint, candidate_backend, candidate_model, stream)
+        attempt.slot = slot
+        return attempt
+
+    def next_target() -> Optional[Tuple[Backend, str, Endpoint, Optional["Slot"]]]:
+        for candidate_backend, candidate_model in candidates:
+            endpoint = pool.pick(candidate_backend, exclude=tried, model=candidate_model, session=session)
+            if endpoint is None:
+                continue
+            slot = None
+            if admission is not None and candidate_backend != admitted:
+                slot = admission.try_acquire(candidate_backend)
+                if slot is None:
+                    errors.append(f"{candidate_backend.value} is at its concurrency limit")
+                    continue
+            return candidate_backend, candidate_model, endpoint, slot
+        return None
+
+    racing: List[_Attempt] = []
+    winner: Optional[_Attempt] = None
+    may_hedge = hedger is not None and hedger.enabled
+    try:
+        while winner is None:
+            if not racing:
+                target = next_target()
+                if target is None:
+                    raise NoBackendAvailable("; ".join(errors) or f"no healthy endpoint for {backend.value}/{model}")
+                racing.append(start(*target))
+            primary = racing[0]
+            timeout = hedger.delay(primary.backend, primary.model) if may_hedge else None
+            done, _ = await asyncio.wait([a.first for a in racing], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # The primary is late: race it against one other replica of the same model, once.
+                may_hedge = False
+                endpoint = pool.pick(primary.backend, exclude=tried, model=primary.model, session=session)
+                if endpoint is None:
+                    continue
+                slot = admission.try_acquire(primary.backend) if admission is not None else None
+                if slot is None:
+                    continue
+                if not hedger.allow(primary.backend, primary.model):
+                    slot.release()
+                    continue
+                generation.hedged = True
+                racing.append(start(primary.backend, primary.model, endpoint, slot))
+                continue
+            for attempt in [a for a in racing if a.first in done]:
+                racing.remove(attempt)
+                error = attempt.first.exception()
+                if error is None:
+                    if winner is None:
+                        winner = attempt
+                    else:
+                        await attempt.close()
+                    continue
+                await attempt.close()
+                if not isinstance(error, BackendError):
+                    raise error
+                attempt.endpoint.record_failure()
+                errors.append(str(error))
+
+        if hedger is not None and hedger.enabled:
+            hedger.observe(winner.backend, winner.model, winner.elapsed())
+            for loser in racing:
+                # A cancelled loser was at least this slow; keeps the quantile from only seeing winners.
+                hedger.observe(loser.backend, loser.model, loser.elapsed())
+            hedger.record(primary.backend, primary.model, generation.hedged, hedge_won=winner is not primary)
+        for loser in racing:
+            await loser.close()
+        racing.clear()
+        generation.backend, generation.model, generation.endpoint = winner.backend, winner.model, winner.endpoint
+        if session and pool.config.affinity:
+            home = pool.home(winner.backend, session, winner.model)
+            generation.affinity = "home" if winner.endpoint is home else "moved"
+
+        yield winner.first.result()
+        try:
+            async for chunk in winner.stream:
+                yield chunk
+        except BackendError:
+            winner.endpoint.record_failure()
+            raise
+        winner.endpoint.record_success()
+        if winner.endpoint.resident is not None:
+            winner.endpoint.resident.add(winner.model)
+    finally:
+        for attempt in racing + ([winner] if winner else []):
+            await attempt.close()
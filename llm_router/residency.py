@@ -0,0 +1,85 @@
+"""Model residency: keep the models agents use loaded, and know where they are loaded.
+
+Every ``residency_interval`` the manager asks each endpoint which models it holds
+(Ollama ``/api/ps``, ``/v1/models`` for vLLM/llama.cpp) and loads any wanted
+model an endpoint has dropped, so the first customer message after a quiet
+period does not pay the load. The wanted set comes from
+``LLM_ROUTER_PRELOAD_MODELS`` plus what Django pushes for active agents.
+"""
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from llm_router.config import RouterConfig
+from llm_router.pool import Endpoint, EndpointPool
+from llm_router.schemas import Backend
+
+logger = logging.getLogger(__name__)
+
+
+class ResidencyManager:
+    def __init__(self, pool: EndpointPool, config: RouterConfig):
+        self.pool = pool
+        self.interval = config.residency_interval
+        self.static: Set[Tuple[Backend, str]] = set(config.preload_models)
+        self.pushed: Set[Tuple[Backend, str]] = set()
+        self._sync: Optional[asyncio.Task] = None
+
+    @property
+    def wanted(self) -> Set[Tuple[Backend, str]]:
+        return self.static | self.pushed
+
+    def want(self, models: Iterable[Tuple[str, str]]) -> List[Tuple[Backend, str]]:
+        """Replace the pushed preload set (unknown or unconfigured backends are ignored) and warm it now."""
+        self.pushed = {
+            (Backend(backend), model)
+            for backend, model in models
+            if backend in Backend._value2member_map_ and Backend(backend) in self.pool.endpoints
+        }
+        if self._sync is None or self._sync.done():
+            self._sync = asyncio.create_task(self.sync())
+        return sorted(self.wanted)
+
+    async def refresh(self) -> None:
+        endpoints = [e for e in self.pool.all() if e.healthy]
+        results = await asyncio.gather(*[e.client.running_models() for e in endpoints])
+        for endpoint, models in zip(endpoints, results):
+            endpoint.resident = set(models) if models is not None else None
+
+    async def _warm_endpoint(self, endpoint: Endpoint, models: List[str]) -> None:
+        # One load at a time per endpoint; the server serializes them anyway.
+        for model in models:
+            if await endpoint.client.load(model):
+                if endpoint.resident is not None:
+                    endpoint.resident.add(model)
+                logger.info("Loaded %s on %s", model, endpoint.url)
+
+    async def warm(self) -> None:
+        jobs = []
+        for endpoint in self.pool.all():
+            if not endpoint.available() or endpoint.resident is None:
+                continue
+            missing = sorted(model for backend, model in self.wanted if backend == endpoint.backend and not endpoint.holds(model))
+            if missing:
+                jobs.append(self._warm_endpoint(endpoint, missing))
+        await asyncio.gather(*jobs)
+
+    async def sync(self) -> None:
+        await self.refresh()
+        await self.warm()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception:  # noqa: broad-except - the residency loop must never die
+                logger.exception("Model residency sync failed")
+            await asyncio.sleep(self.interval)
+
+    def resident_on(self) -> Dict[str, List[str]]:
+        """Model name -> endpoints currently holding it."""
+        where: Dict[str, List[str]] = {}
+        for endpoint in self.pool.all():
+            for model in sorted(endpoint.resident or ()):
+                where.setdefault(model, []).append(endpoint.url)
+        return where
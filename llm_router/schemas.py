@@ -10,6 +10,12 @@ class Backend(str, Enum):
     LLAMACPP = "llamacpp"
 
 
+class Priority(str, Enum):
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+    BATCH = "batch"
+
+
 class Message(BaseModel):
     role: str
     content: str
@@ -21,6 +27,11 @@ class ToolSchema(BaseModel):
     parameters: Dict[str, Any] = Field(default_factory=dict)
 
 
+class CacheControl(BaseModel):
+    bypass: bool = False  # skip the lookup; the fresh result still refreshes the cache
+    max_age: Optional[float] = None  # only accept entries younger than this many seconds
+
+
 class InferenceRequest(BaseModel):
     backend: Backend
     model: str
@@ -28,8 +39,27 @@ class InferenceRequest(BaseModel):
     tools: Optional[List[ToolSchema]] = None
     temperature: float = 0.2
     max_tokens: int = 512
-    response_format: str = "text"
+    response_format: str = "text"  # "text" or "json"; json_schema/grammar imply constrained output
+    json_schema: Optional[Dict[str, Any]] = None
+    grammar: Optional[str] = None
+    tool_choice: Optional[str] = None
     stream: bool = False
+    priority: Priority = Priority.INTERACTIVE
+    tenant: Optional[str] = None
+    prompt_version: Optional[str] = None
+    agent_id: Optional[int] = None
+    # Conversation id: successive turns go to the same replica so its prefix/KV cache is reused.
+    session_id: Optional[str] = None
+    # Prefix-cache hints: llama.cpp ``cache_prompt`` and Ollama ``keep_alive`` (router default when unset).
+    cache_prompt: bool = True
+    keep_alive: Optional[str] = None
+    cache_control: CacheControl = Field(default_factory=CacheControl)
+
+
+class BatchItem(InferenceRequest):
+    """One line of a batch job; ``custom_id`` is echoed on its result line."""
+
+    custom_id: Optional[str] = None
 
 
 class ToolCall(BaseModel):
@@ -45,3 +75,12 @@ class InferenceResponse(BaseModel):
     tool_calls: List[ToolCall] = Field(default_factory=list)
     meta: Dict[str, Any] = Field(default_factory=dict)
     stream_chunks: Optional[List[str]] = None
+
+
+class ModelRef(BaseModel):
+    backend: str
+    model: str
+
+
+class PreloadRequest(BaseModel):
+    models: List[ModelRef]
@@ -0,0 +1,121 @@
+"""Single-flight deduplication: identical in-flight requests share one generation.
+
+A request is identified by a canonical fingerprint of what determines the
+output. The first request (the leader) starts a ``Flight`` that runs as its own
+task; identical requests arriving while it is generating subscribe to it and
+replay the chunks produced so far before following live. A request only joins
+a flight of its own or a higher priority, so interactive traffic never ends up
+waiting in the batch queue behind someone else's generation. The generation is
+cancelled only when every subscriber has gone away.
+"""
+import asyncio
+import hashlib
+import json
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from llm_router.backends import Chunk
+from llm_router.schemas import Backend, InferenceRequest
+
+
+def fingerprint(request: InferenceRequest, backend: Backend) -> str:
+    # Output constraints change the answer as much as sampling does.
+    canonical = {
+        "backend": backend.value,
+        "model": request.model,
+        "messages": [m.model_dump() for m in request.messages],
+        "temperature": request.temperature,
+        "max_tokens": request.max_tokens,
+        "tools": [t.model_dump() for t in request.tools or []],
+        "tool_choice": request.tool_choice,
+        "response_format": request.response_format,
+        "json_schema": request.json_schema,
+        "grammar": request.grammar,
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """One shared generation: a replayable, append-only chunk log plus its outcome."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[Chunk] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.subscribers = 0
+        # Set by the producer; read by callers to build response metadata.
+        self.slot = None
+        self.generation = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: Chunk) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def _finish(self, error: Optional[BaseException] = None) -> None:
+        self.error = error
+        self.finished = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Chunk]:
+        """All chunks from the start; raises the producer's error once the log is drained."""
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(self.chunks):
+                    position += 1
+                    yield self.chunks[position - 1]
+                if self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished and self.task is not None:
+                self.task.cancel()
+
+
+class FlightRegistry:
+    def __init__(self):
+        self.flights: Dict[str, Flight] = {}
+
+    def join(
+        self, key: str, produce: Callable[[Flight], Awaitable[None]], shared: Sequence[str] = ()
+    ) -> Tuple[Flight, bool]:
+        """The in-flight generation for ``key``, started with ``produce`` if there is none; True if new.
+
+        ``shared`` are other keys, checked first, whose flights are acceptable stand-ins for ``key``.
+        """
+        for candidate in (*shared, key):
+            flight = self.flights.get(candidate)
+            if flight is not None:
+                return flight, False
+        flight = Flight(key)
+        self.flights[key] = flight
+        flight.task = asyncio.create_task(self._run(flight, produce))
+        return flight, True
+
+    def forget(self, flight: Flight) -> None:
+        """Stop handing ``flight`` to new requests; its current subscribers keep following it."""
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+
+    async def _run(self, flight: Flight, produce: Callable[[Flight], Awaitable[None]]) -> None:
+        try:
+            await produce(flight)
+        except asyncio.CancelledError as exc:
+            flight._finish(exc)
+        except Exception as exc:  # noqa: broad-except - surfaced to every subscriber
+            flight._finish(exc)
+        else:
+            flight._finish()
+        finally:
+            self.forget(flight)
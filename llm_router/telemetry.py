@@ -0,0 +1,188 @@
+"""Per-request router telemetry: Prometheus metrics plus batched ``LLMInferenceLog`` rows.
+
+The router has no database access. Finished records are queued in memory and
+shipped in batches to the Django worker as one ``llm.tasks.record_inference_logs``
+Celery task per batch, from a background loop so requests never wait on the
+broker. When the queue is full, records are dropped and counted; they are never
+allowed to block a request.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from llm_router.config import RouterConfig
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+ROUTER_REQUESTS = Counter(
+    "llm_router_requests_total", "Router inference requests", ["backend", "model", "priority", "outcome"]
+)
+ROUTER_QUEUE_WAIT = Histogram(
+    "llm_router_queue_wait_seconds", "Time waiting for an admission slot", ["backend", "priority"], buckets=LATENCY_BUCKETS
+)
+ROUTER_TTFT = Histogram("llm_router_ttft_seconds", "Time to first token", ["backend", "model"], buckets=LATENCY_BUCKETS)
+ROUTER_PREFILL = Histogram(
+    "llm_router_prefill_seconds", "Prompt processing time reported by the backend", ["backend", "model"], buckets=LATENCY_BUCKETS
+)
+ROUTER_LATENCY = Histogram(
+    "llm_router_latency_seconds", "Total request latency", ["backend", "model"], buckets=LATENCY_BUCKETS
+)
+ROUTER_TOKENS = Counter("llm_router_tokens_total", "Tokens processed", ["backend", "model", "kind"])
+ROUTER_TOKENS_PER_SECOND = Histogram(
+    "llm_router_tokens_per_second",
+    "Completion tokens per second of decode time",
+    ["backend", "model"],
+    buckets=(1, 5, 10, 20, 40, 80, 160, 320),
+)
+ROUTER_CACHE = Counter("llm_router_response_cache_total", "Response cache lookups", ["result"])
+ROUTER_ENDPOINT_REQUESTS = Counter("llm_router_endpoint_requests_total", "Requests served per endpoint", ["endpoint"])
+ROUTER_LOGS_DROPPED = Counter("llm_router_inference_logs_dropped_total", "Inference log records not shipped")
+ROUTER_HEDGES = Counter(
+    "llm_router_hedges_total", "Hedged generations by result (fired, suppressed, won, lost)", ["backend", "model", "result"]
+)
+ROUTER_HEDGE_RATE = Gauge("llm_router_hedge_rate", "Share of recent generations that were hedged")
+ROUTER_AFFINITY = Counter(
+    "llm_router_affinity_total", "Session requests served by their home endpoint or moved off it", ["backend", "result"]
+)
+
+
+@dataclass
+class InferenceRecord:
+    backend: str
+    model: str
+    priority: str
+    tenant: Optional[str] = None
+    agent_id: Optional[int] = None
+    endpoint: str = ""
+    cache: str = "off"
+    deduplicated: bool = False
+    hedged: bool = False
+    affinity: str = ""
+    success: bool = True
+    error: str = ""
+    queue_ms: float = 0.0
+    ttft_ms: Optional[float] = None
+    latency_ms: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Backend-reported prefill time and prompt tokens served from its prefix cache, when available.
+    prefill_ms: Optional[float] = None
+    cached_tokens: Optional[int] = None
+    tokens_per_second: Optional[float] = None
+    request: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+
+
+class RequestTimer:
+    """Marks the phases of one request relative to its arrival."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token: Optional[float] = None
+
+    def token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+
+    def finish(self, record: InferenceRecord, usage: Dict[str, int]) -> InferenceRecord:
+        now = time.monotonic()
+        record.latency_ms = round((now - self.started) * 1000, 1)
+        if self.first_token is not None:
+            record.ttft_ms = round((self.first_token - self.started) * 1000, 1)
+        record.prompt_tokens = usage.get("prompt_tokens") or 0
+        record.completion_tokens = usage.get("completion_tokens") or 0
+        if record.cache != "hit":
+            record.prefill_ms = usage.get("prompt_ms")
+            record.cached_tokens = usage.get("cached_tokens")
+        decode = now - (self.first_token or self.started)
+        if record.completion_tokens and decode > 0 and record.cache != "hit" and not record.deduplicated:
+            record.tokens_per_second = round(record.completion_tokens / decode, 1)
+        return record
+
+
+def observe(record: InferenceRecord) -> None:
+    labels = {"backend": record.backend, "model": record.model}
+    outcome = "cache_hit" if record.cache == "hit" else "deduplicated" if record.deduplicated else "generated"
+    ROUTER_REQUESTS.labels(priority=record.priority, outcome=outcome if record.success else "error", **labels).inc()
+    if record.cache != "off":
+        ROUTER_CACHE.labels(result=record.cache).inc()
+    if not record.success:
+        return
+    ROUTER_LATENCY.labels(**labels).observe(record.latency_ms / 1000)
+    if record.ttft_ms is not None:
+        ROUTER_TTFT.labels(**labels).observe(record.ttft_ms / 1000)
+    if outcome != "generated":
+        # Shared and cached answers did not use the GPU; keep capacity metrics honest.
+        return
+    ROUTER_QUEUE_WAIT.labels(backend=record.backend, priority=record.priority).observe(record.queue_ms / 1000)
+    ROUTER_TOKENS.labels(kind="prompt", **labels).inc(record.prompt_tokens)
+    ROUTER_TOKENS.labels(kind="completion", **labels).inc(record.completion_tokens)
+    if record.cached_tokens:
+        ROUTER_TOKENS.labels(kind="cached_prompt", **labels).inc(record.cached_tokens)
+    if record.prefill_ms is not None:
+        ROUTER_PREFILL.labels(**labels).observe(record.prefill_ms / 1000)
+    if record.tokens_per_second is not None:
+        ROUTER_TOKENS_PER_SECOND.labels(**labels).observe(record.tokens_per_second)
+    if record.endpoint:
+        ROUTER_ENDPOINT_REQUESTS.labels(endpoint=record.endpoint).inc()
+    if record.affinity:
+        ROUTER_AFFINITY.labels(backend=record.backend, result=record.affinity).inc()
+
+
+class LogShipper:
+    """Buffers records and ships them in batches with a blocking ``send`` run off the event loop."""
+
+    def __init__(self, send: Optional[Callable[[List[Dict[str, Any]]], None]], batch_size: int, flush_interval: float, max_pending: int = 10000):
+        self.send = send
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: List[Dict[str, Any]] = []
+        self._wake = asyncio.Event()
+
+    def submit(self, record: InferenceRecord) -> None:
+        if self.send is None:
+            return
+        if len(self.pending) >= self.max_pending:
+            ROUTER_LOGS_DROPPED.inc()
+            return
+        self.pending.append(asdict(record))
+        if len(self.pending) >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self) -> None:
+        while self.pending:
+            batch, self.pending = self.pending[: self.batch_size], self.pending[self.batch_size :]
+            try:
+                await asyncio.to_thread(self.send, batch)
+            except Exception as exc:  # noqa: broad-except - telemetry must not take the router down
+                logger.warning("Could not ship %s inference logs: %s", len(batch), exc)
+                ROUTER_LOGS_DROPPED.inc(len(batch))
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+
+def build_shipper(config: RouterConfig) -> LogShipper:
+    send = None
+    if config.log_broker_url:
+        from celery import Celery
+
+        celery = Celery("llm_router", broker=config.log_broker_url)
+
+        def send(batch):
+            celery.send_task("llm.tasks.record_inference_logs", args=[batch])
+
+    return LogShipper(send, config.log_batch_size, config.log_flush_interval)
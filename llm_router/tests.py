@@ -0,0 +1,814 @@
+import asyncio
+import json
+import tempfile
+import time
+import unittest
+
+import httpx
+
+from llm_router.admission import Admission, AdmissionQueue
+from llm_router.batch import BatchRunner, BatchStore
+from llm_router.cache import ResponseCache
+from llm_router.config import BackendConfig, RouterConfig
+from llm_router.hedging import Hedger
+from llm_router.main import _run_batch_item, app
+from llm_router.pool import EndpointPool
+from llm_router.residency import ResidencyManager
+from llm_router.schemas import Backend, BatchItem, Priority
+from llm_router.singleflight import FlightRegistry
+from llm_router.telemetry import LogShipper
+
+
+def _ollama_reply(*words):
+    """Ollama NDJSON stream emitting one chunk per word."""
+    lines = [json.dumps({"message": {"role": "assistant", "content": word}, "done": False}) for word in words]
+    lines.append(json.dumps({"message": {"role": "assistant", "content": ""}, "done": True, "prompt_eval_count": 7, "eval_count": len(words)}))
+    return httpx.Response(200, text="\n".join(lines) + "\n")
+
+
+def _openai_reply(tokens):
+    """vLLM/llama.cpp SSE stream with a trailing usage event."""
+    events = [{"choices": [{"delta": {"content": token}}]} for token in tokens]
+    events.append({"choices": [], "usage": {"prompt_tokens": 7, "completion_tokens": len(tokens)}})
+    body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+    return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+
+def _sse_events(response):
+    return [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+
+class RouterTestCase(unittest.TestCase):
+    """Runs the ASGI app in-process against mocked backends."""
+
+    backends = {Backend.OLLAMA: BackendConfig(Backend.OLLAMA, ("http://ollama",))}
+    router_options = {}
+
+    def handler(self, request: httpx.Request):
+        return _ollama_reply("hello")
+
+    def setUp(self):
+        self.config = RouterConfig(backends=self.backends, **self.router_options)
+        app.state.config = self.config
+        app.state.pool = EndpointPool(self.config, transport=httpx.MockTransport(self.handler))
+        app.state.admission = Admission(self.config)
+        app.state.flights = FlightRegistry()
+        app.state.cache = ResponseCache(self.config)
+        app.state.residency = ResidencyManager(app.state.pool, self.config)
+        app.state.hedger = Hedger(self.config)
+        self.shipped = []
+        app.state.logs = LogShipper(self.shipped.append, batch_size=50, flush_interval=1)
+        self.addCleanup(lambda: asyncio.run(app.state.pool.aclose()))
+
+    def run_requests(self, *payloads):
+        async def go():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://router") as client:
+                return await asyncio.gather(*[client.post("/llm/infer", json=payload) for payload in payloads])
+
+        return asyncio.run(go())
+
+    def call(self, method, path, **kwargs):
+        async def go():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://router") as client:
+                response = await client.request(method, path, **kwargs)
+                # Let background work started by the request (e.g. model loads) finish.
+                await asyncio.sleep(0.05)
+                return response
+
+        return asyncio.run(go())
+
+    def payload(self, text="hi", **extra):
+        return {"backend": "ollama", "model": "m", "messages": [{"role": "user", "content": text}], **extra}
+
+
+class AsyncBackendTests(RouterTestCase):
+    async def handler(self, request):
+        await asyncio.sleep(0.2)
+        return _ollama_reply(json.loads(request.content)["messages"][0]["content"])
+
+    def test_generations_run_concurrently(self):
+        started = time.monotonic()
+        responses = self.run_requests(*[self.payload(str(n)) for n in range(20)])
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual([r.json()["output"] for r in responses], [str(n) for n in range(20)])
+
+
+class StreamingTests(RouterTestCase):
+    backends = {
+        Backend.OLLAMA: BackendConfig(Backend.OLLAMA, ("http://ollama",)),
+        Backend.VLLM: BackendConfig(Backend.VLLM, ("http://vllm",)),
+    }
+
+    def handler(self, request):
+        if request.url.host == "vllm":
+            return _openai_reply(["Hel", "lo"])
+        return _ollama_reply("Hel", "lo")
+
+    def test_sse_deltas_are_normalized_across_backends(self):
+        for backend in ("ollama", "vllm"):
+            (response,) = self.run_requests(self.payload(backend=backend, stream=True))
+            self.assertEqual(response.headers["content-type"].split(";")[0], "text/event-stream")
+            events = _sse_events(response)
+            self.assertEqual([e["delta"] for e in events if e["type"] == "delta"], ["Hel", "lo"])
+            self.assertEqual(events[-1]["type"], "done")
+            self.assertEqual(events[-1]["output"], "Hello")
+            self.assertEqual(events[-1]["usage"], {"prompt_tokens": 7, "completion_tokens": 2})
+
+    def test_non_streaming_request_aggregates_the_stream(self):
+        (response,) = self.run_requests(self.payload(backend="vllm"))
+        self.assertEqual(response.json()["output"], "Hello")
+        self.assertEqual(response.json()["meta"]["usage"]["completion_tokens"], 2)
+
+
+class LoadBalancingTests(RouterTestCase):
+    backends = {
+        Backend.OLLAMA: BackendConfig(Backend.OLLAMA, ("http://ollama-a", "http://ollama-b")),
+        Backend.VLLM: BackendConfig(Backend.VLLM, ("http://vllm",)),
+    }
+    router_options = {
+        "model_equivalents": ({Backend.OLLAMA: "m", Backend.VLLM: "org/m"},),
+        "breaker_failures": 2,
+    }
+    down = ()
+
+    async def handler(self, request):
+        if request.url.host in self.down:
+            raise httpx.ConnectError("refused", request=request)
+        if request.url.host == "vllm":
+            return _openai_reply(["from-vllm"])
+        await asyncio.sleep(0.1)
+        return _ollama_reply(request.url.host)
+
+    def test_concurrent_requests_spread_across_replicas(self):
+        responses = self.run_requests(*[self.payload(str(n)) for n in range(10)])
+        hosts = [r.json()["output"] for r in responses]
+        self.assertEqual(hosts.count("ollama-a"), 5)
+        self.assertEqual(hosts.count("ollama-b"), 5)
+
+    def test_fails_over_to_replica_then_equivalent_model(self):
+        self.down = ("ollama-a",)
+        (response,) = self.run_requests(self.payload())
+        self.assertEqual(response.json()["output"], "ollama-b")
+        self.assertTrue(response.json()["meta"]["failover"])
+
+        self.down = ("ollama-a", "ollama-b")
+        (response,) = self.run_requests(self.payload(stream=True))
+        events = _sse_events(response)
+        self.assertEqual(events[-1]["backend"], "vllm")
+        self.assertEqual(events[-1]["model"], "org/m")
+        self.assertEqual(events[-1]["output"], "from-vllm")
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        self.down = ("ollama-a",)
+        self.run_requests(self.payload())
+        self.run_requests(self.payload())
+        endpoint = app.state.pool.endpoints[Backend.OLLAMA][0]
+        self.assertFalse(endpoint.available())
+        self.down = ()
+        responses = self.run_requests(*[self.payload(str(n)) for n in range(3)])
+        self.assertEqual({r.json()["output"] for r in responses}, {"ollama-b"})
+
+    def test_unhealthy_endpoints_are_skipped_and_503_when_none_left(self):
+        self.down = ("ollama-a", "ollama-b", "vllm")
+        asyncio.run(app.state.pool.probe_all())
+        self.assertFalse(any(e.healthy for e in app.state.pool.all()))
+        (response, streamed) = self.run_requests(self.payload(), self.payload(stream=True))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(streamed.status_code, 503)
+
+
+class AdmissionTests(RouterTestCase):
+    router_options = {
+        "concurrency": {Backend.OLLAMA: 2},
+        "queue_budgets": {Priority.INTERACTIVE: 0.15, Priority.BACKGROUND: 5, Priority.BATCH: 5},
+        "model_equivalents": ({Backend.LLAMACPP: "lm", Backend.OLLAMA: "m"},),
+    }
+
+    async def handler(self, request):
+        self.running = getattr(self, "running", 0) + 1
+        self.peak = max(getattr(self, "peak", 0), self.running)
+        await asyncio.sleep(0.1)
+        self.running -= 1
+        return _ollama_reply("ok")
+
+    def test_backend_concurrency_is_capped_and_queue_wait_reported(self):
+        responses = self.run_requests(*[self.payload(str(n), priority="background") for n in range(6)])
+        self.assertEqual({r.status_code for r in responses}, {200})
+        self.assertEqual(self.peak, 2)
+        queue_ms = sorted(r.json()["meta"]["queue_ms"] for r in responses)
+        self.assertLess(queue_ms[0], 50)
+        self.assertGreater(queue_ms[-1], 150)
+        self.assertTrue(all(r.json()["meta"]["generation_ms"] >= 90 for r in responses))
+
+    def test_sheds_with_429_once_the_queue_budget_is_exceeded(self):
+        responses = self.run_requests(*[self.payload(str(n)) for n in range(8)])
+        shed = [r for r in responses if r.status_code == 429]
+        self.assertTrue(shed)
+        self.assertGreaterEqual(int(shed[0].headers["Retry-After"]), 1)
+        self.assertEqual(app.state.admission.queues[Backend.OLLAMA].active, 0)
+
+    def test_unconfigured_backend_is_a_503_unless_an_equivalent_is_configured(self):
+        (response, streamed) = self.run_requests(self.payload(backend="vllm"), self.payload("s", backend="vllm", stream=True))
+        self.assertEqual((response.status_code, streamed.status_code), (503, 503))
+        self.assertIn("not configured", response.json()["detail"])
+
+        (response,) = self.run_requests(self.payload("equivalent", backend="llamacpp", model="lm"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["backend"], response.json()["model"]), ("ollama", "m"))
+
+    def test_priorities_first_then_tenants_round_robin(self):
+        async def go():
+            queue = AdmissionQueue(Backend.OLLAMA, 1, {p: 5 for p in Priority})
+            held = await queue.acquire(Priority.INTERACTIVE, "")
+            order = []
+
+            async def request(priority, tenant, name):
+                slot = await queue.acquire(priority, tenant)
+                order.append(name)
+                slot.release()
+
+            tasks = []
+            for priority, tenant, name in [
+                (Priority.BATCH, "a", "batch-a"),
+                (Priority.INTERACTIVE, "a", "a1"),
+                (Priority.INTERACTIVE, "a", "a2"),
+                (Priority.INTERACTIVE, "a", "a3"),
+                (Priority.INTERACTIVE, "b", "b1"),
+            ]:
+                tasks.append(asyncio.create_task(request(priority, tenant, name)))
+                await asyncio.sleep(0)
+            held.release()
+            await asyncio.gather(*tasks)
+            return order
+
+        self.assertEqual(asyncio.run(go()), ["a1", "b1", "a2", "a3", "batch-a"])
+
+
+class FailoverAdmissionTests(RouterTestCase):
+    backends = {
+        Backend.LLAMACPP: BackendConfig(Backend.LLAMACPP, ("http://llamacpp",)),
+        Backend.OLLAMA: BackendConfig(Backend.OLLAMA, ("http://ollama",)),
+    }
+    router_options = {
+        "concurrency": {Backend.LLAMACPP: 8, Backend.OLLAMA: 1},
+        "model_equivalents": ({Backend.LLAMACPP: "lm", Backend.OLLAMA: "m"},),
+    }
+
+    async def handler(self, request):
+        if request.url.host == "llamacpp":
+            return httpx.Response(500, text="down")
+        self.running = getattr(self, "running", 0) + 1
+        self.peak = max(getattr(self, "peak", 0), self.running)
+        await asyncio.sleep(0.1)
+        self.running -= 1
+        return _ollama_reply("ok")
+
+    def test_failover_to_another_backend_respects_its_concurrency_cap(self):
+        responses = self.run_requests(*[self.payload(str(n), backend="llamacpp", model="lm") for n in range(4)])
+        served = [r for r in responses if r.status_code == 200]
+        self.assertEqual(self.peak, 1)
+        self.assertTrue(served)
+        self.assertEqual({r.json()["backend"] for r in served}, {"ollama"})
+        self.assertIn("concurrency limit", next(r for r in responses if r.status_code == 503).json()["detail"])
+        self.assertEqual([q.active for q in app.state.admission.queues.values()], [0, 0])
+
+
+class SingleFlightTests(RouterTestCase):
+    async def handler(self, request):
+        self.calls = getattr(self, "calls", 0) + 1
+        await asyncio.sleep(0.1)
+        return _ollama_reply("Hel", "lo")
+
+    def test_identical_concurrent_requests_share_one_generation(self):
+        responses = self.run_requests(*[self.payload() for _ in range(5)], self.payload(stream=True), self.payload(stream=True))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual({r.json()["output"] for r in responses[:5]}, {"Hello"})
+        self.assertEqual(sum(r.json()["meta"]["deduplicated"] for r in responses[:5]), 4)
+        for streamed in responses[5:]:
+            events = _sse_events(streamed)
+            self.assertEqual([e["delta"] for e in events if e["type"] == "delta"], ["Hel", "lo"])
+            self.assertTrue(events[-1]["meta"]["deduplicated"])
+        self.assertEqual(app.state.flights.flights, {})
+
+    def test_requests_differing_in_sampling_or_tools_are_not_merged(self):
+        self.run_requests(
+            self.payload(),
+            self.payload(temperature=0.9),
+            self.payload(tools=[{"name": "refund_order"}]),
+            self.payload(priority="batch"),
+        )
+        self.assertEqual(self.calls, 3)
+
+    def test_interactive_request_does_not_join_a_lower_priority_flight(self):
+        async def go():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://router") as client:
+                batch = asyncio.create_task(client.post("/llm/infer", json=self.payload(priority="batch")))
+                await asyncio.sleep(0.03)
+                interactive = await client.post("/llm/infer", json=self.payload())
+                return await batch, interactive
+
+        batch, interactive = asyncio.run(go())
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(interactive.json()["meta"]["deduplicated"])
+        self.assertEqual(interactive.json()["meta"]["priority"], "interactive")
+
+    def test_generation_is_cancelled_when_every_subscriber_leaves(self):
+        async def go():
+            started, cancelled = asyncio.Event(), asyncio.Event()
+
+            async def produce(flight):
+                started.set()
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+
+            registry = FlightRegistry()
+            flight, _ = registry.join("key", produce)
+            subscription = flight.subscribe()
+            waiting = asyncio.create_task(subscription.__anext__())
+            await started.wait()
+            waiting.cancel()
+            await asyncio.wait_for(cancelled.wait(), 1)
+            await asyncio.sleep(0)
+            return registry.flights
+
+        self.assertEqual(asyncio.run(go()), {})
+
+
+class _FakeAsyncRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+class ResponseCacheTests(RouterTestCase):
+    router_options = {"response_cache": True, "response_cache_size": 2}
+
+    def handler(self, request):
+        self.calls = getattr(self, "calls", 0) + 1
+        if json.loads(request.content)["messages"][-1]["content"] == "cut":
+            # The connection closes before Ollama's done line.
+            return httpx.Response(200, text=json.dumps({"message": {"content": "Hal"}, "done": False}) + "\n")
+        return _ollama_reply("Hel", "lo")
+
+    def test_a_stream_without_its_done_marker_is_flagged_and_not_cached(self):
+        (first,) = self.run_requests(self.payload("cut"))
+        (again,) = self.run_requests(self.payload("cut"))
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(first.json()["output"], "Hal")
+        self.assertTrue(first.json()["meta"]["truncated"])
+        self.assertEqual(again.json()["meta"]["cache"]["result"], "miss")
+        (complete,) = self.run_requests(self.payload("whole"))
+        self.assertFalse(complete.json()["meta"]["truncated"])
+
+    def test_repeated_low_temperature_requests_skip_the_backend(self):
+        (miss,) = self.run_requests(self.payload(prompt_version="7"))
+        (hit,) = self.run_requests(self.payload(prompt_version="7"))
+        (streamed,) = self.run_requests(self.payload(prompt_version="7", stream=True))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(miss.json()["meta"]["cache"]["result"], "miss")
+        self.assertEqual(hit.json()["output"], "Hello")
+        self.assertEqual(hit.json()["meta"]["cache"]["result"], "hit")
+        self.assertEqual(hit.json()["meta"]["cache"]["hits"], 1)
+        self.assertEqual(hit.json()["meta"]["usage"]["completion_tokens"], 2)
+        events = _sse_events(streamed)
+        self.assertEqual(events[-1]["output"], "Hello")
+        self.assertEqual(events[-1]["meta"]["cache"]["tier"], "memory")
+
+    def test_prompt_version_temperature_and_cache_control_are_respected(self):
+        self.run_requests(self.payload(prompt_version="7"))
+        (new_prompt,) = self.run_requests(self.payload(prompt_version="8"))
+        (hot,) = self.run_requests(self.payload(prompt_version="7", temperature=0.9))
+        (bypass,) = self.run_requests(self.payload(prompt_version="7", cache_control={"bypass": True}))
+        (too_old,) = self.run_requests(self.payload(prompt_version="7", cache_control={"max_age": 0}))
+        self.assertEqual(self.calls, 5)
+        self.assertEqual(new_prompt.json()["meta"]["cache"]["result"], "miss")
+        self.assertEqual(hot.json()["meta"]["cache"]["result"], "off")
+        self.assertEqual(bypass.json()["meta"]["cache"]["result"], "bypass")
+        self.assertEqual(too_old.json()["meta"]["cache"]["result"], "miss")
+
+    def test_lru_eviction_and_redis_tier(self):
+        redis = _FakeAsyncRedis()
+        app.state.cache = ResponseCache(self.config, redis)
+        self.run_requests(self.payload("a"), self.payload("b"), self.payload("c"))
+        self.assertEqual(len(app.state.cache._local), 2)
+        self.assertEqual(len(redis.data), 3)
+
+        # A fresh router process shares the Redis tier.
+        app.state.cache = ResponseCache(self.config, redis)
+        (response,) = self.run_requests(self.payload("a"))
+        self.assertEqual(response.json()["meta"]["cache"]["tier"], "redis")
+        self.assertEqual(self.calls, 3)
+
+
+class ResidencyTests(RouterTestCase):
+    backends = {Backend.OLLAMA: BackendConfig(Backend.OLLAMA, ("http://ollama-a", "http://ollama-b"))}
+    router_options = {"preload_models": ((Backend.OLLAMA, "m"),), "ollama_keep_alive": "1h"}
+
+    def setUp(self):
+        self.loaded = {"ollama-a": ["m:latest"], "ollama-b": []}
+        self.bodies = []
+        super().setUp()
+
+    def handler(self, request):
+        host = request.url.host
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": [{"name": name} for name in self.loaded[host]]})
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": "m:latest"}, {"name": "other"}]})
+        body = json.loads(request.content)
+        self.bodies.append((host, request.url.path, body))
+        if request.url.path == "/api/generate":
+            self.loaded[host].append(body["model"])
+            return httpx.Response(200, json={"done": True})
+        return _ollama_reply(host)
+
+    def test_requests_prefer_endpoints_holding_the_model(self):
+        asyncio.run(app.state.residency.refresh())
+        responses = [self.run_requests(self.payload(str(n)))[0] for n in range(4)]
+        self.assertEqual({r.json()["output"] for r in responses}, {"ollama-a"})
+        self.assertTrue(all(body["keep_alive"] == "1h" for _, path, body in self.bodies if path == "/api/chat"))
+
+    def test_a_busy_holder_spills_to_the_other_endpoints(self):
+        asyncio.run(app.state.residency.refresh())
+        holder, other = app.state.pool.all()
+        holder.outstanding = 1
+        self.assertIs(app.state.pool.pick(Backend.OLLAMA, model="m"), holder)
+        holder.outstanding = 2
+        self.assertIs(app.state.pool.pick(Backend.OLLAMA, model="m"), other)
+        self.assertIs(app.state.pool.home(Backend.OLLAMA, "s", model="m"), holder)
+        holder.outstanding = 0
+
+    def test_sync_loads_wanted_models_where_missing(self):
+        asyncio.run(app.state.residency.sync())
+        self.assertEqual([(host, body["model"]) for host, path, body in self.bodies], [("ollama-b", "m")])
+        self.assertTrue(all(e.holds("m") for e in app.state.pool.all()))
+
+    def test_preload_push_and_residency_listing(self):
+        asyncio.run(app.state.residency.refresh())
+        response = self.call("POST", "/llm/models/preload", json={"models": [
+            {"backend": "ollama", "model": "other"},
+            {"backend": "openai", "model": "gpt"},
+        ]})
+        self.assertEqual(response.json()["wanted"], [{"backend": "ollama", "model": "m"}, {"backend": "ollama", "model": "other"}])
+        self.assertIn(("ollama-a", "/api/generate", {"model": "other", "keep_alive": "1h"}), self.bodies)
+
+        listing = self.call("GET", "/llm/ollama/models").json()
+        resident_on = {m["name"]: m["resident_on"] for m in listing["models"]}
+        self.assertEqual(resident_on["other"], ["http://ollama-a", "http://ollama-b"])
+        self.assertEqual(listing["residency"]["http://ollama-b"], ["m", "other"])
+
+
+class TelemetryTests(RouterTestCase):
+    router_options = {"response_cache": True}
+
+    async def handler(self, request):
+        await asyncio.sleep(0.05)
+        return _ollama_reply("Hel", "lo")
+
+    def shipped_records(self):
+        asyncio.run(app.state.logs.flush())
+        return [record for batch in self.shipped for record in batch]
+
+    def test_requests_are_measured_and_shipped_in_batches(self):
+        app.state.logs.batch_size = 2
+        self.run_requests(self.payload("a", agent_id=4, tenant="t"), self.payload("b", stream=True))
+        self.run_requests(self.payload("a", agent_id=4, tenant="t"))
+        records = self.shipped_records()
+        self.assertEqual([len(batch) for batch in self.shipped], [2, 1])
+
+        generated = next(r for r in records if r["request"]["stream"])
+        self.assertEqual(generated["endpoint"], "http://ollama")
+        self.assertEqual(generated["completion_tokens"], 2)
+        self.assertGreaterEqual(generated["ttft_ms"], 50)
+        self.assertGreaterEqual(generated["latency_ms"], generated["ttft_ms"])
+        self.assertIsNotNone(generated["tokens_per_second"])
+        self.assertEqual(generated["cache"], "miss")
+
+        cached = records[-1]
+        self.assertEqual((cached["cache"], cached["agent_id"], cached["tenant"]), ("hit", 4, "t"))
+        self.assertLess(cached["latency_ms"], 50)
+
+    def test_failures_are_recorded_and_metrics_exported(self):
+        app.state.pool.endpoints[Backend.OLLAMA][0].healthy = False
+        (response,) = self.run_requests(self.payload("down"))
+        self.assertEqual(response.status_code, 503)
+        (failure,) = self.shipped_records()
+        self.assertFalse(failure["success"])
+        self.assertIn("No LLM backend available", failure["error"])
+
+        app.state.pool.endpoints[Backend.OLLAMA][0].healthy = True
+        self.run_requests(self.payload("up"))
+        metrics = self.call("GET", "/metrics/").text
+        self.assertIn('llm_router_ttft_seconds_count{backend="ollama",model="m"}', metrics)
+        self.assertIn('llm_router_requests_total{backend="ollama",model="m",outcome="error",priority="interactive"}', metrics)
+
+
+class HedgingTests(RouterTestCase):
+    backends = {Backend.OLLAMA: BackendConfig(Backend.OLLAMA, ("http://ollama-a", "http://ollama-b"))}
+    router_options = {"hedging": True, "hedge_delay": 0.1, "hedge_max_rate": 1.0}
+
+    async def handler(self, request):
+        if request.url.host == "ollama-a":
+            await asyncio.sleep(0.5)
+        return _ollama_reply(request.url.host)
+
+    def test_late_first_token_is_hedged_and_the_loser_cancelled(self):
+        started = time.monotonic()
+        (response,) = self.run_requests(self.payload("slow primary"))
+        self.assertLess(time.monotonic() - started, 0.4)
+        body = response.json()
+        self.assertEqual(body["output"], "ollama-b")
+        self.assertTrue(body["meta"]["hedged"])
+        self.assertFalse(body["meta"]["failover"])
+        self.assertEqual([e.outstanding for e in app.state.pool.all()], [0, 0])
+        metrics = self.call("GET", "/metrics/").text
+        self.assertIn('llm_router_hedges_total{backend="ollama",model="m",result="won"}', metrics)
+
+    def test_hedge_rate_is_capped_and_batch_traffic_is_never_hedged(self):
+        app.state.hedger.max_rate = 0.5
+        (first,) = self.run_requests(self.payload("one"))
+        (second,) = self.run_requests(self.payload("two"))
+        self.assertTrue(first.json()["meta"]["hedged"])
+        self.assertFalse(second.json()["meta"]["hedged"])
+        self.assertEqual(second.json()["output"], "ollama-a")
+        self.assertEqual(app.state.hedger.rate(), 0.5)
+
+        app.state.hedger.tokens = 1.0
+        (batch,) = self.run_requests(self.payload("three", priority="batch"))
+        self.assertFalse(batch.json()["meta"]["hedged"])
+
+    def test_no_hedge_without_a_free_admission_slot(self):
+        app.state.admission = Admission(RouterConfig(backends=self.backends, concurrency={Backend.OLLAMA: 1}))
+        (response,) = self.run_requests(self.payload("no spare slot"))
+        self.assertEqual(response.json()["output"], "ollama-a")
+        self.assertFalse(response.json()["meta"]["hedged"])
+        self.assertEqual(app.state.hedger.tokens, 1.0)
+
+        app.state.admission = Admission(RouterConfig(backends=self.backends, concurrency={Backend.OLLAMA: 2}))
+        (hedged,) = self.run_requests(self.payload("spare slot"))
+        self.assertTrue(hedged.json()["meta"]["hedged"])
+        self.assertEqual(app.state.admission.queues[Backend.OLLAMA].active, 0)
+
+    def test_threshold_follows_the_rolling_ttft_quantile(self):
+        hedger = app.state.hedger
+        self.assertEqual(hedger.delay(Backend.OLLAMA, "m"), 0.1)
+        for n in range(100):
+            hedger.observe(Backend.OLLAMA, "m", (n + 1) / 100)
+        self.assertEqual(hedger.delay(Backend.OLLAMA, "m"), 0.95)
+        for _ in range(200):
+            hedger.observe(Backend.OLLAMA, "m", 0.001)
+        self.assertEqual(hedger.delay(Backend.OLLAMA, "m"), self.config.hedge_min_delay)
+
+
+class AffinityTests(RouterTestCase):
+    backends = {Backend.VLLM: BackendConfig(Backend.VLLM, ("http://vllm-a", "http://vllm-b", "http://vllm-c"))}
+
+    async def handler(self, request):
+        await asyncio.sleep(0.05)
+        return _openai_reply([request.url.host])
+
+    def payload(self, text="hi", **extra):
+        return super().payload(text, backend="vllm", **extra)
+
+    def test_turns_of_a_session_stick_to_one_replica(self):
+        hosts = {}
+        for session in map(str, range(12)):
+            for turn in range(3):
+                (response,) = self.run_requests(self.payload(f"{session}-{turn}", session_id=session))
+                self.assertEqual(response.json()["meta"]["affinity"], "home")
+                hosts.setdefault(session, set()).add(response.json()["output"])
+        self.assertTrue(all(len(served) == 1 for served in hosts.values()))
+        self.assertGreater(len(set().union(*hosts.values())), 1)
+
+    def test_overloaded_or_failed_home_spills_to_the_next_replica(self):
+        home = app.state.pool.home(Backend.VLLM, "s")
+        responses = self.run_requests(*[self.payload(str(n), session_id="s") for n in range(6)])
+        served = [r.json()["output"] for r in responses]
+        # Never more than ceil(1.25 * 6 / 3) requests on the home replica.
+        self.assertEqual(served.count(home.url.split("//")[1]), 3)
+        self.assertIn("moved", [r.json()["meta"]["affinity"] for r in responses])
+
+        home.healthy = False
+        (response,) = self.run_requests(self.payload("home down", session_id="s"))
+        self.assertNotEqual(response.json()["output"], home.url.split("//")[1])
+
+
+class PromptCacheTests(RouterTestCase):
+    backends = {
+        Backend.OLLAMA: BackendConfig(Backend.OLLAMA, ("http://ollama",)),
+        Backend.LLAMACPP: BackendConfig(Backend.LLAMACPP, ("http://llamacpp",)),
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.bodies = {}
+
+    def handler(self, request):
+        self.bodies[request.url.host] = json.loads(request.content)
+        if request.url.host == "llamacpp":
+            events = [
+                {"choices": [{"delta": {"content": "ok"}}]},
+                {"choices": [], "usage": {"prompt_tokens": 90, "completion_tokens": 1}, "timings": {"prompt_ms": 12.34, "cache_n": 80}},
+            ]
+            body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+            return httpx.Response(200, text=body)
+        lines = [json.dumps({"message": {"content": "ok"}, "done": True, "prompt_eval_count": 90, "prompt_eval_duration": 4500000})]
+        return httpx.Response(200, text="\n".join(lines) + "\n")
+
+    def test_cache_hints_are_passed_and_prefill_is_measured(self):
+        self.run_requests(self.payload("a", backend="llamacpp"), self.payload("b", keep_alive="2h"))
+        self.assertIs(self.bodies["llamacpp"]["cache_prompt"], True)
+        self.assertEqual(self.bodies["ollama"]["keep_alive"], "2h")
+        self.run_requests(self.payload("c", backend="llamacpp", cache_prompt=False), self.payload("d"))
+        self.assertIs(self.bodies["llamacpp"]["cache_prompt"], False)
+        self.assertEqual(self.bodies["ollama"]["keep_alive"], self.config.ollama_keep_alive)
+
+        asyncio.run(app.state.logs.flush())
+        records = {r["backend"]: r for batch in self.shipped for r in batch}
+        self.assertEqual((records["llamacpp"]["prefill_ms"], records["llamacpp"]["cached_tokens"]), (12.3, 80))
+        self.assertEqual(records["ollama"]["prefill_ms"], 4.5)
+        metrics = self.call("GET", "/metrics/").text
+        self.assertIn('llm_router_prefill_seconds_count{backend="llamacpp",model="m"}', metrics)
+        self.assertIn('llm_router_tokens_total{backend="llamacpp",kind="cached_prompt",model="m"}', metrics)
+
+
+class BatchTests(RouterTestCase):
+    backends = {Backend.VLLM: BackendConfig(Backend.VLLM, ("http://vllm",))}
+    router_options = {"concurrency": {Backend.VLLM: 2}}
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.prompts = []
+
+    def runner(self):
+        return BatchRunner(BatchStore(self.directory.name), lambda item: _run_batch_item(app, item), concurrency=4)
+
+    async def handler(self, request):
+        prompt = json.loads(request.content)["messages"][-1]["content"]
+        self.prompts.append(prompt)
+        await asyncio.sleep(0.02)
+        if prompt == "broken":
+            return httpx.Response(500, text="boom")
+        return _openai_reply([prompt.upper()])
+
+    def item(self, text, **extra):
+        return {"backend": "vllm", "model": "m", "messages": [{"role": "user", "content": text}], **extra}
+
+    def run_job(self, submit):
+        """Submit with ``submit(client)``, then poll the job until it leaves the queue."""
+
+        async def go():
+            app.state.batches = self.runner()
+            task = asyncio.create_task(app.state.batches.run())
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://router") as client:
+                job = (await submit(client)).json()
+                while job["status"] in ("queued", "running"):
+                    await asyncio.sleep(0.02)
+                    job = (await client.get(f"/llm/batch/{job['id']}")).json()
+                results = (await client.get(job["results_url"])).text
+            task.cancel()
+            return job, [json.loads(line) for line in results.splitlines()]
+
+        return asyncio.run(go())
+
+    def test_jsonl_job_runs_at_batch_priority_and_streams_results_to_a_file(self):
+        lines = [self.item(f"item {n}", custom_id=f"c{n}") for n in range(6)] + [self.item("broken")]
+        body = "\n".join(json.dumps(line) for line in lines)
+        job, results = self.run_job(
+            lambda client: client.post("/llm/batch", content=body, headers={"content-type": "application/x-ndjson"})
+        )
+        self.assertEqual((job["status"], job["total"], job["completed"], job["failed"]), ("completed", 7, 7, 1))
+        by_id = {r["custom_id"]: r for r in results}
+        self.assertEqual(by_id["c3"]["output"], "ITEM 3")
+        self.assertEqual(by_id["c3"]["index"], 3)
+        self.assertIn("500", next(r for r in results if r["index"] == 6)["error"])
+        asyncio.run(app.state.logs.flush())
+        self.assertEqual({r["priority"] for batch in self.shipped for r in batch}, {"batch"})
+
+    def test_json_list_is_accepted_and_invalid_items_rejected(self):
+        job, results = self.run_job(lambda client: client.post("/llm/batch", json={"requests": [self.item("one")]}))
+        self.assertEqual(results[0]["output"], "ONE")
+        response = self.call("POST", "/llm/batch", json=[self.item("ok"), {"model": "m"}])
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()["detail"][0]["index"], 1)
+
+    def test_unfinished_job_resumes_after_restart_without_rerunning_items(self):
+        store = BatchStore(self.directory.name)
+        job = store.create([BatchItem.model_validate(self.item(text)) for text in ("a", "b", "c")])
+        store.append_result(job["id"], {"index": 0, "custom_id": None, "output": "A", "error": None})
+        with open(store.results_path(job["id"]), "a") as f:
+            f.write('{"index": 1, "outp')  # torn by a crash mid-write
+        job["status"] = "running"
+        store.save(job)
+
+        async def go():
+            runner = self.runner()
+            task = asyncio.create_task(runner.run())
+            while (runner.status(job["id"]) or {}).get("status") != "completed":
+                await asyncio.sleep(0.02)
+            task.cancel()
+
+        asyncio.run(go())
+        self.assertEqual(sorted(self.prompts), ["b", "c"])
+        self.assertEqual(sorted(r["index"] for r in store.results(job["id"])), [0, 1, 2])
+        self.assertEqual(store.load(job["id"])["completed"], 3)
+
+    def test_an_item_that_raises_becomes_an_error_line_and_the_job_completes(self):
+        store = BatchStore(self.directory.name)
+
+        async def execute(item):
+            text = item.messages[-1].content
+            if text == "explodes":
+                raise RuntimeError("unexpected")
+            await asyncio.sleep(0.02)
+            return {"output": text, "error": None}
+
+        async def go():
+            runner = BatchRunner(store, execute, concurrency=2)
+            job = runner.submit([BatchItem.model_validate(self.item(text)) for text in ("a", "explodes", "b", "c")])
+            task = asyncio.create_task(runner.run())
+            while (runner.status(job["id"]) or {}).get("status") in ("queued", "running"):
+                await asyncio.sleep(0.02)
+            task.cancel()
+            return store.load(job["id"])
+
+        job = asyncio.run(go())
+        self.assertEqual((job["status"], job["completed"], job["failed"]), ("completed", 4, 1))
+        errors = [r for r in store.results(job["id"]) if r["error"]]
+        self.assertEqual([(r["index"], r["error"]) for r in errors], [(1, "RuntimeError: unexpected")])
+
+    def test_items_for_unconfigured_backends_are_rejected_at_submit(self):
+        response = self.call("POST", "/llm/batch", json=[self.item("ok"), {**self.item("nope"), "backend": "ollama"}])
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()["detail"], [{"index": 1, "errors": [{"loc": ["backend"], "msg": "ollama is not configured"}]}])
+
+
+def _openai_tool_reply(name, argument_parts):
+    events = [{"choices": [{"delta": {"tool_calls": [{"index": 0, "id": "c1", "function": {"name": name, "arguments": ""}}]}}]}]
+    events += [{"choices": [{"delta": {"tool_calls": [{"index": 0, "function": {"arguments": part}}]}}]} for part in argument_parts]
+    body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+    return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+
+class ToolCallingTests(RouterTestCase):
+    backends = {
+        Backend.OLLAMA: BackendConfig(Backend.OLLAMA, ("http://ollama",)),
+        Backend.VLLM: BackendConfig(Backend.VLLM, ("http://vllm",)),
+        Backend.LLAMACPP: BackendConfig(Backend.LLAMACPP, ("http://llamacpp",)),
+    }
+    tools = [{"name": "refund_order", "description": "Refund", "parameters": {"type": "object", "properties": {"order_id": {"type": "string"}}}}]
+
+    def setUp(self):
+        self.bodies = {}
+        super().setUp()
+
+    def handler(self, request):
+        body = json.loads(request.content)
+        self.bodies[request.url.host] = body
+        if body.get("tools") and request.url.host == "ollama":
+            call = {"function": {"name": "refund_order", "arguments": {"order_id": "A1"}}}
+            lines = [
+                json.dumps({"message": {"content": "", "tool_calls": [call]}, "done": False}),
+                json.dumps({"message": {"content": ""}, "done": True, "eval_count": 5}),
+            ]
+            return httpx.Response(200, text="\n".join(lines) + "\n")
+        if body.get("tools"):
+            return _openai_tool_reply("refund_order", ['{"order_', 'id": "A1"}'])
+        if request.url.host == "ollama":
+            return _ollama_reply('{"ok": true}')
+        return _openai_reply(["not json"])
+
+    def test_native_tool_calls_are_parsed_for_every_backend(self):
+        responses = self.run_requests(*[self.payload(backend=b, tools=self.tools, tool_choice="auto") for b in ("ollama", "vllm", "llamacpp")])
+        for response in responses:
+            self.assertEqual(response.json()["tool_calls"], [{"tool": "refund_order", "arguments": {"order_id": "A1"}, "result": None}])
+        self.assertEqual(self.bodies["vllm"]["tools"][0]["function"]["name"], "refund_order")
+        self.assertEqual(self.bodies["vllm"]["tool_choice"], "auto")
+        self.assertEqual(self.bodies["ollama"]["tools"][0]["type"], "function")
+
+        (streamed,) = self.run_requests(self.payload("s", backend="vllm", tools=self.tools, stream=True))
+        self.assertEqual(_sse_events(streamed)[-1]["tool_calls"], [{"tool": "refund_order", "arguments": {"order_id": "A1"}}])
+
+    def test_output_constraints_use_each_backends_native_field(self):
+        schema = {"type": "object", "properties": {"ok": {"type": "boolean"}}}
+        ollama, vllm, _ = self.run_requests(
+            self.payload(json_schema=schema),
+            self.payload(backend="vllm", response_format="json"),
+            self.payload(backend="llamacpp", grammar='root ::= "yes" | "no"'),
+        )
+        self.run_requests(self.payload("g", backend="vllm", grammar='root ::= "yes"'))
+        self.assertEqual(self.bodies["ollama"]["format"], schema)
+        self.assertEqual(self.bodies["llamacpp"]["grammar"], 'root ::= "yes" | "no"')
+        self.assertEqual(self.bodies["vllm"]["guided_grammar"], 'root ::= "yes"')
+        self.assertTrue(ollama.json()["meta"]["json_valid"])
+        self.assertFalse(vllm.json()["meta"]["json_valid"])
@@ -0,0 +1,20 @@
+#!/bin/bash
+
+# Start one single-process Celery worker per conversation shard queue so ingest
+# for a conversation stays ordered while shards run in parallel across cores.
+# Replies run on the regular worker pool. Only needed with CONVERSATION_SHARDS > 0.
+SHARDS=${CONVERSATION_SHARDS:-0}
+PREFIX=${CONVERSATION_SHARD_QUEUE_PREFIX:-conversations.shard}
+
+if ((SHARDS <= 0)); then
+  echo "CONVERSATION_SHARDS is 0; no shard workers to start." >&2
+  exit 0
+fi
+
+for ((i = 0; i < SHARDS; i++)); do
+  celery -A core worker -l info -c 1 --prefetch-multiplier 1 -Q "${PREFIX}.${i}" -n "shard${i}@%h" &
+done
+
+# Exit (and let the supervisor restart us) as soon as any shard worker dies.
+wait -n
+exit $?
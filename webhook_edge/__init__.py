@@ -0,0 +1 @@
+"""ASGI webhook edge package."""
@@ -0,0 +1,111 @@
+"""Minimal ASGI front for /api/webhooks/*.
+
+Verifies signatures, checks the IP allow-list, claims the event id in Redis and
+hands the raw body to a Celery worker; no ORM, sessions, auth or DRF on the
+request path. Django is only set up for settings and the shared helpers.
+"""
+import json
+import os
+import time
+from typing import Tuple
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+django.setup()
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse, PlainTextResponse  # noqa: E402
+from prometheus_client import make_asgi_app  # noqa: E402
+from starlette.concurrency import run_in_threadpool  # noqa: E402
+
+from channels.shopify import validate_hmac  # noqa: E402
+from channels.tasks import accept_webhook  # noqa: E402
+from channels.utils import ip_in_allowlist, magento_secret_ok, verify_meta_signature, webhook_event_id  # noqa: E402
+from core.constants import Channel  # noqa: E402
+from core.dedup import claim, release  # noqa: E402
+from core.metrics import WEBHOOK_ACK_LATENCY, WEBHOOK_REQUESTS  # noqa: E402
+
+app = FastAPI(title="Webhook Edge", version="0.1.0", docs_url=None, redoc_url=None)
+app.mount("/metrics", make_asgi_app())
+
+
+def accept(channel: str, body: bytes, headers, client_ip: str) -> Tuple[int, dict]:
+    """Verify, dedup and enqueue one webhook; returns (status code, response body)."""
+    if not ip_in_allowlist(client_ip):
+        return 403, {"detail": "ip_not_allowed"}
+    if channel == Channel.WHATSAPP:
+        signature = headers.get("X-Hub-Signature-256") or headers.get("X-Hub-Signature")
+        if not verify_meta_signature(body, signature):
+            return 401, {"detail": "invalid signature"}
+    elif channel == Channel.SHOPIFY:
+        if not validate_hmac(body, headers.get("X-Shopify-Hmac-Sha256")):
+            return 401, {"detail": "invalid hmac"}
+    elif channel == Channel.MAGENTO:
+        if not magento_secret_ok(headers.get("X-Magento-Signature")):
+            return 401, {"detail": "invalid signature"}
+
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return 400, {"detail": "invalid json"}
+    if not isinstance(payload, dict):
+        return 400, {"detail": "invalid json"}
+    event_id = headers.get("X-Shopify-Webhook-Id") if channel == Channel.SHOPIFY else None
+    event_id = event_id or webhook_event_id(payload, body)
+    if not claim(f"webhook:{channel}", event_id):
+        return 202, {"status": "duplicate_skipped"}
+    try:
+        accept_webhook.delay(channel, body.decode(), event_id, time.time())
+    except Exception:
+        release(f"webhook:{channel}", [event_id])
+        raise
+    return 202, {"status": "queued"}
+
+
+async def _handle(channel: str, request: Request) -> JSONResponse:
+    started = time.perf_counter()
+    body = await request.body()
+    client_ip = request.client.host if request.client else ""
+    # Redis and the broker client are blocking; keep them off the event loop.
+    status_code, content = await run_in_threadpool(accept, channel, body, request.headers, client_ip)
+    WEBHOOK_REQUESTS.labels(channel=channel, status=content.get("status") or str(status_code)).inc()
+    WEBHOOK_ACK_LATENCY.labels(channel=channel).observe(time.perf_counter() - started)
+    return JSONResponse(content, status_code=status_code)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/api/webhooks/whatsapp/")
+async def whatsapp_verify(request: Request):
+    """Verification endpoint for Meta webhook setup."""
+    params = request.query_params
+    verify_token = os.environ.get("WHATSAPP_VERIFY_TOKEN")
+    if params.get("hub.mode") == "subscribe" and verify_token and params.get("hub.verify_token") == verify_token:
+        return PlainTextResponse(params.get("hub.challenge") or "")
+    return JSONResponse({"detail": "verification failed"}, status_code=403)
+
+
+@app.post("/api/webhooks/whatsapp/")
+async def whatsapp_webhook(request: Request):
+    return await _handle(Channel.WHATSAPP, request)
+
+
+@app.post("/api/webhooks/shopify/")
+async def shopify_webhook(request: Request):
+    return await _handle(Channel.SHOPIFY, request)
+
+
+@app.post("/api/webhooks/magento/")
+async def magento_webhook(request: Request):
+    return await _handle(Channel.MAGENTO, request)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.environ.get("WEBHOOK_EDGE_PORT", "8002"))
+    uvicorn.run("webhook_edge.main:app", host="0.0.0.0", port=port)